@@ -0,0 +1,207 @@
+"""
+Command line entrypoint running the dataset analysis without the Streamlit app.
+
+Usage: python -m analysis [--splits train val] [--dataset-dir DIR] [--output-dir DIR]
+    [--cache-dir DIR] [--thumbnail-dir DIR] [--coco-dir DIR] [--workers N]
+    [--format {parquet,csv}] [--json-backend NAME] [--no-label-cache]
+    [--no-thumbnails] [--force] [--quiet]
+
+Only the splits that are outdated according to the manifest in the output directory,
+or whose COCO labels are missing from --coco-dir, are processed, unless --force is
+given.
+
+Exit status: 0 on success, 1 if the analysis failed, 2 if the arguments are invalid
+and 3 if the label file of a requested split does not exist.
+"""
+
+import argparse
+import sys
+import time
+import traceback
+from pathlib import Path
+
+from analysis.category_statistics import OUTPUT_FORMATS, load_table
+from analysis.coco_export import COCO_FILENAME
+from analysis.dataset_analyzer import DatasetAnalyzer
+from analysis.json_backends import (
+    IJSON_BACKENDS,
+    IN_MEMORY_BACKENDS,
+    is_backend_available,
+)
+from analysis.progress import ProgressReporter, StreamProgressReporter
+from config import (
+    CSV_DIR,
+    DATASET_SPLITS,
+    LABEL_CACHE_DIR,
+    NETWORK_MOUNT,
+    NUM_WORKERS,
+    THUMBNAIL_DIR,
+)
+
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+EXIT_USAGE = 2
+EXIT_MISSING_LABELS = 3
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    """
+    Parses the command line arguments
+
+    :param argv: The arguments, or None to use sys.argv
+    :type argv: list[str] | None
+    :return: The parsed arguments
+    :rtype: Namespace
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m analysis", description="Computes the BDD100K dataset statistics"
+    )
+    parser.add_argument(
+        "--splits",
+        nargs="+",
+        choices=list(DATASET_SPLITS),
+        default=list(DATASET_SPLITS),
+        help="Splits to analyze",
+    )
+    parser.add_argument(
+        "--dataset-dir",
+        default=NETWORK_MOUNT,
+        help="Directory the BDD100K dataset is mounted at",
+    )
+    parser.add_argument(
+        "--output-dir", default=CSV_DIR, help="Directory the statistics are saved to"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=LABEL_CACHE_DIR,
+        help="Directory holding the binary label caches",
+    )
+    parser.add_argument(
+        "--thumbnail-dir",
+        default=THUMBNAIL_DIR,
+        help="Directory holding the anomaly thumbnails",
+    )
+    parser.add_argument(
+        "--coco-dir",
+        help="Also write the COCO labels of every split to "
+        "COCO_DIR/<split>/_annotations.coco.json, in the same pass over the labels",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=NUM_WORKERS,
+        help="Number of processes used to parse each label file",
+    )
+    parser.add_argument(
+        "--format",
+        choices=OUTPUT_FORMATS,
+        default="parquet",
+        help="Format of the records and anomalies",
+    )
+    parser.add_argument(
+        "--json-backend",
+        choices=["auto"] + IN_MEMORY_BACKENDS + IJSON_BACKENDS,
+        default="auto",
+        help="JSON parser used to read the label files",
+    )
+    parser.add_argument(
+        "--no-label-cache",
+        action="store_true",
+        help="Parse the label files instead of reading the binary label cache",
+    )
+    parser.add_argument(
+        "--no-thumbnails",
+        action="store_true",
+        help="Do not render the thumbnails of the images with the most anomalies",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Process the splits even if their outputs are up to date",
+    )
+    parser.add_argument(
+        "--quiet", action="store_true", help="Do not report the progress"
+    )
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.json_backend != "auto" and not is_backend_available(args.json_backend):
+        parser.error(f"JSON backend {args.json_backend} is not installed")
+    return args
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Runs the analysis of the requested splits
+
+    :param argv: The arguments, or None to use sys.argv
+    :type argv: list[str] | None
+    :return: The exit status
+    :rtype: int
+    """
+    args = parse_args(argv)
+    dataset_analyzer = DatasetAnalyzer(
+        args.dataset_dir, args.output_dir, args.cache_dir, args.thumbnail_dir
+    )
+    progress = ProgressReporter() if args.quiet else StreamProgressReporter()
+
+    missing = [
+        split
+        for split in args.splits
+        if not dataset_analyzer.get_label_file(split).exists()
+    ]
+    if missing:
+        for split in missing:
+            print(
+                f"Label file not found: {dataset_analyzer.get_label_file(split)}",
+                file=sys.stderr,
+            )
+        return EXIT_MISSING_LABELS
+
+    for split in args.splits:
+        # The COCO labels are not part of the manifest, a split whose COCO labels are
+        # missing is processed again to write them
+        coco_missing = (
+            args.coco_dir is not None
+            and not (Path(args.coco_dir) / split / COCO_FILENAME).exists()
+        )
+        if (
+            not args.force
+            and not coco_missing
+            and dataset_analyzer.is_up_to_date(split, args.format)
+        ):
+            print(f"{split}: up to date, skipped", file=sys.stderr)
+            continue
+        start = time.perf_counter()
+        try:
+            json_backend = dataset_analyzer.compute_statistics(
+                split,
+                progress,
+                num_workers=args.workers,
+                json_backend=args.json_backend,
+                use_label_cache=not args.no_label_cache,
+                output_format=args.format,
+                coco_dir=args.coco_dir,
+            )
+            issues = len(load_table(f"issues_{split}.csv", args.output_dir))
+            thumbnails = (
+                0
+                if args.no_thumbnails
+                else dataset_analyzer.precompute_thumbnails(split, args.format)
+            )
+        # Any error fails the run with a traceback, for the logs of the batch job
+        except Exception:
+            traceback.print_exc()
+            print(f"{split}: analysis failed", file=sys.stderr)
+            return EXIT_FAILURE
+        print(
+            f"{split}: done in {time.perf_counter() - start:.1f} s"
+            f", labels read with {json_backend}, {issues} labels with invalid geometry"
+            f" reported in issues_{split}.csv, {thumbnails} anomaly thumbnails cached",
+            file=sys.stderr,
+        )
+    return EXIT_SUCCESS
+
+
+if __name__ == "__main__":
+    sys.exit(main())
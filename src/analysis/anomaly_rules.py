@@ -0,0 +1,626 @@
+"""
+File containing the anomaly rules, which flag bounding box labels as anomalies.
+
+A rule is a vectorized predicate over the columns of a batch of boxes, and every rule
+has its own anomaly type. Rule sets are declared as lists of dicts, e.g.
+
+    {"kind": "threshold", "anomaly_type": 0, "name": "Area Anomaly",
+     "column": "area", "low": 256, "high": 589824,
+     "category_limits": {"traffic light": [64, null]}}
+
+flags the boxes whose area is at most low or at least high, with other limits for
+traffic lights. DEFAULT_RULES is the rule set used by the analysis. OPTIONAL_RULES
+holds the out of frame, zero height and duplicate box rules, which are opted into with
+AnomalyRuleSet(DEFAULT_RULES + OPTIONAL_RULES). Other rule sets can be tried on the
+label cache of a split without parsing the label file:
+
+Usage: python -m analysis.anomaly_rules RULES_JSON [--splits train val]
+    [--dataset-dir DIR] [--cache-dir DIR]
+"""
+
+import argparse
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from analysis.box_batch import BoxBatch
+from analysis.label_cache import LabelCache
+from config import (
+    CATEGORIES,
+    DATASET_SPLITS,
+    IMAGE_HEIGHT,
+    IMAGE_WIDTH,
+    LABEL_CACHE_DIR,
+    NETWORK_MOUNT,
+)
+
+NUM_CATEGORIES = len(CATEGORIES)
+# Groups of more boxes than this are swept by the overlap rule instead of having every
+# pair of boxes compared
+DENSE_GROUP_SIZE = 64
+# Geometry issues of the boxes, counted as invalid geometry by the statistics
+VALID_GEOMETRY = 0
+NON_FINITE = 1
+INVERTED = 2
+ZERO_SIZE = 3
+GEOMETRY_ISSUES = {
+    NON_FINITE: "non-finite coordinates",
+    INVERTED: "inverted box",
+    ZERO_SIZE: "zero size",
+}
+DEFAULT_RULES = [
+    {
+        "kind": "threshold",
+        "anomaly_type": 0,
+        "name": "Area Anomaly",
+        "column": "area",
+        "low": 16**2,
+        "high": 1024 * 576,
+    },
+    {
+        "kind": "threshold",
+        "anomaly_type": 1,
+        "name": "Aspect Ratio Anomaly",
+        "column": "aspect_ratio",
+        "low": 0.1,
+        "high": 10,
+    },
+]
+# Geometry and duplicate box rules, not part of the defaults so that the anomalies match
+# the ones of the original analysis
+OPTIONAL_RULES = [
+    {"kind": "out_of_frame", "anomaly_type": 2, "name": "Out of Frame"},
+    {
+        "kind": "zero_size",
+        "anomaly_type": 3,
+        "name": "Zero Height",
+        "dimensions": ["height"],
+    },
+    {
+        "kind": "overlap",
+        "anomaly_type": 4,
+        "name": "Duplicate Box",
+        "iou_threshold": 0.9,
+    },
+]
+
+
+def get_box_columns(batch: BoxBatch) -> dict[str, np.ndarray]:
+    """
+    Returns the columns of a batch the rules are evaluated on
+
+    :param batch: The bounding box labels of a chunk of images
+    :type batch: BoxBatch
+    :return: The category, image index, coordinates, width, height, area, aspect
+        ratio and geometry issue of every box
+    :rtype: dict[str, np.ndarray]
+    """
+    geometry_issue = get_geometry_issues(batch.boxes)
+    finite = geometry_issue != NON_FINITE
+    # Inverted boxes are measured between their sorted corners, and boxes with
+    # non-finite coordinates get no size, so no statistic is turned into NaN
+    widths = np.where(finite, np.abs(batch.widths), 0.0)
+    heights = np.where(finite, np.abs(batch.heights), 0.0)
+    # The aspect ratio is only defined for boxes with a height
+    aspect_ratio = np.full(len(batch), np.nan)
+    np.divide(widths, heights, out=aspect_ratio, where=heights > 0)
+    return {
+        "category": batch.category.astype(np.intp),
+        "image_index": batch.image_index,
+        "x1": batch.boxes[:, 0],
+        "y1": batch.boxes[:, 1],
+        "x2": batch.boxes[:, 2],
+        "y2": batch.boxes[:, 3],
+        "width": widths,
+        "height": heights,
+        "area": heights * widths,
+        "aspect_ratio": aspect_ratio,
+        "geometry_issue": geometry_issue,
+    }
+
+
+def get_geometry_issues(boxes: np.ndarray) -> np.ndarray:
+    """
+    Classifies the geometry of every box. Every box gets the first issue of
+    GEOMETRY_ISSUES it has, a box with several issues is reported once.
+
+    :param boxes: N x 4 array of x1, y1, x2, y2 coordinates
+    :type boxes: np.ndarray
+    :return: The issue of every box, VALID_GEOMETRY for valid boxes
+    :rtype: np.ndarray
+    """
+    issue = np.full(len(boxes), VALID_GEOMETRY, dtype=np.int8)
+    with np.errstate(invalid="ignore"):
+        zero_size = (boxes[:, 2] == boxes[:, 0]) | (boxes[:, 3] == boxes[:, 1])
+        inverted = (boxes[:, 2] < boxes[:, 0]) | (boxes[:, 3] < boxes[:, 1])
+    issue[zero_size] = ZERO_SIZE
+    issue[inverted] = INVERTED
+    issue[~np.isfinite(boxes).all(axis=1)] = NON_FINITE
+    return issue
+
+
+class AnomalyRule:
+    """
+    Base class of the anomaly rules
+    """
+
+    def __init__(self, anomaly_type: int, name: str) -> None:
+        """
+        Initializes a rule
+
+        :param anomaly_type: The type of the anomalies flagged by the rule
+        :type anomaly_type: int
+        :param name: Readable name of the anomalies flagged by the rule
+        :type name: str
+        """
+        self.anomaly_type = anomaly_type
+        self.name = name
+
+    def evaluate(self, columns: dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Flags the anomalous boxes of a batch
+
+        :param columns: The columns of the batch, as returned by get_box_columns
+        :type columns: dict[str, np.ndarray]
+        :return: Mask of the anomalous boxes
+        :rtype: np.ndarray
+        """
+        raise NotImplementedError
+
+
+class ThresholdRule(AnomalyRule):
+    """
+    Flags the boxes whose value in a column is at most a low limit or at least a high
+    limit. The limits can be overridden per category.
+    """
+
+    def __init__(
+        self,
+        anomaly_type: int,
+        name: str,
+        column: str,
+        low: float | None = None,
+        high: float | None = None,
+        category_limits: dict[str, list] | None = None,
+    ) -> None:
+        """
+        Initializes the rule
+
+        :param anomaly_type: The type of the anomalies flagged by the rule
+        :type anomaly_type: int
+        :param name: Readable name of the anomalies flagged by the rule
+        :type name: str
+        :param column: The column compared to the limits, e.g. area or aspect_ratio
+        :type column: str
+        :param low: Values at most this are anomalous, None for no low limit
+        :type low: float | None
+        :param high: Values at least this are anomalous, None for no high limit
+        :type high: float | None
+        :param category_limits: Low and high limits of some categories, by name
+        :type category_limits: dict[str, list] | None
+        """
+        super().__init__(anomaly_type, name)
+        self.column = column
+        # Limits indexed by category id, so a batch is compared in one operation
+        self.low = np.full(NUM_CATEGORIES, -np.inf if low is None else low)
+        self.high = np.full(NUM_CATEGORIES, np.inf if high is None else high)
+        for category, (category_low, category_high) in (category_limits or {}).items():
+            self.low[CATEGORIES[category]] = (
+                -np.inf if category_low is None else category_low
+            )
+            self.high[CATEGORIES[category]] = (
+                np.inf if category_high is None else category_high
+            )
+
+    def evaluate(self, columns: dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Flags the boxes outside of the limits of their category
+
+        :param columns: The columns of the batch, as returned by get_box_columns
+        :type columns: dict[str, np.ndarray]
+        :return: Mask of the anomalous boxes
+        :rtype: np.ndarray
+        """
+        values = columns[self.column]
+        category = columns["category"]
+        return (values <= self.low[category]) | (values >= self.high[category])
+
+
+class OutOfFrameRule(AnomalyRule):
+    """
+    Flags the boxes extending past the borders of the image
+    """
+
+    def __init__(
+        self,
+        anomaly_type: int,
+        name: str,
+        image_width: float = IMAGE_WIDTH,
+        image_height: float = IMAGE_HEIGHT,
+        tolerance: float = 0.0,
+    ) -> None:
+        """
+        Initializes the rule
+
+        :param anomaly_type: The type of the anomalies flagged by the rule
+        :type anomaly_type: int
+        :param name: Readable name of the anomalies flagged by the rule
+        :type name: str
+        :param image_width: Width of the images in pixels
+        :type image_width: float
+        :param image_height: Height of the images in pixels
+        :type image_height: float
+        :param tolerance: Number of pixels a box may extend past the borders
+        :type tolerance: float
+        """
+        super().__init__(anomaly_type, name)
+        self.image_width = image_width
+        self.image_height = image_height
+        self.tolerance = tolerance
+
+    def evaluate(self, columns: dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Flags the boxes with a corner outside of the image
+
+        :param columns: The columns of the batch, as returned by get_box_columns
+        :type columns: dict[str, np.ndarray]
+        :return: Mask of the anomalous boxes
+        :rtype: np.ndarray
+        """
+        low = -self.tolerance
+        high_x = self.image_width + self.tolerance
+        high_y = self.image_height + self.tolerance
+        return (
+            (np.minimum(columns["x1"], columns["x2"]) < low)
+            | (np.minimum(columns["y1"], columns["y2"]) < low)
+            | (np.maximum(columns["x1"], columns["x2"]) > high_x)
+            | (np.maximum(columns["y1"], columns["y2"]) > high_y)
+        )
+
+
+class ZeroSizeRule(AnomalyRule):
+    """
+    Flags the boxes with a zero or negative extent along some dimensions
+    """
+
+    def __init__(
+        self, anomaly_type: int, name: str, dimensions: list[str] | None = None
+    ) -> None:
+        """
+        Initializes the rule
+
+        :param anomaly_type: The type of the anomalies flagged by the rule
+        :type anomaly_type: int
+        :param name: Readable name of the anomalies flagged by the rule
+        :type name: str
+        :param dimensions: The dimensions checked, width and/or height, both if None
+        :type dimensions: list[str] | None
+        """
+        super().__init__(anomaly_type, name)
+        self.dimensions = dimensions or ["width", "height"]
+
+    def evaluate(self, columns: dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Flags the boxes that are empty along one of the dimensions
+
+        :param columns: The columns of the batch, as returned by get_box_columns
+        :type columns: dict[str, np.ndarray]
+        :return: Mask of the anomalous boxes
+        :rtype: np.ndarray
+        """
+        return np.logical_or.reduce(
+            [columns[dimension] <= 0 for dimension in self.dimensions]
+        )
+
+
+class OverlapRule(AnomalyRule):
+    """
+    Flags the boxes overlapping an earlier box of the same image, and of the same
+    category unless any_category is set, with an IoU of at least a threshold. With the
+    default settings, it flags duplicate annotations.
+    """
+
+    def __init__(
+        self,
+        anomaly_type: int,
+        name: str,
+        iou_threshold: float = 0.9,
+        any_category: bool = False,
+    ) -> None:
+        """
+        Initializes the rule
+
+        :param anomaly_type: The type of the anomalies flagged by the rule
+        :type anomaly_type: int
+        :param name: Readable name of the anomalies flagged by the rule
+        :type name: str
+        :param iou_threshold: Minimum intersection over union of overlapping boxes
+        :type iou_threshold: float
+        :param any_category: Compare boxes of different categories too
+        :type any_category: bool
+        """
+        super().__init__(anomaly_type, name)
+        self.iou_threshold = iou_threshold
+        self.any_category = any_category
+
+    def evaluate(self, columns: dict[str, np.ndarray]) -> np.ndarray:
+        """
+        Pairs the boxes of the same group and flags the later box of the pairs
+        overlapping enough. The boxes of a small group are paired with each other,
+        the boxes of a dense group are swept along x and only paired with the boxes
+        they can overlap enough.
+
+        :param columns: The columns of the batch, as returned by get_box_columns
+        :type columns: dict[str, np.ndarray]
+        :return: Mask of the anomalous boxes
+        :rtype: np.ndarray
+        """
+        group = columns["image_index"].astype(np.int64)
+        if not self.any_category:
+            group = group * NUM_CATEGORIES + columns["category"]
+        x1 = np.minimum(columns["x1"], columns["x2"])
+        y1 = np.minimum(columns["y1"], columns["y2"])
+        x2 = np.maximum(columns["x1"], columns["x2"])
+        y2 = np.maximum(columns["y1"], columns["y2"])
+
+        order = np.argsort(group, kind="stable")
+        sorted_group = group[order]
+        group_start = np.searchsorted(sorted_group, sorted_group, side="left")
+        group_end = np.searchsorted(sorted_group, sorted_group, side="right")
+        dense = group_end - group_start > DENSE_GROUP_SIZE
+        # Every box of a small group is paired with the boxes following it
+        first, second = get_pairs(np.where(dense, 0, group_end))
+        first, second = order[first], order[second]
+        if dense.any():
+            dense_first, dense_second = self.sweep(order[dense], group, x1, x2)
+            first = np.concatenate((first, dense_first))
+            second = np.concatenate((second, dense_second))
+
+        width = np.minimum(x2[first], x2[second]) - np.maximum(x1[first], x1[second])
+        height = np.minimum(y2[first], y2[second]) - np.maximum(y1[first], y1[second])
+        intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+        area = (x2 - x1) * (y2 - y1)
+        union = area[first] + area[second] - intersection
+        with np.errstate(divide="ignore", invalid="ignore"):
+            overlapping = (intersection > 0) & (
+                intersection / union >= self.iou_threshold
+            )
+        mask = np.zeros(len(group), dtype=bool)
+        mask[np.maximum(first, second)[overlapping]] = True
+        return mask
+
+    def sweep(
+        self, rows: np.ndarray, group: np.ndarray, x1: np.ndarray, x2: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Pairs the boxes of dense groups by a sweep along x. The boxes are sorted by
+        their left edge, and a box can only reach the IoU threshold with a later box
+        whose left edge is at most x2 - iou_threshold * width, since their overlap
+        along x is at least iou_threshold times its width.
+
+        :param rows: The boxes of the dense groups
+        :type rows: np.ndarray
+        :param group: The group of every box of the batch
+        :type group: np.ndarray
+        :param x1: The left edge of every box of the batch
+        :type x1: np.ndarray
+        :param x2: The right edge of every box of the batch
+        :type x2: np.ndarray
+        :return: The first and second box of every pair
+        :rtype: tuple[np.ndarray, np.ndarray]
+        """
+        rows = rows[np.lexsort((x1[rows], group[rows]))]
+        left = x1[rows]
+        bound = x2[rows] - self.iou_threshold * (x2[rows] - left)
+        # The edges are replaced by their ranks, so the pair (group, edge) is an
+        # exact integer key that is sorted along the sweep
+        _, group_rank = np.unique(group[rows], return_inverse=True)
+        _, edge_rank = np.unique(np.concatenate((left, bound)), return_inverse=True)
+        scale = 2 * len(rows)
+        key = group_rank * scale + edge_rank[: len(rows)]
+        stop = np.searchsorted(
+            key, group_rank * scale + edge_rank[len(rows) :], side="right"
+        )
+        first, second = get_pairs(stop)
+        return rows[first], rows[second]
+
+
+def get_pairs(stop: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Pairs every position i with the positions i + 1 to stop[i] - 1
+
+    :param stop: The position after the last partner of every position
+    :type stop: np.ndarray
+    :return: The first and second position of every pair
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    partners = np.maximum(stop - np.arange(len(stop)) - 1, 0)
+    first = np.repeat(np.arange(len(stop)), partners)
+    second = (
+        first
+        + 1
+        + np.arange(len(first))
+        - np.repeat(np.cumsum(partners) - partners, partners)
+    )
+    return first, second
+
+
+# Rule class of every kind of rule in a rule set
+RULE_KINDS = {
+    "threshold": ThresholdRule,
+    "out_of_frame": OutOfFrameRule,
+    "zero_size": ZeroSizeRule,
+    "overlap": OverlapRule,
+}
+
+
+class AnomalyRuleSet:
+    """
+    A set of anomaly rules evaluated together on every batch
+    """
+
+    def __init__(self, rules: list[dict] | None = None) -> None:
+        """
+        Builds the rules of a rule set declaration
+
+        :param rules: One dict per rule, with its kind and the arguments of its class,
+            DEFAULT_RULES if None
+        :type rules: list[dict] | None
+        """
+        self.rules = []
+        for rule in DEFAULT_RULES if rules is None else rules:
+            arguments = dict(rule)
+            kind = arguments.pop("kind")
+            if kind not in RULE_KINDS:
+                raise ValueError(f"Unknown anomaly rule kind: {kind}")
+            self.rules.append(RULE_KINDS[kind](**arguments))
+
+    @classmethod
+    def load(cls, path: Path) -> "AnomalyRuleSet":
+        """
+        Reads a rule set declared in a JSON file
+
+        :param path: Path to a JSON file holding a list of rules
+        :type path: Path
+        :return: The rule set
+        :rtype: AnomalyRuleSet
+        """
+        return cls(json.loads(Path(path).read_text()))
+
+    def get_type_names(self) -> dict[int, str]:
+        """
+        Returns the readable name of every anomaly type of the rule set
+
+        :return: The names, by anomaly type
+        :rtype: dict[int, str]
+        """
+        return {rule.anomaly_type: rule.name for rule in self.rules}
+
+    def evaluate(self, columns: dict[str, np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluates every rule on a batch. A box flagged by several rules gets one
+        anomaly per rule. Boxes with non-finite coordinates are not flagged, they are
+        reported as invalid geometry instead.
+
+        :param columns: The columns of the batch, as returned by get_box_columns
+        :type columns: dict[str, np.ndarray]
+        :return: The rows of the anomalous boxes and the type of every anomaly, in
+            label order and in rule order for the same label
+        :rtype: tuple[np.ndarray, np.ndarray]
+        """
+        measurable = columns["geometry_issue"] != NON_FINITE
+        masks = [rule.evaluate(columns) & measurable for rule in self.rules]
+        rows = np.concatenate(
+            [np.flatnonzero(mask) for mask in masks] + [np.empty(0, dtype=np.intp)]
+        )
+        # Index of the rule of every anomaly
+        rank = np.repeat(
+            np.arange(len(self.rules)), [np.count_nonzero(mask) for mask in masks]
+        )
+        types = np.array([rule.anomaly_type for rule in self.rules], dtype=np.int8)
+        types = types[rank]
+        order = np.lexsort((rank, rows))
+        return rows[order], types[order]
+
+
+def count_anomalies(rule_set: AnomalyRuleSet, batches) -> pd.DataFrame:
+    """
+    Evaluates a rule set over batches of labels and counts the anomalies
+
+    :param rule_set: The rule set to evaluate
+    :type rule_set: AnomalyRuleSet
+    :param batches: Iterable of BoxBatch objects
+    :return: The number of anomalies per category and anomaly type
+    :rtype: DataFrame
+    """
+    type_names = rule_set.get_type_names()
+    counts = np.zeros((NUM_CATEGORIES, len(type_names)), dtype=np.int64)
+    for batch in batches:
+        if not len(batch):
+            continue
+        columns = get_box_columns(batch)
+        rows, types = rule_set.evaluate(columns)
+        for column, anomaly_type in enumerate(type_names):
+            counts[:, column] += np.bincount(
+                columns["category"][rows[types == anomaly_type]],
+                minlength=NUM_CATEGORIES,
+            )
+    return pd.DataFrame(
+        counts,
+        index=pd.Index(list(CATEGORIES), name="category"),
+        columns=list(type_names.values()),
+    )
+
+
+def count_split_anomalies(
+    rule_set: AnomalyRuleSet, split_name: str, label_file: Path, cache_dir: str
+) -> tuple[pd.DataFrame, float]:
+    """
+    Evaluates a rule set on the label cache of a split. This runs inside of a worker
+    process, one per split.
+
+    :param rule_set: The rule set to evaluate
+    :type rule_set: AnomalyRuleSet
+    :param split_name: Name of the dataset split, i.e. train or val
+    :type split_name: str
+    :param label_file: Path to the BDD label file of the split
+    :type label_file: Path
+    :param cache_dir: Directory holding the binary label caches
+    :type cache_dir: str
+    :return: The number of anomalies per category and anomaly type, and the time
+        taken in seconds
+    :rtype: tuple[DataFrame, float]
+    """
+    start = time.perf_counter()
+    label_cache = LabelCache(split_name, label_file, cache_dir)
+    counts = count_anomalies(rule_set, label_cache.iter_batches())
+    return counts, time.perf_counter() - start
+
+
+def main() -> None:
+    """
+    Evaluates a rule set on the label caches of the requested splits, in parallel,
+    and prints the number of anomalies per category and rule
+    """
+    # Imported here since the dataset analyzer imports the statistics using the rules
+    from analysis.dataset_analyzer import DatasetAnalyzer
+
+    parser = argparse.ArgumentParser(
+        prog="python -m analysis.anomaly_rules",
+        description="Evaluates an anomaly rule set on the label caches",
+    )
+    parser.add_argument("rules", type=Path, help="JSON file holding a list of rules")
+    parser.add_argument(
+        "--splits", nargs="+", choices=list(DATASET_SPLITS), default=["train"]
+    )
+    parser.add_argument("--dataset-dir", default=NETWORK_MOUNT)
+    parser.add_argument("--cache-dir", default=LABEL_CACHE_DIR)
+    args = parser.parse_args()
+
+    rule_set = AnomalyRuleSet.load(args.rules)
+    dataset_analyzer = DatasetAnalyzer(args.dataset_dir, cache_dir=args.cache_dir)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(len(args.splits), mp_context=context) as pool:
+        futures = [
+            pool.submit(
+                count_split_anomalies,
+                rule_set,
+                split,
+                dataset_analyzer.get_label_file(split),
+                args.cache_dir,
+            )
+            for split in args.splits
+        ]
+        for split, future in zip(args.splits, futures):
+            counts, seconds = future.result()
+            print(f"{split}: evaluated in {seconds:.2f} s")
+            print(counts.to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+File containing the renderer of the annotated anomaly thumbnails and their cache.
+
+A thumbnail is a downscaled image with the boxes of its anomalies drawn on it, saved as
+WebP. Thumbnails are content addressed: the key of a thumbnail is a hash of the image
+file, of the anomalies drawn and of the rendering settings, so a thumbnail is reused
+until one of them changes. The cache is bounded in size and evicts the least recently
+used thumbnails first. A cache can be shared by the threads rendering thumbnails ahead
+of time.
+"""
+
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from PIL import Image, ImageDraw
+
+from analysis.image_index import AnomalyIndex
+from analysis.image_loading import decode_image
+from config import NETWORK_MOUNT, THUMBNAIL_DIR
+
+# Bounding size of the thumbnails, in pixels
+THUMBNAIL_SIZE = (640, 360)
+WEBP_QUALITY = 80
+# Size above which the least recently used thumbnails are evicted
+THUMBNAIL_CACHE_BYTES = 256 * 2**20
+# Number of images rendered ahead of time for every anomaly type of a split
+TOP_IMAGES_PER_TYPE = 3
+# Outline color of every anomaly type: blue for area, red for aspect ratio, green for
+# out of frame, magenta for zero height and cyan for duplicates
+ANOMALY_COLORS = {
+    0: "#0000FF",
+    1: "#FF0000",
+    2: "#00C000",
+    3: "#FF00FF",
+    4: "#00FFFF",
+}
+DEFAULT_ANOMALY_COLOR = "#FFA500"
+# Width of the outlines on the full resolution image
+OUTLINE_WIDTH = 4
+# Bumped whenever the rendering changes, to invalidate the cached thumbnails
+RENDER_VERSION = 1
+
+
+def get_image_path(
+    split_name: str, image_name: str, network_mount: str = NETWORK_MOUNT
+) -> Path:
+    """
+    Returns the path to an image of the BDD100K dataset
+
+    :param split_name: The name of the split, i.e., train or val
+    :type split_name: str
+    :param image_name: The name of the image file
+    :type image_name: str
+    :param network_mount: Directory the BDD100K dataset is mounted at
+    :type network_mount: str
+    :return: The path to the image
+    :rtype: Path
+    """
+    return (
+        Path(network_mount)
+        / "bdd100k_images_100k"
+        / "bdd100k"
+        / "images"
+        / "100k"
+        / split_name
+        / image_name
+    )
+
+
+def get_thumbnail_key(image_path: Path, anomalies: pd.DataFrame) -> str:
+    """
+    Returns the content address of the thumbnail of an image. The image file is
+    identified by its size and modification time, so it is not read.
+
+    :param image_path: The path to the image
+    :type image_path: Path
+    :param anomalies: The anomalies drawn on the image
+    :type anomalies: pd.DataFrame
+    :return: The hex digest identifying the thumbnail
+    :rtype: str
+    """
+    stat = os.stat(image_path)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(
+        f"{RENDER_VERSION}:{THUMBNAIL_SIZE}:{WEBP_QUALITY}:{image_path.name}:"
+        f"{stat.st_size}:{stat.st_mtime_ns}".encode()
+    )
+    digest.update(
+        anomalies[["x1", "y1", "x2", "y2"]].to_numpy(np.float32).tobytes()
+        + anomalies["type"].to_numpy(np.int8).tobytes()
+    )
+    digest.update("\0".join(anomalies["category"].astype(str)).encode())
+    return digest.hexdigest()
+
+
+def render_thumbnail(image_path: Path, anomalies: pd.DataFrame) -> Image.Image:
+    """
+    Renders the thumbnail of an image with the boxes of its anomalies. The JPEG is
+    decoded at a reduced scale, and the boxes are drawn at the scale of the thumbnail.
+
+    :param image_path: The path to the image
+    :type image_path: Path
+    :param anomalies: The anomalies to draw, with their box coordinates in the image
+    :type anomalies: pd.DataFrame
+    :return: The annotated thumbnail
+    :rtype: Image
+    """
+    thumbnail, (full_width, _) = decode_image(image_path, THUMBNAIL_SIZE)
+    thumbnail.thumbnail(THUMBNAIL_SIZE)
+    scale = thumbnail.width / full_width
+
+    coords = anomalies[["x1", "y1", "x2", "y2"]].to_numpy(np.float64) * scale
+    # Pillow needs [x0, y0, x1, y1] where x0 < x1 and y0 < y1
+    shapes = np.column_stack(
+        (
+            np.minimum(coords[:, 0], coords[:, 2]),
+            np.minimum(coords[:, 1], coords[:, 3]),
+            np.maximum(coords[:, 0], coords[:, 2]),
+            np.maximum(coords[:, 1], coords[:, 3]),
+        )
+    )
+    valid = np.isfinite(shapes).all(axis=1)
+    width = max(1, round(OUTLINE_WIDTH * scale))
+    draw = ImageDraw.Draw(thumbnail)
+    for shape, anomaly_type, category in zip(
+        shapes[valid].tolist(),
+        anomalies["type"].to_numpy()[valid].tolist(),
+        anomalies["category"].astype(str).to_numpy()[valid].tolist(),
+    ):
+        color = ANOMALY_COLORS.get(anomaly_type, DEFAULT_ANOMALY_COLOR)
+        draw.rectangle(shape, outline=color, width=width)
+        draw.text((shape[0], shape[1] - 12), category, fill=color)
+    return thumbnail
+
+
+class ThumbnailCache:
+    """
+    A class storing the thumbnails on disk by their content address, and evicting the
+    least recently used ones once the cache exceeds its size limit
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = THUMBNAIL_DIR,
+        max_bytes: int = THUMBNAIL_CACHE_BYTES,
+    ) -> None:
+        """
+        Initializes the cache
+
+        :param cache_dir: Directory holding the thumbnails
+        :type cache_dir: str
+        :param max_bytes: Size limit of the cache in bytes
+        :type max_bytes: int
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        # Size of the cache, measured on the first write and kept up to date after
+        self.total_bytes = None
+        self.lock = threading.Lock()
+
+    def get_path(self, key: str) -> Path:
+        """
+        Returns where the thumbnail with a key is stored
+
+        :param key: The content address of the thumbnail
+        :type key: str
+        :return: The path of the thumbnail
+        :rtype: Path
+        """
+        return self.cache_dir / key[:2] / f"{key}.webp"
+
+    def get(self, key: str) -> Path | None:
+        """
+        Looks up a thumbnail and marks it as recently used
+
+        :param key: The content address of the thumbnail
+        :type key: str
+        :return: The path of the thumbnail, or None if it is not cached
+        :rtype: Path | None
+        """
+        path = self.get_path(key)
+        try:
+            # The modification time doubles as the time of last use
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key: str, thumbnail: Image.Image) -> Path:
+        """
+        Stores a thumbnail, then evicts thumbnails if the cache got too large
+
+        :param key: The content address of the thumbnail
+        :type key: str
+        :param thumbnail: The thumbnail
+        :type thumbnail: Image
+        :return: The path of the thumbnail
+        :rtype: Path
+        """
+        path = self.get_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Written under a name unique to the thread and moved in place, so readers
+        # never see a partial file
+        temporary_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        thumbnail.save(temporary_path, "WEBP", quality=WEBP_QUALITY)
+        size = temporary_path.stat().st_size
+        temporary_path.replace(path)
+        with self.lock:
+            if self.total_bytes is None:
+                self.evict()
+            else:
+                self.total_bytes += size
+                if self.total_bytes > self.max_bytes:
+                    self.evict()
+        return path
+
+    def evict(self) -> None:
+        """
+        Measures the cache and deletes the least recently used thumbnails until it fits
+        its size limit
+        """
+        entries = []
+        for path in self.cache_dir.glob("*/*.webp"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        self.total_bytes = total
+
+
+def get_thumbnail(
+    split_name: str,
+    image_name: str,
+    anomalies: pd.DataFrame,
+    cache: ThumbnailCache,
+    network_mount: str = NETWORK_MOUNT,
+) -> Path | None:
+    """
+    Returns the annotated thumbnail of an image, rendering it if it is not cached
+
+    :param split_name: The name of the split, i.e., train or val
+    :type split_name: str
+    :param image_name: The name of the image file
+    :type image_name: str
+    :param anomalies: The anomalies of the image
+    :type anomalies: pd.DataFrame
+    :param cache: The cache the thumbnail is looked up in and stored to
+    :type cache: ThumbnailCache
+    :param network_mount: Directory the BDD100K dataset is mounted at
+    :type network_mount: str
+    :return: The path of the thumbnail, or None if the image is not available
+    :rtype: Path | None
+    """
+    image_path = get_image_path(split_name, image_name, network_mount)
+    try:
+        key = get_thumbnail_key(image_path, anomalies)
+    except FileNotFoundError:
+        return None
+    path = cache.get(key)
+    if path is None:
+        path = cache.put(key, render_thumbnail(image_path, anomalies))
+    return path
+
+
+def precompute_thumbnails(
+    split_name: str,
+    anomalies: pd.DataFrame,
+    cache: ThumbnailCache,
+    network_mount: str = NETWORK_MOUNT,
+    top_n: int = TOP_IMAGES_PER_TYPE,
+) -> int:
+    """
+    Renders the thumbnails of the images with the most anomalies of every type, so the
+    anomaly page can serve them without decoding any image
+
+    :param split_name: The name of the split, i.e., train or val
+    :type split_name: str
+    :param anomalies: The anomalies of the split
+    :type anomalies: pd.DataFrame
+    :param cache: The cache the thumbnails are stored to
+    :type cache: ThumbnailCache
+    :param network_mount: Directory the BDD100K dataset is mounted at
+    :type network_mount: str
+    :param top_n: Number of images per anomaly type
+    :type top_n: int
+    :return: Number of thumbnails available in the cache, the images that are not
+        available are skipped
+    :rtype: int
+    """
+    anomaly_index = AnomalyIndex(anomalies)
+    image_names = {
+        image_name
+        for anomaly_type in anomaly_index.rankings
+        for image_name in anomaly_index.get_top_images(anomaly_type, top_n)
+    }
+    available = 0
+    for image_name in image_names:
+        if get_thumbnail(
+            split_name,
+            image_name,
+            anomaly_index.get(image_name),
+            cache,
+            network_mount,
+        ):
+            available += 1
+    return available
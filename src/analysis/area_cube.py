@@ -0,0 +1,336 @@
+"""
+File containing the AreaCube class, a pre-aggregation of the bounding box areas of a
+split over category x size group x occluded x truncated.
+
+Every cell of the cube holds the number of boxes, the sum, minimum and maximum of
+their areas and a quantile sketch of the areas. The sketch is a histogram over
+logarithmically spaced buckets (as in DDSketch): every quantile is estimated within
+SKETCH_RELATIVE_ACCURACY of the true value, and two sketches are merged by adding
+their histograms. Any combination of filters is answered by merging the selected cells,
+without going back to the per box records.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from config import CATEGORIES
+
+NUM_CATEGORIES = len(CATEGORIES)
+NUM_SIZE_GROUPS = 3
+# Relative accuracy of the quantiles estimated from the sketches
+SKETCH_RELATIVE_ACCURACY = 0.01
+SKETCH_GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+# Areas up to SKETCH_MIN_AREA share the first bucket, larger ones than the maximum
+# share the last bucket
+SKETCH_MIN_AREA = 1.0
+SKETCH_MAX_AREA = 1280.0 * 720.0 * 4
+NUM_BUCKETS = (
+    int(np.ceil(np.log(SKETCH_MAX_AREA / SKETCH_MIN_AREA) / np.log(SKETCH_GAMMA))) + 1
+)
+CUBE_SHAPE = (NUM_CATEGORIES, NUM_SIZE_GROUPS, 2, 2)
+
+
+def bucket_index(area: np.ndarray) -> np.ndarray:
+    """
+    Returns the sketch bucket of every area. Bucket i > 0 holds the areas in
+    (SKETCH_MIN_AREA * gamma^(i - 1), SKETCH_MIN_AREA * gamma^i].
+
+    :param area: The areas of the bounding boxes
+    :type area: np.ndarray
+    :return: The bucket of every area
+    :rtype: np.ndarray
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        index = np.ceil(np.log(area / SKETCH_MIN_AREA) / np.log(SKETCH_GAMMA))
+    return np.clip(np.nan_to_num(index, nan=0.0), 0, NUM_BUCKETS - 1).astype(np.intp)
+
+
+def bucket_value(index: np.ndarray) -> np.ndarray:
+    """
+    Returns the value representing every bucket, within the relative accuracy of
+    every area in the bucket
+
+    :param index: Bucket indices
+    :type index: np.ndarray
+    :return: The representative area of every bucket
+    :rtype: np.ndarray
+    """
+    value = SKETCH_MIN_AREA * 2 * SKETCH_GAMMA**index / (SKETCH_GAMMA + 1)
+    return np.where(index == 0, SKETCH_MIN_AREA, value)
+
+
+def get_cells(
+    category: np.ndarray,
+    size_group: np.ndarray,
+    occluded: np.ndarray,
+    truncated: np.ndarray,
+) -> np.ndarray:
+    """
+    Returns the flat index of the cube cell of every box
+
+    :param category: Category id of every box
+    :type category: np.ndarray
+    :param size_group: COCO size group of every box
+    :type size_group: np.ndarray
+    :param occluded: Occluded flag of every box
+    :type occluded: np.ndarray
+    :param truncated: Truncated flag of every box
+    :type truncated: np.ndarray
+    :return: The cell of every box
+    :rtype: np.ndarray
+    """
+    return np.ravel_multi_index(
+        (
+            category.astype(np.intp),
+            size_group.astype(np.intp),
+            occluded.astype(np.intp),
+            truncated.astype(np.intp),
+        ),
+        CUBE_SHAPE,
+    )
+
+
+class AreaSummary:
+    """
+    The merged statistics of a selection of cells of an AreaCube
+    """
+
+    def __init__(
+        self,
+        count: int,
+        occluded: int,
+        truncated: int,
+        area_sum: float,
+        area_min: float,
+        area_max: float,
+        histogram: np.ndarray,
+    ) -> None:
+        """
+        Initializes a summary
+
+        :param count: Number of boxes
+        :type count: int
+        :param occluded: Number of occluded boxes
+        :type occluded: int
+        :param truncated: Number of truncated boxes
+        :type truncated: int
+        :param area_sum: Sum of the areas
+        :type area_sum: float
+        :param area_min: Smallest area
+        :type area_min: float
+        :param area_max: Largest area
+        :type area_max: float
+        :param histogram: The merged sketch of the areas
+        :type histogram: np.ndarray
+        """
+        self.count = count
+        self.occluded = occluded
+        self.truncated = truncated
+        self.area_sum = area_sum
+        self.area_min = area_min
+        self.area_max = area_max
+        self.histogram = histogram
+
+    def quantiles(self, q: list[float]) -> np.ndarray:
+        """
+        Estimates quantiles of the areas, clipped to the smallest and largest area
+
+        :param q: Quantiles to estimate, between 0 and 1
+        :type q: list[float]
+        :return: The estimated quantiles, NaN if the summary is empty
+        :rtype: np.ndarray
+        """
+        q = np.asarray(q, dtype=np.float64)
+        if not self.count:
+            return np.full(q.shape, np.nan)
+        cumulative = np.cumsum(self.histogram)
+        index = np.searchsorted(cumulative, q * (self.count - 1), side="right")
+        return np.clip(bucket_value(index), self.area_min, self.area_max)
+
+    def box_stats(self) -> dict:
+        """
+        Returns the statistics of a boxplot of the areas: quartiles and whiskers at
+        1.5 times the interquartile range, clipped to the range of the areas
+
+        :return: A dict with the keys whislo, q1, med, q3, whishi and mean
+        :rtype: dict
+        """
+        q1, median, q3 = self.quantiles([0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        return {
+            "whislo": max(self.area_min, q1 - 1.5 * iqr),
+            "q1": q1,
+            "med": median,
+            "q3": q3,
+            "whishi": min(self.area_max, q3 + 1.5 * iqr),
+            "mean": self.area_sum / self.count if self.count else np.nan,
+        }
+
+
+class AreaCube:
+    """
+    A class aggregating the areas of the bounding boxes of a split per
+    category, size group, occluded flag and truncated flag
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes an empty cube
+        """
+        self.count = np.zeros(CUBE_SHAPE, dtype=np.int64)
+        self.area_sum = np.zeros(CUBE_SHAPE)
+        self.area_min = np.full(CUBE_SHAPE, np.inf)
+        self.area_max = np.full(CUBE_SHAPE, -np.inf)
+        self.histogram = np.zeros(CUBE_SHAPE + (NUM_BUCKETS,), dtype=np.int64)
+
+    def add(
+        self,
+        category: np.ndarray,
+        size_group: np.ndarray,
+        occluded: np.ndarray,
+        truncated: np.ndarray,
+        area: np.ndarray,
+    ) -> None:
+        """
+        Adds a batch of boxes to the cube
+
+        :param category: Category id of every box
+        :type category: np.ndarray
+        :param size_group: COCO size group of every box
+        :type size_group: np.ndarray
+        :param occluded: Occluded flag of every box
+        :type occluded: np.ndarray
+        :param truncated: Truncated flag of every box
+        :type truncated: np.ndarray
+        :param area: Area of every box
+        :type area: np.ndarray
+        """
+        if not len(area):
+            return
+        cell = get_cells(category, size_group, occluded, truncated)
+        num_cells = self.count.size
+        self.count += np.bincount(cell, minlength=num_cells).reshape(CUBE_SHAPE)
+        self.area_sum += np.bincount(cell, weights=area, minlength=num_cells).reshape(
+            CUBE_SHAPE
+        )
+        np.minimum.at(self.area_min.reshape(-1), cell, area)
+        np.maximum.at(self.area_max.reshape(-1), cell, area)
+        self.histogram += np.bincount(
+            cell * NUM_BUCKETS + bucket_index(area),
+            minlength=num_cells * NUM_BUCKETS,
+        ).reshape(self.histogram.shape)
+
+    def set_area_sum(
+        self,
+        category: np.ndarray,
+        size_group: np.ndarray,
+        occluded: np.ndarray,
+        truncated: np.ndarray,
+        area: np.ndarray,
+    ) -> None:
+        """
+        Recomputes the area sums from all the boxes of the cube at once. Float sums
+        depend on the order they are added in, so the sums accumulated by add and merge
+        differ slightly with the batches and shards; summed in label order, they do not.
+
+        :param category: Category id of every box of the cube, in label order
+        :type category: np.ndarray
+        :param size_group: COCO size group of every box
+        :type size_group: np.ndarray
+        :param occluded: Occluded flag of every box
+        :type occluded: np.ndarray
+        :param truncated: Truncated flag of every box
+        :type truncated: np.ndarray
+        :param area: Area of every box
+        :type area: np.ndarray
+        """
+        cell = get_cells(category, size_group, occluded, truncated)
+        self.area_sum = np.bincount(
+            cell, weights=area, minlength=self.count.size
+        ).reshape(CUBE_SHAPE)
+
+    def merge(self, other: "AreaCube") -> None:
+        """
+        Merges another cube into this one
+
+        :param other: The cube to merge
+        :type other: AreaCube
+        """
+        self.count += other.count
+        self.area_sum += other.area_sum
+        np.minimum(self.area_min, other.area_min, out=self.area_min)
+        np.maximum(self.area_max, other.area_max, out=self.area_max)
+        self.histogram += other.histogram
+
+    def summarize(
+        self,
+        categories: list[int] | None = None,
+        size_groups: list[int] | None = None,
+        occluded: bool | None = None,
+        truncated: bool | None = None,
+    ) -> AreaSummary:
+        """
+        Merges the cells matching a selection. None selects every value of a dimension.
+
+        :param categories: Category ids to keep
+        :type categories: list[int] | None
+        :param size_groups: Size groups to keep
+        :type size_groups: list[int] | None
+        :param occluded: Keep only the occluded (True) or non-occluded (False) boxes
+        :type occluded: bool | None
+        :param truncated: Keep only the truncated (True) or non-truncated (False) boxes
+        :type truncated: bool | None
+        :return: The merged statistics of the selected cells
+        :rtype: AreaSummary
+        """
+        occluded_values = np.array([0, 1] if occluded is None else [int(occluded)])
+        truncated_values = np.array([0, 1] if truncated is None else [int(truncated)])
+        selection = np.ix_(
+            np.arange(NUM_CATEGORIES) if categories is None else list(categories),
+            np.arange(NUM_SIZE_GROUPS) if size_groups is None else list(size_groups),
+            occluded_values,
+            truncated_values,
+        )
+        count = self.count[selection]
+        return AreaSummary(
+            int(count.sum()),
+            int(count[:, :, occluded_values == 1].sum()),
+            int(count[:, :, :, truncated_values == 1].sum()),
+            float(self.area_sum[selection].sum()),
+            float(self.area_min[selection].min(initial=np.inf)),
+            float(self.area_max[selection].max(initial=-np.inf)),
+            self.histogram[selection].reshape(-1, NUM_BUCKETS).sum(axis=0),
+        )
+
+    def save(self, path: Path) -> None:
+        """
+        Saves the cube as a compressed npz file
+
+        :param path: Destination of the file
+        :type path: Path
+        """
+        np.savez_compressed(
+            path,
+            count=self.count,
+            area_sum=self.area_sum,
+            area_min=self.area_min,
+            area_max=self.area_max,
+            histogram=self.histogram,
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "AreaCube":
+        """
+        Loads a cube saved with save
+
+        :param path: Path to the file
+        :type path: Path
+        :return: The cube
+        :rtype: AreaCube
+        """
+        cube = cls()
+        with np.load(path) as arrays:
+            for name in ("count", "area_sum", "area_min", "area_max", "histogram"):
+                setattr(cube, name, arrays[name])
+        return cube
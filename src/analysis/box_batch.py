@@ -0,0 +1,211 @@
+"""
+File containing the BoxBatch and BoxBatchBuilder classes, which collect the labels
+of a chunk of images into NumPy arrays so that statistics can be computed in bulk
+"""
+
+import numpy as np
+
+from config import CATEGORIES
+
+# Number of images collected before a batch is handed to the statistics classes
+IMAGES_PER_BATCH = 1024
+
+
+class BoxBatch:
+    """
+    Columnar view of the bounding box labels of a chunk of images
+    """
+
+    def __init__(
+        self,
+        image_names: list[str],
+        weather: list[str],
+        scene: list[str],
+        timeofday: list[str],
+        image_index: np.ndarray,
+        label_id: np.ndarray,
+        category: np.ndarray,
+        boxes: np.ndarray,
+        occluded: np.ndarray,
+        truncated: np.ndarray,
+        traffic_light_color: list[str],
+    ) -> None:
+        """
+        Initializes a batch from its columns
+
+        :param image_names: Name of every image in the batch
+        :type image_names: list[str]
+        :param weather: Weather attribute of every image in the batch
+        :type weather: list[str]
+        :param scene: Scene attribute of every image in the batch
+        :type scene: list[str]
+        :param timeofday: Time of day attribute of every image in the batch
+        :type timeofday: list[str]
+        :param image_index: Index into image_names of the image each box belongs to
+        :type image_index: np.ndarray
+        :param label_id: Id of every box within its image
+        :type label_id: np.ndarray
+        :param category: Category id of every box, as defined in config.CATEGORIES
+        :type category: np.ndarray
+        :param boxes: N x 4 array of x1, y1, x2, y2 coordinates
+        :type boxes: np.ndarray
+        :param occluded: Occluded flag of every box
+        :type occluded: np.ndarray
+        :param truncated: Truncated flag of every box
+        :type truncated: np.ndarray
+        :param traffic_light_color: Traffic light color attribute of every box
+        :type traffic_light_color: list[str]
+        """
+        self.image_names = image_names
+        self.weather = weather
+        self.scene = scene
+        self.timeofday = timeofday
+        self.image_index = image_index
+        self.label_id = label_id
+        self.category = category
+        self.boxes = boxes
+        self.occluded = occluded
+        self.truncated = truncated
+        self.traffic_light_color = traffic_light_color
+
+    def __len__(self) -> int:
+        """
+        Returns the number of boxes in the batch
+
+        :return: Number of boxes
+        :rtype: int
+        """
+        return len(self.category)
+
+    @property
+    def widths(self) -> np.ndarray:
+        """
+        Widths of the boxes
+
+        :return: x2 - x1 for every box
+        :rtype: np.ndarray
+        """
+        return self.boxes[:, 2] - self.boxes[:, 0]
+
+    @property
+    def heights(self) -> np.ndarray:
+        """
+        Heights of the boxes
+
+        :return: y2 - y1 for every box
+        :rtype: np.ndarray
+        """
+        return self.boxes[:, 3] - self.boxes[:, 1]
+
+
+class BoxBatchBuilder:
+    """
+    Accumulates parsed label objects until they are converted into a BoxBatch
+    """
+
+    def __init__(self) -> None:
+        """
+        Initializes an empty builder
+        """
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Discards all of the collected labels
+        """
+        self.image_names = []
+        self.weather = []
+        self.scene = []
+        self.timeofday = []
+        self.image_index = []
+        self.label_id = []
+        self.category = []
+        self.coordinates = []
+        self.occluded = []
+        self.truncated = []
+        self.traffic_light_color = []
+
+    @property
+    def image_count(self) -> int:
+        """
+        Number of images collected so far
+
+        :return: Number of images
+        :rtype: int
+        """
+        return len(self.image_names)
+
+    def add_object(self, object: dict) -> None:
+        """
+        Collects the attributes and the bounding box labels of one image
+
+        :param object: The label object of one image, as read from the JSON file
+        :type object: dict
+        """
+        image_index = len(self.image_names)
+        attributes = object["attributes"]
+        self.image_names.append(object["name"])
+        self.weather.append(attributes.get("weather", "undefined"))
+        self.scene.append(attributes.get("scene", "undefined"))
+        self.timeofday.append(attributes.get("timeofday", "undefined"))
+        for label in object["labels"]:
+            category = CATEGORIES.get(label["category"])
+            if category is None:
+                continue
+            # A label with a missing box or missing coordinates is kept with NaN
+            # coordinates, and reported as invalid geometry by the statistics
+            box = label.get("box2d") or {}
+            label_attributes = label.get("attributes") or {}
+            self.image_index.append(image_index)
+            self.label_id.append(label.get("id", -1))
+            self.category.append(category)
+            self.coordinates.extend(
+                box.get(coordinate) for coordinate in ("x1", "y1", "x2", "y2")
+            )
+            self.occluded.append(label_attributes.get("occluded", False))
+            self.truncated.append(label_attributes.get("truncated", False))
+            self.traffic_light_color.append(
+                label_attributes.get("trafficLightColor", "none")
+            )
+
+    def build(self) -> BoxBatch:
+        """
+        Converts the collected labels into a BoxBatch and resets the builder
+
+        :return: The labels collected since the last call
+        :rtype: BoxBatch
+        """
+        batch = BoxBatch(
+            self.image_names,
+            self.weather,
+            self.scene,
+            self.timeofday,
+            np.array(self.image_index, dtype=np.int64),
+            np.array(self.label_id, dtype=np.int64),
+            np.array(self.category, dtype=np.int8),
+            to_coordinates(self.coordinates).reshape(-1, 4),
+            np.array(self.occluded, dtype=bool),
+            np.array(self.truncated, dtype=bool),
+            self.traffic_light_color,
+        )
+        self.reset()
+        return batch
+
+
+def to_coordinates(values: list) -> np.ndarray:
+    """
+    Converts the collected box coordinates to floats. Missing coordinates and
+    coordinates that are not numbers become NaN.
+
+    :param values: The coordinates of the boxes, as read from the JSON file
+    :type values: list
+    :return: The coordinates as an array of floats
+    :rtype: np.ndarray
+    """
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.array(
+            [value if isinstance(value, (int, float)) else np.nan for value in values],
+            dtype=np.float64,
+        )
@@ -2,26 +2,83 @@
 File containing CategoryStatistics class
 """
 
-from collections import defaultdict
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from config import CSV_DIR, CATEGORIES
 from pathlib import Path
+from analysis.box_batch import BoxBatch
+from analysis.area_cube import AreaCube
+from analysis.manifest import AnalysisManifest
+from analysis.anomaly_rules import (
+    GEOMETRY_ISSUES,
+    NON_FINITE,
+    VALID_GEOMETRY,
+    AnomalyRuleSet,
+    get_box_columns,
+)
+
+NUM_CATEGORIES = len(CATEGORIES)
+CATEGORY_NAMES = {v: k for k, v in CATEGORIES.items()}
+SIZE_GROUP_NAMES = ["Small", "Medium", "Large"]
+# Compression codec of the parquet files holding the records and anomalies
+PARQUET_COMPRESSION = "zstd"
+# Formats the records and anomalies can be saved in
+OUTPUT_FORMATS = ["parquet", "csv"]
+ANOMALY_COLUMNS = [
+    "image_name",
+    "category",
+    "type",
+    "aspect_ratio",
+    "area",
+    "x1",
+    "y1",
+    "x2",
+    "y2",
+    "split",
+]
+ISSUE_COLUMNS = ["image_name", "label_id", "category", "issue", "x1", "y1", "x2", "y2"]
+
+
+def size_groups(area: np.ndarray) -> np.ndarray:
+    """
+    Categorizes bounding box areas as small (0), medium (1), or large (2) by COCO standards
+
+    :param area: The areas of the bounding boxes
+    :type area: np.ndarray
+    :return: The size group of every box
+    :rtype: np.ndarray
+    """
+    return np.where(area < 32**2, 0, np.where(area <= 96**2, 1, 2)).astype(np.int8)
 
 
 class CategoryStatistics:
     """
-    A class for computing statistics for the 10 different categories in our dataset
+    A class for computing statistics for the 10 different categories in our dataset.
+    Labels are added in batches, and every statistic is computed with array operations
+    over the whole batch.
     """
 
-    def __init__(self, split_name: str):
+    def __init__(
+        self,
+        split_name: str,
+        output_dir: str = CSV_DIR,
+        rule_set: AnomalyRuleSet | None = None,
+    ):
         """
         Initializes instances of the class for a particular split
 
         :param split_name: The name of the split, i.e., train or val
         :type split_name: str
+        :param output_dir: Directory the statistics are saved to
+        :type output_dir: str
+        :param rule_set: The rules flagging the anomalies, the default rules if None
+        :type rule_set: AnomalyRuleSet | None
         """
         self.split = split_name
-        self.stats = defaultdict(lambda: [0, 0, 0, 0, 0, float("inf"), 0, 0, 0, 0])
+        self.output_dir = Path(output_dir)
+        self.rule_set = AnomalyRuleSet() if rule_set is None else rule_set
         self.stats_columns = [
             "total_count",
             "occluded",
@@ -33,225 +90,507 @@ class CategoryStatistics:
             "small",
             "medium",
             "large",
+            "invalid_geometry",
+            "anomalous_boxes",
         ]
+        # Columns: total_count, occluded, truncated, anomalies, small, medium, large,
+        # invalid_geometry, anomalous_boxes
+        self.counts = np.zeros((NUM_CATEGORIES, 9), dtype=np.int64)
+        self.max_area = np.zeros(NUM_CATEGORIES)
+        self.min_area = np.full(NUM_CATEGORIES, np.inf)
+        # Index of the first label of every category, used to order the stats rows
+        self.first_seen = np.full(NUM_CATEGORIES, np.iinfo(np.int64).max)
+        self.label_count = 0
         self.anomalies = []
+        # Labels with invalid geometry, reported in the issues file of the split
+        self.issues = []
         self.records = {
-            "category": [],
-            "area": [],
-            "occluded": [],
-            "truncated": [],
-            "size_group": [],
+            "category": [np.empty(0, dtype=np.int8)],
+            "area": [np.empty(0)],
+            "occluded": [np.empty(0, dtype=bool)],
+            "truncated": [np.empty(0, dtype=bool)],
+            "size_group": [np.empty(0, dtype=np.int8)],
         }
+        self.area_cube = AreaCube()
 
-    def increment_category_total_count(self, category: str) -> None:
+    def add_batch(self, batch: BoxBatch) -> None:
         """
-        Increments the total count of the category by 1
+        Updates the counts, areas, size groups, anomalies and records with a batch of labels.
+        Boxes with non-finite coordinates are counted, but left out of the area
+        statistics and records. Every box with invalid geometry is reported as an
+        issue rather than stopping the analysis.
 
-        :param category: One of the 10 categories
-        :type category: str
+        :param batch: The bounding box labels of a chunk of images
+        :type batch: BoxBatch
         """
-        self.stats[category][0] += 1
+        if not len(batch):
+            return
+        columns = get_box_columns(batch)
+        category = columns["category"]
+        area = columns["area"]
+        geometry_issue = columns["geometry_issue"]
+        anomaly_rows, anomaly_types = self.rule_set.evaluate(columns)
 
-    def increment_category_occluded_count(self, category: str) -> None:
+        self.counts[:, 0] += np.bincount(category, minlength=NUM_CATEGORIES)
+        self.counts[:, 1] += np.bincount(
+            category[batch.occluded], minlength=NUM_CATEGORIES
+        )
+        self.counts[:, 2] += np.bincount(
+            category[batch.truncated], minlength=NUM_CATEGORIES
+        )
+        self.counts[:, 3] += np.bincount(
+            category[anomaly_rows], minlength=NUM_CATEGORIES
+        )
+        invalid = geometry_issue != VALID_GEOMETRY
+        self.counts[:, 7] += np.bincount(category[invalid], minlength=NUM_CATEGORIES)
+        # The anomalies have one count per rule hit, a box flagged by several rules is
+        # counted once in the anomalous boxes
+        self.counts[:, 8] += np.bincount(
+            category[np.unique(anomaly_rows)], minlength=NUM_CATEGORIES
+        )
+
+        # Index of the first label of every category
+        order = np.argsort(category, kind="stable")
+        sorted_category = category[order]
+        run_starts = np.flatnonzero(
+            np.r_[True, sorted_category[1:] != sorted_category[:-1]]
+        )
+        present = sorted_category[run_starts]
+        self.first_seen[present] = np.minimum(
+            self.first_seen[present], order[run_starts] + self.label_count
+        )
+        self.label_count += len(batch)
+
+        occluded = batch.occluded
+        truncated = batch.truncated
+        measurable = geometry_issue != NON_FINITE
+        if not measurable.all():
+            category = category[measurable]
+            area = area[measurable]
+            occluded = occluded[measurable]
+            truncated = truncated[measurable]
+        self.add_areas(category, area, occluded, truncated)
+        self.insert_anomalies(batch, columns, anomaly_rows, anomaly_types)
+        self.insert_issues(batch, geometry_issue, np.flatnonzero(invalid))
+
+    def add_areas(
+        self,
+        category: np.ndarray,
+        area: np.ndarray,
+        occluded: np.ndarray,
+        truncated: np.ndarray,
+    ) -> None:
+        """
+        Updates the size groups, the minimum and maximum areas, the records and the
+        area cube with the boxes of a batch that have an area
+
+        :param category: Category id of every box
+        :type category: np.ndarray
+        :param area: The area of every box
+        :type area: np.ndarray
+        :param occluded: Flag denoting whether each box is occluded
+        :type occluded: np.ndarray
+        :param truncated: Flag denoting whether each box is truncated
+        :type truncated: np.ndarray
         """
-        Increments the occluded count of the category by 1
+        if not len(area):
+            return
+        size_group = size_groups(area)
+        self.counts[:, 4:7] += np.bincount(
+            category * 3 + size_group, minlength=NUM_CATEGORIES * 3
+        ).reshape(NUM_CATEGORIES, 3)
+
+        # Per category min and max over contiguous runs of the sorted categories
+        order = np.argsort(category, kind="stable")
+        sorted_category = category[order]
+        run_starts = np.flatnonzero(
+            np.r_[True, sorted_category[1:] != sorted_category[:-1]]
+        )
+        present = sorted_category[run_starts]
+        self.max_area[present] = np.maximum(
+            self.max_area[present], np.maximum.reduceat(area[order], run_starts)
+        )
+        self.min_area[present] = np.minimum(
+            self.min_area[present], np.minimum.reduceat(area[order], run_starts)
+        )
+
+        self.insert_records(category, area, occluded, truncated, size_group)
+        self.area_cube.add(category, size_group, occluded, truncated, area)
 
-        :param category: One of the 10 categories
-        :type category: str
+    def insert_records(
+        self,
+        category: np.ndarray,
+        area: np.ndarray,
+        occluded: np.ndarray,
+        truncated: np.ndarray,
+        size_group: np.ndarray,
+    ) -> None:
         """
-        self.stats[category][1] += 1
+        Appends one row per label to the records
 
-    def increment_category_truncated_count(self, category: str) -> None:
+        :param category: Category id of every label
+        :type category: np.ndarray
+        :param area: The area of the bounding box of every label
+        :type area: np.ndarray
+        :param occluded: Flag denoting whether each label is occluded
+        :type occluded: np.ndarray
+        :param truncated: Flag denoting whether each label is truncated
+        :type truncated: np.ndarray
+        :param size_group: COCO size group of every label
+        :type size_group: np.ndarray
         """
-        Increments the truncated count of the category by 1
+        self.records["category"].append(category.astype(np.int8))
+        self.records["area"].append(area)
+        self.records["occluded"].append(occluded)
+        self.records["truncated"].append(truncated)
+        self.records["size_group"].append(size_group)
 
-        :param category: One of the 10 categories
-        :type category: str
+    def insert_anomalies(
+        self,
+        batch: BoxBatch,
+        columns: dict[str, np.ndarray],
+        rows: np.ndarray,
+        types: np.ndarray,
+    ) -> None:
         """
-        self.stats[category][2] += 1
+        Saves the labels flagged by the anomaly rules, with one row per anomaly
 
-    def add_category_total_area(self, category: str, area: float) -> None:
+        :param batch: The batch the anomaly rules were evaluated on
+        :type batch: BoxBatch
+        :param columns: The columns of the batch, as returned by get_box_columns
+        :type columns: dict[str, np.ndarray]
+        :param rows: The label of every anomaly, in label order
+        :type rows: np.ndarray
+        :param types: The type of every anomaly
+        :type types: np.ndarray
         """
-        Updates the total area of the category. Useless stat, actually.
+        if not len(rows):
+            return
+        image_names = np.array(batch.image_names, dtype=object)
+        self.anomalies.append(
+            pd.DataFrame(
+                {
+                    "image_name": image_names[batch.image_index[rows]],
+                    "category": batch.category[rows],
+                    "type": types,
+                    "aspect_ratio": columns["aspect_ratio"][rows],
+                    "area": columns["area"][rows],
+                    "x1": batch.boxes[rows, 0],
+                    "y1": batch.boxes[rows, 1],
+                    "x2": batch.boxes[rows, 2],
+                    "y2": batch.boxes[rows, 3],
+                    "split": self.split,
+                },
+                columns=ANOMALY_COLUMNS,
+            )
+        )
 
-        :param self: Description
-        :param category: One of the 10 categories
-        :type category: str
-        :param area: Area of the bounding box of the argument label
-        :type area: float
+    def insert_issues(
+        self, batch: BoxBatch, geometry_issue: np.ndarray, rows: np.ndarray
+    ) -> None:
         """
-        self.stats[category][3] += area
+        Saves the labels with invalid geometry, with one row per label
 
-    def update_category_max_area(self, category: str, area: float) -> None:
+        :param batch: The batch the labels belong to
+        :type batch: BoxBatch
+        :param geometry_issue: The geometry issue of every label
+        :type geometry_issue: np.ndarray
+        :param rows: The labels with invalid geometry, in label order
+        :type rows: np.ndarray
         """
-        Updates the record for the max area of the category
+        if not len(rows):
+            return
+        image_names = np.array(batch.image_names, dtype=object)
+        self.issues.append(
+            pd.DataFrame(
+                {
+                    "image_name": image_names[batch.image_index[rows]],
+                    "label_id": batch.label_id[rows],
+                    "category": [CATEGORY_NAMES[i] for i in batch.category[rows]],
+                    "issue": [GEOMETRY_ISSUES[i] for i in geometry_issue[rows]],
+                    "x1": batch.boxes[rows, 0],
+                    "y1": batch.boxes[rows, 1],
+                    "x2": batch.boxes[rows, 2],
+                    "y2": batch.boxes[rows, 3],
+                },
+                columns=ISSUE_COLUMNS,
+            )
+        )
 
-        :param category: One of the 10 categories
-        :type category: str
-        :param area: The area of the bounding box of the argument label
-        :type area: float
+    def merge(self, other: "CategoryStatistics") -> None:
         """
-        self.stats[category][4] = max(self.stats[category][4], area)
+        Merges the statistics computed over the next part of the split into this instance
 
-    def update_category_min_area(self, category: str, area: float) -> None:
+        :param other: Statistics computed over the labels following this instance's
+        :type other: CategoryStatistics
         """
-        Updates the record for the min area of the category
+        self.counts += other.counts
+        np.maximum(self.max_area, other.max_area, out=self.max_area)
+        np.minimum(self.min_area, other.min_area, out=self.min_area)
+        seen = other.first_seen < np.iinfo(np.int64).max
+        self.first_seen[seen] = np.minimum(
+            self.first_seen[seen], other.first_seen[seen] + self.label_count
+        )
+        self.label_count += other.label_count
+        self.anomalies.extend(other.anomalies)
+        self.issues.extend(other.issues)
+        self.area_cube.merge(other.area_cube)
+        for column, values in other.records.items():
+            self.records[column].extend(values)
 
-        :param category: One of the 10 categories
-        :type category: str
-        :param area: The area of the bounding box of the argument label
-        :type area: float
+    def get_records_table(self) -> pa.Table:
         """
-        self.stats[category][5] = min(self.stats[category][5], area)
+        Returns the records as a table with one row per label. The category and size
+        group are dictionary encoded with int8 indices equal to their ids, so they are
+        read back as categorical columns.
 
-    def update_category_anomaly_count(
-        self,
-        category: str,
-        area: float,
-        aspect_ratio: float,
-        image_name: str,
-        x1: float,
-        x2: float,
-        y1: float,
-        y2: float,
-    ) -> None:
+        :return: The category, area, flags and size group of every label
+        :rtype: Table
         """
-        Checks if the label is an anomaly and updates the anomaly count.
-        Also saves the anomaly as a record.
-
-        :param category: One of the 10 categories
-        :type category: str
-        :param area: The area of the bounding box of the argument label
-        :type area: float
-        :param aspect_ratio: The aspect_ratio of the bounding box of the argument label
-        :type aspect_ratio: float
-        :param image_name: The name of the image where the anomaly was found
-        :type image_name: str
-        :param x1: The x-coordinate of the lower left point of the bounding box of the argument label
-        :type aspect_ratio: float
-        :param y1: The y-coordinate of the lower left point of the bounding box of the argument label
-        :type aspect_ratio: float
-        :param x2: The x-coordinate of the upper right point of the bounding box of the argument label
-        :type aspect_ratio: float
-        :param y2: The y-coordinate of the upper right point of the bounding box of the argument label
-        :type aspect_ratio: float
-        """
-        if area <= 16**2 or area >= (1024 * 576):
-            self.stats[category][6] += 1
-            self.anomalies.append(
-                (
-                    image_name,
-                    category,
-                    0,
-                    aspect_ratio,
-                    area,
-                    x1,
-                    y1,
-                    x2,
-                    y2,
-                    self.split,
-                )
-            )
-        if aspect_ratio <= 0.1 or aspect_ratio >= 10:
-            self.stats[category][6] += 1
-            self.anomalies.append(
-                (
-                    image_name,
-                    category,
-                    1,
-                    aspect_ratio,
-                    area,
-                    x1,
-                    y1,
-                    x2,
-                    y2,
-                    self.split,
-                )
-            )
+        records = {
+            column: np.concatenate(values) for column, values in self.records.items()
+        }
+        return pa.table(
+            {
+                "category": category_array(records["category"]),
+                "area": records["area"].astype(np.float32),
+                "occluded": records["occluded"],
+                "truncated": records["truncated"],
+                "size_group": pa.DictionaryArray.from_arrays(
+                    records["size_group"], SIZE_GROUP_NAMES
+                ),
+            }
+        )
 
-    def categorize_area(self, category: str, area: float) -> None:
+    def get_anomalies_table(self) -> pa.Table:
         """
-        Categorizes a bounding box area as small, medium, or large by COCO standards
+        Returns the anomalies as a table with one row per anomaly, with dictionary
+        encoded image names, categories and split, and single precision numbers
 
-        :param category: One of the 10 categories
-        :type category: str
-        :param area: The area of the bounding box of the category
-        :type area: float
+        :return: The anomalies of the split, in label order
+        :rtype: Table
         """
-        if area < 32**2:
-            self.stats[category][7] += 1
-        elif area >= 32**2 and area <= 96**2:
-            self.stats[category][8] += 1
+        if self.anomalies:
+            df = pd.concat(self.anomalies, ignore_index=True)
         else:
-            self.stats[category][9] += 1
+            df = pd.DataFrame(columns=ANOMALY_COLUMNS)
+        columns = {
+            "image_name": pa.array(df["image_name"], pa.string()).dictionary_encode(),
+            "category": category_array(df["category"].to_numpy(np.int8)),
+            "type": df["type"].to_numpy(np.int8),
+        }
+        for column in ("aspect_ratio", "area", "x1", "y1", "x2", "y2"):
+            columns[column] = df[column].to_numpy(np.float32)
+        columns["split"] = pa.DictionaryArray.from_arrays(
+            np.zeros(len(df), dtype=np.int8), [self.split]
+        )
+        return pa.table(columns)
 
-    def insert_record(
-        self, category: str, area: float, occluded: bool, truncated: bool
-    ) -> None:
+    def get_stats_df(self) -> pd.DataFrame:
         """
-        Create and insert a row into the record dict
+        Returns the per category statistics, ordered by first appearance in the split.
+        The total area is summed over the records, so it does not depend on how the
+        labels were batched.
 
-        :param self: Description
-        :param category: One of the 10 categories
-        :type category: str
-        :param area: The area of the bounding box of the category
-        :type area: float
-        :param occluded: Flag denoting whether the label is occluded
-        :type occluded: bool
-        :param truncated: Flag denoting whether the label is truncated
-        :type truncated: bool
+        :return: A dataframe with one row per category
+        :rtype: DataFrame
         """
-        self.records["category"].append(CATEGORIES[category])
-        self.records["area"].append(area)
-        self.records["occluded"].append(occluded)
-        self.records["truncated"].append(truncated)
-        if area < 32**2:
-            size_group = 0
-        elif area >= 32**2 and area <= 96**2:
-            size_group = 1
-        else:
-            size_group = 2
-        self.records["size_group"].append(size_group)
+        category = np.concatenate(self.records["category"]).astype(np.intp)
+        total_area = np.bincount(
+            category,
+            weights=np.concatenate(self.records["area"]),
+            minlength=NUM_CATEGORIES,
+        )
+        seen = np.flatnonzero(self.counts[:, 0])
+        seen = seen[np.argsort(self.first_seen[seen], kind="stable")]
+        # Categories whose boxes all have non-finite coordinates have no area range
+        measured = self.counts[seen, 4:7].sum(axis=1) > 0
+        return pd.DataFrame(
+            {
+                "class": [CATEGORY_NAMES[i] for i in seen],
+                "total_count": self.counts[seen, 0],
+                "occluded": self.counts[seen, 1],
+                "truncated": self.counts[seen, 2],
+                "total_area": total_area[seen],
+                "max_area": np.where(measured, self.max_area[seen], np.nan),
+                "min_area": np.where(measured, self.min_area[seen], np.nan),
+                "anomalies": self.counts[seen, 3],
+                "small": self.counts[seen, 4],
+                "medium": self.counts[seen, 5],
+                "large": self.counts[seen, 6],
+                "invalid_geometry": self.counts[seen, 7],
+                "anomalous_boxes": self.counts[seen, 8],
+            }
+        )
 
     def save_stats_csv(self) -> None:
         """
         Saves the stats dict as a csv file
         """
-        stats_df = pd.DataFrame.from_dict(
-            self.stats, orient="index", columns=self.stats_columns
-        ).reset_index(names="class")
-        output_dir = Path(CSV_DIR)
+        stats_df = self.get_stats_df()
+        output_dir = self.output_dir
         output_dir.mkdir(parents=True, exist_ok=True)
         output_path = output_dir / f"category_stats_{self.split}.csv"
         stats_df.to_csv(output_path, index=False)
 
-    def save_records_csv(self) -> None:
+    def get_issues_df(self) -> pd.DataFrame:
         """
-        Saves the records dict as a csv file
+        Returns the report of the labels with invalid geometry
+
+        :return: A dataframe with one row per label with invalid geometry, in label order
+        :rtype: DataFrame
         """
-        records_df = pd.DataFrame(self.records)
-        output_dir = Path(CSV_DIR)
-        output_dir.mkdir(parents=True, exist_ok=True)
-        output_path = output_dir / f"records_{self.split}.csv"
-        records_df.to_csv(output_path, index=False)
-
-    def save_anomalies(self) -> None:
-        """
-        Saves the anomalies as a csv
-        """
-        df = pd.DataFrame(
-            self.anomalies,
-            columns=[
-                "image_name",
-                "category",
-                "type",
-                "aspect_ratio",
-                "area",
-                "x1",
-                "y1",
-                "x2",
-                "y2",
-                "split",
-            ],
+        if not self.issues:
+            return pd.DataFrame(columns=ISSUE_COLUMNS)
+        return pd.concat(self.issues, ignore_index=True)
+
+    def save_issues_csv(self) -> None:
+        """
+        Saves the report of the labels with invalid geometry as a csv file, written
+        even if it is empty so every run replaces the report of the previous one
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.get_issues_df().to_csv(
+            self.output_dir / f"issues_{self.split}.csv", index=False
+        )
+
+    def save_records(self, output_format: str = "parquet") -> None:
+        """
+        Saves the records as a compressed parquet file, or as a csv file holding the ids
+        of the categories and size groups, as the records always did
+
+        :param output_format: One of OUTPUT_FORMATS
+        :type output_format: str
+        """
+        table = self.get_records_table()
+        if output_format == "csv":
+            table = pa.table(
+                {
+                    name: column.combine_chunks().indices
+                    if pa.types.is_dictionary(column.type)
+                    else column
+                    for name, column in zip(table.column_names, table.columns)
+                }
+            )
+        save_table(table, self.output_dir / f"records_{self.split}", output_format)
+
+    def save_anomalies(self, output_format: str = "parquet") -> None:
+        """
+        Saves the anomalies as a compressed parquet file, or as a csv file
+
+        :param output_format: One of OUTPUT_FORMATS
+        :type output_format: str
+        """
+        save_table(
+            self.get_anomalies_table(),
+            self.output_dir / f"anomalies_{self.split}",
+            output_format,
+        )
+
+    def save_area_cube(self) -> None:
+        """
+        Saves the cube of the box areas as a compressed npz file. Like the total area of
+        the stats, its area sums are summed over the records, so they do not depend on
+        how the labels were batched or sharded.
+        """
+        self.area_cube.set_area_sum(
+            *(
+                np.concatenate(self.records[column])
+                for column in (
+                    "category",
+                    "size_group",
+                    "occluded",
+                    "truncated",
+                    "area",
+                )
+            )
         )
-        df.to_csv(Path(CSV_DIR) / f"anomalies_{self.split}.csv", index=False)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.area_cube.save(self.output_dir / f"area_cube_{self.split}.npz")
+
+
+def category_array(category: np.ndarray) -> pa.DictionaryArray:
+    """
+    Dictionary encodes category ids with the category names as dictionary
+
+    :param category: Category id of every label
+    :type category: np.ndarray
+    :return: An array of int8 indices into the category names
+    :rtype: DictionaryArray
+    """
+    return pa.DictionaryArray.from_arrays(
+        category.astype(np.int8), [CATEGORY_NAMES[i] for i in range(NUM_CATEGORIES)]
+    )
+
+
+def save_table(table: pa.Table, path: Path, output_format: str = "parquet") -> None:
+    """
+    Writes a table to a compressed parquet file, or to a csv file with the values of
+    its dictionary encoded columns
+
+    :param table: The table to write
+    :type table: Table
+    :param path: Destination of the file, without the extension
+    :type path: Path
+    :param output_format: One of OUTPUT_FORMATS
+    :type output_format: str
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if output_format == "parquet":
+        pq.write_table(
+            table, path.with_suffix(".parquet"), compression=PARQUET_COMPRESSION
+        )
+    else:
+        table.to_pandas().to_csv(path.with_suffix(".csv"), index=False)
+
+
+def find_table(name: str, split_name: str, output_dir: str = CSV_DIR) -> str:
+    """
+    Finds the file of a table written by save_table, in whichever format it was saved.
+    The format recorded in the manifest for the split wins, otherwise the most recently
+    written file.
+
+    :param name: Name of the table, e.g. anomalies or records
+    :type name: str
+    :param split_name: The name of the split, i.e., train or val
+    :type split_name: str
+    :param output_dir: Directory the statistics were saved to
+    :type output_dir: str
+    :return: Name of the file within the output directory
+    :rtype: str
+    """
+    output_dir = Path(output_dir)
+    paths = [
+        output_dir / f"{name}_{split_name}.{output_format}"
+        for output_format in OUTPUT_FORMATS
+    ]
+    paths = [path for path in paths if path.exists()]
+    if not paths:
+        raise FileNotFoundError(
+            f"No {name} table of the {split_name} split in {output_dir}"
+        )
+    entry = AnalysisManifest(output_dir).splits.get(split_name) or {}
+    for path in paths:
+        if path.suffix == f".{entry.get('output_format')}":
+            return path.name
+    return max(paths, key=lambda path: path.stat().st_mtime_ns).name
+
+
+def load_table(filename: str, output_dir: str = CSV_DIR) -> pd.DataFrame:
+    """
+    Reads a file written by save_table into a dataframe. Dictionary encoded columns of
+    parquet files become categorical columns.
+
+    :param filename: Name of the file within the output directory
+    :type filename: str
+    :param output_dir: Directory the statistics were saved to
+    :type output_dir: str
+    :return: The contents of the file
+    :rtype: DataFrame
+    """
+    path = Path(output_dir) / filename
+    if path.suffix == ".csv":
+        return pd.read_csv(path)
+    return pq.read_table(path, memory_map=True).to_pandas()
@@ -0,0 +1,120 @@
+"""
+File containing the CocoAnnotations class, the annotations of a COCO detection file
+held in flat NumPy arrays.
+
+A COCO file read with json.load holds one dict per image and per annotation, about a
+kilobyte per annotation, and every read of such an object writes to its reference
+count. Once the loader of a dataset forks its workers, those writes copy the pages of
+every object touched into every worker. Here the boxes and the labels of all the
+annotations are stored in two arrays, grouped by image, and the annotations of the
+i-th image are the rows offsets[i]:offsets[i + 1]. A handful of arrays have no per
+annotation objects, so their pages stay shared with the workers, and the annotations
+of an image are read with two slices.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+class CocoAnnotations:
+    """
+    A class holding the images of a COCO detection file and their annotations in flat
+    arrays
+    """
+
+    def __init__(self, coco_file: Path) -> None:
+        """
+        Reads a COCO file. The annotations of every image keep their file order.
+
+        :param coco_file: Path to the COCO detection file
+        :type coco_file: Path
+        """
+        with open(coco_file) as f:
+            coco = json.load(f)
+        images = coco.pop("images")
+        annotations = coco.pop("annotations")
+
+        self.file_names = np.array([image["file_name"] for image in images], dtype=str)
+        self.image_ids = np.array([image["id"] for image in images], dtype=np.int64)
+        # Width and height of every image
+        self.sizes = np.array(
+            [(image["width"], image["height"]) for image in images], dtype=np.int32
+        ).reshape(-1, 2)
+
+        # Position of the image of every annotation, through a lookup in the sorted
+        # image ids since the ids need not be contiguous
+        id_order = np.argsort(self.image_ids, kind="stable")
+        positions = id_order[
+            np.searchsorted(
+                self.image_ids[id_order],
+                np.array([a["image_id"] for a in annotations], dtype=np.int64),
+            )
+        ]
+        order = np.argsort(positions, kind="stable")
+        bboxes = np.array([a["bbox"] for a in annotations], dtype=np.float64).reshape(
+            -1, 4
+        )[order]
+        # Stored as x1, y1, x2, y2, the corners the detector is trained on
+        self.boxes = np.column_stack(
+            (
+                bboxes[:, 0],
+                bboxes[:, 1],
+                bboxes[:, 0] + bboxes[:, 2],
+                bboxes[:, 1] + bboxes[:, 3],
+            )
+        ).astype(np.float32)
+        self.labels = np.array([a["category_id"] for a in annotations], dtype=np.int8)[
+            order
+        ]
+        self.offsets = np.searchsorted(
+            positions[order], np.arange(len(images) + 1)
+        ).astype(np.int64)
+
+    def __len__(self) -> int:
+        """
+        Returns the number of images
+
+        :return: The number of images
+        :rtype: int
+        """
+        return len(self.file_names)
+
+    def get_target(
+        self, idx: int, scale_x: float = 1.0, scale_y: float = 1.0
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the annotations of an image, with their boxes scaled
+
+        :param idx: Position of the image in the COCO file
+        :type idx: int
+        :param scale_x: Factor the x coordinates are multiplied by
+        :type scale_x: float
+        :param scale_y: Factor the y coordinates are multiplied by
+        :type scale_y: float
+        :return: The N x 4 float32 x1, y1, x2, y2 boxes and the N int8 category ids
+        :rtype: tuple[np.ndarray, np.ndarray]
+        """
+        start, stop = self.offsets[idx : idx + 2]
+        scale = np.array([scale_x, scale_y, scale_x, scale_y], dtype=np.float32)
+        return self.boxes[start:stop] * scale, self.labels[start:stop]
+
+    def get_scaled_boxes(self, width: int, height: int) -> np.ndarray:
+        """
+        Returns the boxes of all the images, scaled as if every image was resized to
+        the same size
+
+        :param width: Width the images are resized to, in pixels
+        :type width: int
+        :param height: Height the images are resized to, in pixels
+        :type height: int
+        :return: The N x 4 float32 x1, y1, x2, y2 boxes
+        :rtype: np.ndarray
+        """
+        # Scales rounded to float32 as in get_target, so both give the same boxes
+        scales = (np.array([width, height]) / self.sizes).astype(np.float32)
+        return (
+            self.boxes
+            * np.repeat(scales, np.diff(self.offsets), axis=0)[:, [0, 1, 0, 1]]
+        )
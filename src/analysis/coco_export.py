@@ -0,0 +1,379 @@
+"""
+File containing the converter of the BDD100K labels to COCO detection labels.
+
+The label file is streamed with an ijson backend and the COCO file is written as the
+images are converted, so the memory used does not depend on the size of the split.
+The images are written to the COCO file directly, while their annotations are spooled
+to a temporary file which is appended once all of the images are written. The output
+is byte for byte the json.dump of the complete COCO dict, and replaces the previous
+file at once when the conversion is complete. CocoWriter is also used by the COCO
+sink of the label pipeline, which converts the boxes of whole batches at once.
+
+Usage: python -m analysis.coco_export [--splits train val] [--dataset-dir DIR]
+    [--labels-dir DIR] [--images-dir DIR] [--json-backend NAME] [--serial]
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Self
+
+import numpy as np
+
+from analysis.json_backends import (
+    IJSON_BACKENDS,
+    get_available_backends,
+    is_backend_available,
+    iter_label_objects,
+)
+from config import (
+    BDD_LABELS_PREFIX,
+    CATEGORIES,
+    DATASET_SPLITS,
+    IMAGE_HEIGHT,
+    IMAGE_WIDTH,
+    NETWORK_MOUNT,
+)
+
+# Name of the COCO file in the images directory of a split, as expected by RF-DETR
+COCO_FILENAME = "_annotations.coco.json"
+COCO_SUPERCATEGORY = "object_supercategory"
+# Boxes narrower or lower than this after clipping are left out, since DETR models
+# struggle with boxes smaller than 2-4 pixels
+MIN_BOX_SIZE = 2
+# Size of the write buffers and of the chunks the annotations are appended in
+WRITE_BUFFER_SIZE = 2**20
+
+
+def get_coco_categories() -> list[dict]:
+    """
+    Returns the COCO categories, with the ids of config.CATEGORIES
+
+    :return: One dict per category
+    :rtype: list[dict]
+    """
+    return [
+        {"supercategory": COCO_SUPERCATEGORY, "id": category_id, "name": category}
+        for category, category_id in CATEGORIES.items()
+    ]
+
+
+def get_streaming_backend(json_backend: str = "auto") -> str:
+    """
+    Chooses an ijson backend, since the in-memory backends load the whole label file
+
+    :param json_backend: Name of an ijson backend, or "auto" for the fastest installed
+    :type json_backend: str
+    :return: Name of the backend to use
+    :rtype: str
+    """
+    if json_backend == "auto":
+        available = get_available_backends()
+        return next(backend for backend in IJSON_BACKENDS if backend in available)
+    if json_backend not in IJSON_BACKENDS:
+        raise ValueError(f"JSON backend {json_backend} does not stream the labels")
+    if not is_backend_available(json_backend):
+        raise ImportError(f"JSON backend {json_backend} is not installed")
+    return json_backend
+
+
+def get_coco_box(
+    box: dict | None,
+    image_width: int = IMAGE_WIDTH,
+    image_height: int = IMAGE_HEIGHT,
+) -> list[float] | None:
+    """
+    Clips a BDD box to the image and converts it to a COCO box
+
+    :param box: The box2d of a label
+    :type box: dict | None
+    :param image_width: Width of the image in pixels
+    :type image_width: int
+    :param image_height: Height of the image in pixels
+    :type image_height: int
+    :return: The x, y, width and height of the clipped box, or None if the box is
+        missing, malformed or smaller than MIN_BOX_SIZE
+    :rtype: list[float] | None
+    """
+    if not box:
+        return None
+    try:
+        x1, y1, x2, y2 = (float(box[key]) for key in ("x1", "y1", "x2", "y2"))
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not all(math.isfinite(value) for value in (x1, y1, x2, y2)):
+        return None
+    x1 = float(max(0, x1))
+    y1 = float(max(0, y1))
+    x2 = float(min(float(image_width), x2))
+    y2 = float(min(float(image_height), y2))
+    width = x2 - x1
+    height = y2 - y1
+    if width < MIN_BOX_SIZE or height < MIN_BOX_SIZE:
+        return None
+    return [x1, y1, width, height]
+
+
+def get_coco_boxes(boxes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Clips BDD boxes to the image and converts them to COCO boxes, exactly as
+    get_coco_box does for a single box
+
+    :param boxes: N x 4 array of x1, y1, x2, y2 coordinates
+    :type boxes: np.ndarray
+    :return: The N x 4 x, y, width and height of the clipped boxes, and the mask of
+        the boxes that are finite and at least MIN_BOX_SIZE wide and high
+    :rtype: tuple[np.ndarray, np.ndarray]
+    """
+    with np.errstate(invalid="ignore"):
+        x1 = np.where(boxes[:, 0] > 0, boxes[:, 0], 0.0)
+        y1 = np.where(boxes[:, 1] > 0, boxes[:, 1], 0.0)
+        x2 = np.where(boxes[:, 2] < IMAGE_WIDTH, boxes[:, 2], float(IMAGE_WIDTH))
+        y2 = np.where(boxes[:, 3] < IMAGE_HEIGHT, boxes[:, 3], float(IMAGE_HEIGHT))
+        width = x2 - x1
+        height = y2 - y1
+        keep = (
+            np.isfinite(boxes).all(axis=1)
+            & (width >= MIN_BOX_SIZE)
+            & (height >= MIN_BOX_SIZE)
+        )
+    return np.column_stack((x1, y1, width, height)), keep
+
+
+class CocoWriter:
+    """
+    A context manager writing a COCO detection file one image at a time. The images
+    are written to the file directly, while their annotations are spooled to a
+    temporary file which is appended on exit. The file replaces the previous one only
+    if the block exits without an error.
+    """
+
+    def __init__(self, output_file: Path) -> None:
+        """
+        Initializes the writer, nothing is written before entering it
+
+        :param output_file: Path to the COCO file
+        :type output_file: Path
+        """
+        self.output_file = Path(output_file)
+        self.temporary_file = self.output_file.with_name(
+            f".{self.output_file.name}.{os.getpid()}.tmp"
+        )
+        self.image_count = 0
+        self.annotation_count = 0
+
+    def __enter__(self) -> Self:
+        """
+        Opens the temporary files and writes the start of the COCO dict
+
+        :return: The writer
+        :rtype: Self
+        """
+        self.output_file.parent.mkdir(parents=True, exist_ok=True)
+        self.output = open(self.temporary_file, "w", buffering=WRITE_BUFFER_SIZE)
+        self.annotations = tempfile.TemporaryFile(
+            "w+", buffering=WRITE_BUFFER_SIZE, dir=self.output_file.parent
+        )
+        self.output.write('{"type": "instances", "images": [')
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        """
+        Appends the annotations and the categories and moves the file in place, or
+        discards it if the block raised an error
+
+        :param exc_type: Type of the error raised by the block, if any
+        :param exc_value: The error raised by the block, if any
+        :param traceback: Traceback of the error raised by the block, if any
+        """
+        try:
+            if exc_type is None:
+                self.output.write('], "annotations": [')
+                self.annotations.seek(0)
+                shutil.copyfileobj(self.annotations, self.output, WRITE_BUFFER_SIZE)
+                self.output.write(
+                    f'], "categories": {json.dumps(get_coco_categories())}}}'
+                )
+            self.output.close()
+            self.annotations.close()
+            if exc_type is None:
+                self.temporary_file.replace(self.output_file)
+        finally:
+            self.temporary_file.unlink(missing_ok=True)
+
+    def add_image(
+        self,
+        image_id: int,
+        file_name: str,
+        category_ids: list[int],
+        bboxes: list[list[float]],
+    ) -> None:
+        """
+        Writes an image and its annotations. The annotations are numbered in the order
+        they are written.
+
+        :param image_id: Id of the image
+        :type image_id: int
+        :param file_name: Name of the image file
+        :type file_name: str
+        :param category_ids: Category id of every annotation
+        :type category_ids: list[int]
+        :param bboxes: The x, y, width and height of every annotation
+        :type bboxes: list[list[float]]
+        """
+        image = {
+            "id": image_id,
+            "file_name": file_name,
+            "width": IMAGE_WIDTH,
+            "height": IMAGE_HEIGHT,
+        }
+        self.output.write((", " if self.image_count else "") + json.dumps(image))
+        annotations = [
+            {
+                "id": self.annotation_count + i,
+                "image_id": image_id,
+                "category_id": category_id,
+                "bbox": bbox,
+                "area": float(bbox[2] * bbox[3]),
+                "iscrowd": 0,
+            }
+            for i, (category_id, bbox) in enumerate(zip(category_ids, bboxes))
+        ]
+        self.annotations.write(
+            (", " if self.annotation_count else "")
+            + ", ".join(json.dumps(annotation) for annotation in annotations)
+        )
+        self.image_count += 1
+        self.annotation_count += len(annotations)
+
+
+def convert_to_coco(
+    label_file: Path, output_file: Path, json_backend: str = "auto"
+) -> tuple[int, int]:
+    """
+    Converts a BDD label file to a COCO detection file. Images without any valid box
+    of the categories in config.CATEGORIES are left out. The images keep their
+    position in the label file as id.
+
+    :param label_file: Path to the BDD label file
+    :type label_file: Path
+    :param output_file: Path to the COCO file, replaced once the conversion is complete
+    :type output_file: Path
+    :param json_backend: Name of an ijson backend, or "auto" for the fastest installed
+    :type json_backend: str
+    :return: The number of images and of annotations written
+    :rtype: tuple[int, int]
+    """
+    json_backend = get_streaming_backend(json_backend)
+    with CocoWriter(output_file) as writer:
+        for image_id, object in enumerate(iter_label_objects(label_file, json_backend)):
+            category_ids, bboxes = [], []
+            for label in object.get("labels", []):
+                category_id = CATEGORIES.get(label.get("category"))
+                if category_id is None:
+                    continue
+                bbox = get_coco_box(label.get("box2d"))
+                if bbox is None:
+                    continue
+                category_ids.append(category_id)
+                bboxes.append(bbox)
+            if category_ids:
+                writer.add_image(image_id, object["name"], category_ids, bboxes)
+    return writer.image_count, writer.annotation_count
+
+
+def convert_splits(
+    splits: list[str],
+    labels_dir: str,
+    images_dir: str,
+    json_backend: str = "auto",
+    parallel: bool = True,
+) -> dict[str, tuple[int, int]]:
+    """
+    Converts the label files of several splits, each one to the images directory of
+    its split. With parallel set, every split is converted in its own process.
+
+    :param splits: Names of the dataset splits, e.g. train and val
+    :type splits: list[str]
+    :param labels_dir: Directory holding the BDD label files
+    :type labels_dir: str
+    :param images_dir: Directory holding one directory of images per split
+    :type images_dir: str
+    :param json_backend: Name of an ijson backend, or "auto" for the fastest installed
+    :type json_backend: str
+    :param parallel: Convert the splits concurrently
+    :type parallel: bool
+    :return: The number of images and of annotations written for every split
+    :rtype: dict[str, tuple[int, int]]
+    """
+    jobs = {
+        split: (
+            Path(labels_dir) / f"{BDD_LABELS_PREFIX}{split}.json",
+            Path(images_dir) / split / COCO_FILENAME,
+            json_backend,
+        )
+        for split in splits
+    }
+    if not parallel or len(jobs) < 2:
+        return {split: convert_to_coco(*job) for split, job in jobs.items()}
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(len(jobs), mp_context=context) as pool:
+        futures = {
+            split: pool.submit(convert_to_coco, *job) for split, job in jobs.items()
+        }
+        return {split: future.result() for split, future in futures.items()}
+
+
+def main() -> None:
+    """
+    Converts the label files of the requested splits to COCO files
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m analysis.coco_export",
+        description="Converts the BDD100K labels to COCO detection labels",
+    )
+    parser.add_argument(
+        "--splits", nargs="+", choices=list(DATASET_SPLITS), default=["train", "val"]
+    )
+    parser.add_argument("--dataset-dir", default=NETWORK_MOUNT)
+    parser.add_argument(
+        "--labels-dir", help="Directory of the label files, within the dataset dir"
+    )
+    parser.add_argument(
+        "--images-dir",
+        help="Directory of the image directories of the splits, within the dataset "
+        "dir. The COCO files are written there.",
+    )
+    parser.add_argument(
+        "--json-backend", choices=["auto"] + IJSON_BACKENDS, default="auto"
+    )
+    parser.add_argument(
+        "--serial", action="store_true", help="Convert the splits one after the other"
+    )
+    args = parser.parse_args()
+
+    dataset_dir = Path(args.dataset_dir)
+    labels_dir = args.labels_dir or (
+        dataset_dir / "bdd100k_labels_release" / "bdd100k" / "labels"
+    )
+    images_dir = args.images_dir or (
+        dataset_dir / "bdd100k_images_100k" / "bdd100k" / "images" / "100k"
+    )
+    start = time.perf_counter()
+    counts = convert_splits(
+        args.splits, labels_dir, images_dir, args.json_backend, not args.serial
+    )
+    for split, (images, annotations) in counts.items():
+        print(f"{split}: {annotations} annotations across {images} images")
+    print(f"Converted in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
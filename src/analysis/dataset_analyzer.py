@@ -2,13 +2,28 @@
 File containing DatasetAnalyzer class
 """
 
-from config import NETWORK_MOUNT, DATASET_SPLITS, BDD_LABELS_PREFIX, CATEGORIES
+from config import (
+    NETWORK_MOUNT,
+    DATASET_SPLITS,
+    BDD_LABELS_PREFIX,
+    CSV_DIR,
+    LABEL_CACHE_DIR,
+    THUMBNAIL_DIR,
+)
 from pathlib import Path
-import ijson
-from analysis.scene_statistics import SceneStatistics
-from analysis.category_statistics import CategoryStatistics
-
-from collections import defaultdict
+from analysis.category_statistics import load_table
+from analysis.anomaly_thumbnails import ThumbnailCache, precompute_thumbnails
+from analysis.coco_export import COCO_FILENAME
+from analysis.label_cache import LabelCache
+from analysis.label_pipeline import (
+    CategoryStatisticsSink,
+    CocoExportSink,
+    LabelCacheSink,
+    LabelPipeline,
+    SceneStatisticsSink,
+)
+from analysis.manifest import AnalysisManifest
+from analysis.progress import ProgressReporter
 
 
 class DatasetAnalyzer:
@@ -16,6 +31,30 @@ class DatasetAnalyzer:
     A class for analyzing the BDD100K dataset labels by computing and saving statistics.
     """
 
+    def __init__(
+        self,
+        network_mount: str = NETWORK_MOUNT,
+        output_dir: str = CSV_DIR,
+        cache_dir: str = LABEL_CACHE_DIR,
+        thumbnail_dir: str = THUMBNAIL_DIR,
+    ) -> None:
+        """
+        Initializes the analyzer with the locations of its inputs and outputs
+
+        :param network_mount: Directory the BDD100K dataset is mounted at
+        :type network_mount: str
+        :param output_dir: Directory the statistics are saved to
+        :type output_dir: str
+        :param cache_dir: Directory holding the binary label caches
+        :type cache_dir: str
+        :param thumbnail_dir: Directory holding the anomaly thumbnails
+        :type thumbnail_dir: str
+        """
+        self.network_mount = network_mount
+        self.output_dir = output_dir
+        self.cache_dir = cache_dir
+        self.thumbnail_dir = thumbnail_dir
+
     def get_bdd_labels_path(self) -> Path:
         """
         Returns the root directory of the BDD100K dataset labels.
@@ -23,112 +62,129 @@ class DatasetAnalyzer:
         :return: Absolute path to the labels directory.
         :rtype: Path
         """
-        dataset_root = Path(NETWORK_MOUNT)
+        dataset_root = Path(self.network_mount)
         json_labels_path = (
             dataset_root / "bdd100k_labels_release" / "bdd100k" / "labels"
         )
         return json_labels_path
 
+    def get_label_file(self, split_name: str) -> Path:
+        """
+        Returns the path to the JSON label file of a split
+
+        :param split_name: Name of the dataset split, i.e. train or val
+        :type split_name: str
+        :return: Absolute path to the label file
+        :rtype: Path
+        """
+        return self.get_bdd_labels_path() / (BDD_LABELS_PREFIX + split_name + ".json")
+
+    def is_up_to_date(self, split_name: str, output_format: str = "parquet") -> bool:
+        """
+        Checks whether the saved statistics of a split were computed from its current
+        label file by the current analysis code, and are complete
+
+        :param split_name: Name of the dataset split, i.e. train or val
+        :type split_name: str
+        :param output_format: Format the records and anomalies are expected in
+        :type output_format: str
+        :return: True if the statistics of the split do not need to be recomputed
+        :rtype: bool
+        """
+        return AnalysisManifest(self.output_dir).is_up_to_date(
+            split_name, self.get_label_file(split_name), output_format
+        )
+
     def compute_statistics(
-        self, split_name, progressbar_callback=None, status_callback=None
-    ) -> defaultdict[int]:
+        self,
+        split_name,
+        progress: ProgressReporter | None = None,
+        num_workers: int = 1,
+        json_backend: str = "auto",
+        use_label_cache: bool = False,
+        output_format: str = "parquet",
+        coco_dir: str | None = None,
+    ) -> str:
         """
-        Processes the JSON labels of the BDD Dataset and computes statistics
+        Processes the JSON labels of the BDD Dataset and computes statistics. The label
+        file is parsed once, and its labels are handed to every output of the run.
 
         :param split_name: Name of the dataset split, i.e. train or val
-        :param progressbar_callback: A callback for the progressbar displayed on the hello page
-        :param status_callback: A callback for the processing status displayed on the hello page
-        :return: Description
-        :rtype: defaultdict[int, Any]
+        :param progress: Reporter notified of every processed image, which decides
+            when to publish an update. Nothing is reported if it is None.
+        :type progress: ProgressReporter | None
+        :param num_workers: Number of processes used to parse the labels. When greater than
+            one, the label file is split into shards that are processed in parallel.
+        :param json_backend: Name of the JSON parser backend, or "auto" to pick the
+            fastest one that is installed and fits in memory
+        :param use_label_cache: Compute the statistics from the binary label cache,
+            which is (re)built in the same pass if the label file changed since it was
+            last built
+        :param output_format: Format of the records and anomalies, parquet or csv
+        :param coco_dir: Directory holding one directory per split, e.g. the images
+            directory, the COCO labels of the split are written to. No COCO labels are
+            written if it is None.
+        :type coco_dir: str | None
+        :return: The name of the JSON parser backend that was used
+        :rtype: str
         """
         # Build the file path
-        bdd_labels_path = self.get_bdd_labels_path()
-        filename = BDD_LABELS_PREFIX + split_name + ".json"
-        label_file = bdd_labels_path / filename
-        # Initialize variables for calculating progress
-        progress_counter = 0
-        split_count = DATASET_SPLITS[split_name]["count"]
-        full_split_name = DATASET_SPLITS[split_name]["full_name"]
-
-        # Initialize objects for computing statistics
-        scene_statistics = SceneStatistics(split_name)
-        category_statistics = CategoryStatistics(split_name)
-
-        # Open the file and stream the objects to avoid
-        # loading the large .json file into memory all at once
-        with open(label_file, "r") as f:
-            objects = ijson.items(f, "item")
-            for object in objects:
-                image_name = object["name"]
-                progress_counter += 1
-                for attribute, value in object["attributes"].items():
-                    scene_statistics.update_stats_counter(attribute, value)
-                    if attribute == "weather":
-                        weather = value
-                    if attribute == "timeofday":
-                        timeofday = value
-                for label in object["labels"]:
-                    if label["category"] in CATEGORIES.keys():
-                        # Update counts
-                        category_statistics.increment_category_total_count(
-                            label["category"]
-                        )
-                        scene_statistics.update_category_distribution(
-                            weather, timeofday, label["category"]
-                        )
-                        if label["attributes"]["occluded"]:
-                            category_statistics.increment_category_occluded_count(
-                                label["category"]
-                            )
-                        if label["attributes"]["truncated"]:
-                            category_statistics.increment_category_truncated_count(
-                                label["category"]
-                            )
-                        # Check if anomaly
-                        x1 = label["box2d"]["x1"]
-                        x2 = label["box2d"]["x2"]
-                        y1 = label["box2d"]["y1"]
-                        y2 = label["box2d"]["y2"]
-
-                        # Update area
-                        area = (y2 - y1) * (x2 - x1)
-                        aspect_ratio = (x2 - x1) / (y2 - y1)
-                        category_statistics.add_category_total_area(
-                            label["category"], area
-                        )
-                        category_statistics.update_category_max_area(
-                            label["category"], area
-                        )
-                        category_statistics.update_category_min_area(
-                            label["category"], area
-                        )
-                        category_statistics.categorize_area(label["category"], area)
-                        category_statistics.update_category_anomaly_count(
-                            label["category"],
-                            area,
-                            aspect_ratio,
-                            image_name,
-                            x1,
-                            x2,
-                            y1,
-                            y2,
-                        )
-                        category_statistics.insert_record(
-                            label["category"],
-                            area,
-                            label["attributes"]["occluded"],
-                            label["attributes"]["truncated"],
-                        )
-
-                # After processing each image, update progressbar and status callbacks
-                if progressbar_callback:
-                    progressbar_callback.progress(progress_counter / split_count)
-                if status_callback:
-                    status_callback.text(
-                        f"{full_split_name} split: {progress_counter / split_count * 100:.2f}% processed"
-                    )
-        scene_statistics.save_csvs()
-        scene_statistics.save_category_distribution_csv()
-        category_statistics.save_stats_csv()
-        category_statistics.save_records_csv()
-        category_statistics.save_anomalies()
+        label_file = self.get_label_file(split_name)
+        # Initialize the progress of the split
+        if progress is None:
+            progress = ProgressReporter()
+        progress.start(
+            f"{DATASET_SPLITS[split_name]['full_name']} split",
+            DATASET_SPLITS[split_name]["count"],
+        )
+
+        # Initialize the outputs computed from the labels
+        sinks = [
+            SceneStatisticsSink(split_name, self.output_dir),
+            CategoryStatisticsSink(split_name, self.output_dir, output_format),
+        ]
+        if coco_dir is not None:
+            sinks.append(CocoExportSink(Path(coco_dir) / split_name / COCO_FILENAME))
+        # The outputs of the split are only valid again once all of them are saved
+        manifest = AnalysisManifest(self.output_dir)
+        manifest.invalidate(split_name)
+
+        label_cache = None
+        if use_label_cache:
+            label_cache = LabelCache(split_name, label_file, self.cache_dir)
+        pipeline = LabelPipeline(label_file, sinks)
+        if label_cache is not None and label_cache.is_valid():
+            json_backend = "label cache"
+            pipeline.add_batches(label_cache.iter_batches(), progress)
+        else:
+            if label_cache is not None:
+                sinks.append(LabelCacheSink(label_cache))
+            json_backend = pipeline.run(json_backend, num_workers, progress)
+        pipeline.save()
+        manifest.record(split_name, label_file, output_format)
+        progress.finish()
+        return json_backend
+
+    def precompute_thumbnails(
+        self, split_name: str, output_format: str = "parquet"
+    ) -> int:
+        """
+        Renders the thumbnails of the images with the most anomalies of a split, from
+        its saved anomalies
+
+        :param split_name: Name of the dataset split, i.e. train or val
+        :type split_name: str
+        :param output_format: Format the anomalies were saved in
+        :type output_format: str
+        :return: Number of thumbnails available, 0 if the images are not mounted
+        :rtype: int
+        """
+        anomalies = load_table(
+            f"anomalies_{split_name}.{output_format}", self.output_dir
+        )
+        return precompute_thumbnails(
+            split_name,
+            anomalies,
+            ThumbnailCache(self.thumbnail_dir),
+            self.network_mount,
+        )
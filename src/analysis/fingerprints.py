@@ -0,0 +1,67 @@
+"""
+File containing helpers for fingerprinting input files, so that derived outputs
+can be reused for as long as their inputs do not change
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+# Size of the blocks read while hashing a file
+HASH_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def hash_file(path: Path) -> str:
+    """
+    Computes the BLAKE2b digest of the contents of a file
+
+    :param path: Path to the file
+    :type path: Path
+    :return: The hex digest of the file contents
+    :rtype: str
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fingerprint_file(path: Path) -> dict:
+    """
+    Returns the fingerprint of a file: its size, modification time and content hash
+
+    :param path: Path to the file
+    :type path: Path
+    :return: A JSON serializable dict with the keys size, mtime_ns and blake2b
+    :rtype: dict
+    """
+    stat = os.stat(path)
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "blake2b": hash_file(path),
+    }
+
+
+def fingerprint_matches(path: Path, fingerprint: dict | None) -> bool:
+    """
+    Checks whether a file still matches a fingerprint. If the size and modification
+    time are unchanged the file is assumed to be unchanged, otherwise the contents
+    are hashed, so that a touched or copied but otherwise identical file still matches.
+
+    :param path: Path to the file
+    :type path: Path
+    :param fingerprint: A fingerprint returned by fingerprint_file, or None
+    :type fingerprint: dict | None
+    :return: True if the file matches the fingerprint
+    :rtype: bool
+    """
+    if not fingerprint or not Path(path).exists():
+        return False
+    stat = os.stat(path)
+    if stat.st_size != fingerprint["size"]:
+        return False
+    if stat.st_mtime_ns == fingerprint["mtime_ns"]:
+        return True
+    return hash_file(path) == fingerprint["blake2b"]
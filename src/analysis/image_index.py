@@ -0,0 +1,187 @@
+"""
+File containing the ImageIndex class, which gives the rows of a table belonging to an
+image without scanning the table.
+
+The rows are sorted by image, so the rows of every image form a contiguous range, and
+the start of every range is stored in an offsets array: the rows of the i-th image are
+offsets[i]:offsets[i + 1]. Image names are hashed to their position, so a lookup costs
+one hash lookup and one slice, whatever the size of the table. The AnomalyIndex
+subclass also ranks the images by their number of anomalies of every type.
+"""
+
+import numpy as np
+import pandas as pd
+
+from analysis.label_cache import LabelCache
+
+
+class ImageIndex:
+    """
+    A class indexing the rows of a table by the image they belong to
+    """
+
+    def __init__(self, table: pd.DataFrame, image_column: str = "image_name") -> None:
+        """
+        Sorts the table by image, unless the rows of every image are already
+        contiguous, and computes the offsets of every image
+
+        :param table: The table to index, with one row per box or anomaly
+        :type table: pd.DataFrame
+        :param image_column: The column holding the image names
+        :type image_column: str
+        """
+        image_names = table[image_column]
+        if not isinstance(image_names.dtype, pd.CategoricalDtype):
+            image_names = image_names.astype("category")
+        codes = image_names.cat.codes.to_numpy()
+        # Tables written in label order are already grouped by image, and
+        # dictionary encoding numbers the images in order of appearance
+        if np.any(codes[1:] < codes[:-1]):
+            order = np.argsort(codes, kind="stable")
+            table = table.iloc[order].reset_index(drop=True)
+            codes = codes[order]
+        self.table = table
+        self.image_names = image_names.cat.categories
+        self.codes = codes
+        self.offsets = np.searchsorted(codes, np.arange(len(self.image_names) + 1))
+
+    @classmethod
+    def from_label_cache(cls, label_cache: LabelCache) -> "ImageIndex":
+        """
+        Indexes the boxes of a split from its label cache. The numeric columns stay
+        backed by the memory mapped cache.
+
+        :param label_cache: The valid label cache of the split
+        :type label_cache: LabelCache
+        :return: The index of the boxes of every image
+        :rtype: ImageIndex
+        """
+        images, boxes = label_cache.load()
+        table = boxes.to_pandas(split_blocks=True)
+        table.insert(
+            0,
+            "image_name",
+            pd.Categorical.from_codes(
+                boxes.column("image_index").to_numpy(),
+                categories=images.column("name").to_pylist(),
+            ),
+        )
+        return cls(table)
+
+    def __len__(self) -> int:
+        """
+        Returns the number of indexed images
+
+        :return: The number of images
+        :rtype: int
+        """
+        return len(self.image_names)
+
+    def __contains__(self, image_name: str) -> bool:
+        """
+        Checks whether an image has rows in the table
+
+        :param image_name: The name of the image file
+        :type image_name: str
+        :return: True if the image is indexed
+        :rtype: bool
+        """
+        return image_name in self.image_names
+
+    def get_range(self, image_name: str) -> tuple[int, int]:
+        """
+        Returns the range of rows of an image
+
+        :param image_name: The name of the image file
+        :type image_name: str
+        :return: The first row and the row after the last one, equal if the image has
+            no rows
+        :rtype: tuple[int, int]
+        """
+        try:
+            position = self.image_names.get_loc(image_name)
+        except KeyError:
+            return 0, 0
+        return int(self.offsets[position]), int(self.offsets[position + 1])
+
+    def get(self, image_name: str) -> pd.DataFrame:
+        """
+        Returns the rows of an image
+
+        :param image_name: The name of the image file
+        :type image_name: str
+        :return: The rows of the image, in table order
+        :rtype: DataFrame
+        """
+        start, stop = self.get_range(image_name)
+        return self.table.iloc[start:stop]
+
+    def get_counts(self) -> np.ndarray:
+        """
+        Returns the number of rows of every image
+
+        :return: The number of rows, in the order of image_names
+        :rtype: np.ndarray
+        """
+        return np.diff(self.offsets)
+
+    def rank_images(self, mask: np.ndarray | None = None) -> np.ndarray:
+        """
+        Ranks the images by their number of selected rows
+
+        :param mask: Mask of the selected rows of the sorted table, None for all rows
+        :type mask: np.ndarray | None
+        :return: Positions of the images with at least one selected row, most rows
+            first and in order of appearance among equal counts
+        :rtype: np.ndarray
+        """
+        codes = self.codes if mask is None else self.codes[mask]
+        counts = np.bincount(codes, minlength=len(self.image_names))
+        order = np.argsort(-counts, kind="stable")
+        return order[: np.count_nonzero(counts)]
+
+
+class AnomalyIndex(ImageIndex):
+    """
+    A class indexing the anomalies of a split by image, with the images ranked by their
+    number of anomalies of every type
+    """
+
+    def __init__(self, anomalies: pd.DataFrame) -> None:
+        """
+        Indexes the anomalies and ranks the images for every anomaly type
+
+        :param anomalies: The anomalies of a split
+        :type anomalies: pd.DataFrame
+        """
+        super().__init__(anomalies)
+        types = self.table["type"].to_numpy()
+        self.rankings = {
+            int(anomaly_type): self.rank_images(types == anomaly_type)
+            for anomaly_type in np.unique(types)
+        }
+
+    def get_ranked_images(self, anomaly_type: int) -> pd.Index:
+        """
+        Returns the images with anomalies of a type, most anomalies first
+
+        :param anomaly_type: The type of anomaly
+        :type anomaly_type: int
+        :return: The names of the images
+        :rtype: Index
+        """
+        ranking = self.rankings.get(anomaly_type, np.array([], dtype=np.intp))
+        return self.image_names[ranking]
+
+    def get_top_images(self, anomaly_type: int, top_n: int) -> list[str]:
+        """
+        Returns the images with the most anomalies of a type
+
+        :param anomaly_type: The type of anomaly
+        :type anomaly_type: int
+        :param top_n: Number of images to return
+        :type top_n: int
+        :return: The names of the images, most anomalies first
+        :rtype: list[str]
+        """
+        return self.get_ranked_images(anomaly_type)[:top_n].tolist()
@@ -0,0 +1,174 @@
+"""
+File containing the shared loader of the dataset images, used by the anomaly
+thumbnails, the training shards and the training notebook.
+
+A JPEG can be decoded directly at 1/2, 1/4 or 1/8 of its size by dropping the high
+frequency DCT coefficients, which skips most of the work of the decoder. When the
+image is only needed at a smaller size, Image.draft picks the largest such reduction
+that still leaves the image at least as large as needed, so a 1280 x 720 image needed
+at 320 x 320 is decoded at 640 x 360 and then resized. The decoded images can also be
+kept in a DecodedImageCache, bounded in size, when the same images are loaded again.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from PIL import Image
+
+# Size above which the least recently used decoded images are evicted
+DECODED_CACHE_BYTES = 1024 * 2**20
+
+
+def get_image_bytes(image: Image.Image) -> int:
+    """
+    Returns the size of the pixels of a decoded image
+
+    :param image: The decoded image
+    :type image: Image
+    :return: The size in bytes
+    :rtype: int
+    """
+    return len(image.getbands()) * image.width * image.height
+
+
+class DecodedImageCache:
+    """
+    A class keeping decoded images in memory and evicting the least recently used ones
+    once the cache exceeds its size limit. A cache can be shared by threads.
+    """
+
+    def __init__(self, max_bytes: int = DECODED_CACHE_BYTES) -> None:
+        """
+        Initializes the cache
+
+        :param max_bytes: Size limit of the cache in bytes
+        :type max_bytes: int
+        """
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> tuple[Image.Image, tuple[int, int]] | None:
+        """
+        Looks up a decoded image and marks it as recently used
+
+        :param key: The key of the image, see get_cache_key
+        :type key: tuple
+        :return: A copy of the image, which the caller may modify, and the size of
+            the image file, or None if it is not cached
+        :rtype: tuple[Image, tuple[int, int]] | None
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        image, original_size = entry
+        return image.copy(), original_size
+
+    def put(
+        self, key: tuple, image: Image.Image, original_size: tuple[int, int]
+    ) -> None:
+        """
+        Stores a copy of a decoded image, then evicts images if the cache got too large
+
+        :param key: The key of the image, see get_cache_key
+        :type key: tuple
+        :param image: The decoded image
+        :type image: Image
+        :param original_size: Width and height of the image file
+        :type original_size: tuple[int, int]
+        """
+        size = get_image_bytes(image)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= get_image_bytes(previous[0])
+            self.entries[key] = (image.copy(), original_size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (evicted, _) = self.entries.popitem(last=False)
+                self.total_bytes -= get_image_bytes(evicted)
+
+
+def get_cache_key(image_path: Path, size: tuple[int, int] | None) -> tuple:
+    """
+    Returns the key of a loaded image. The image file is identified by its size and
+    modification time, so it is not read.
+
+    :param image_path: The path to the image
+    :type image_path: Path
+    :param size: The size the image was loaded at, or None for the full size
+    :type size: tuple[int, int] | None
+    :return: The key of the image
+    :rtype: tuple
+    """
+    stat = os.stat(image_path)
+    return (str(image_path), stat.st_size, stat.st_mtime_ns, size)
+
+
+def decode_image(
+    image_path: Path, min_size: tuple[int, int] | None = None
+) -> tuple[Image.Image, tuple[int, int]]:
+    """
+    Decodes an image to RGB. With a minimum size, a JPEG is decoded at the largest
+    reduction that keeps it at least that large in both dimensions.
+
+    :param image_path: The path to the image
+    :type image_path: Path
+    :param min_size: Width and height the decoded image must reach, or None to decode
+        the image at its full size
+    :type min_size: tuple[int, int] | None
+    :return: The decoded RGB image and the width and height of the image file, which
+        the box coordinates refer to
+    :rtype: tuple[Image, tuple[int, int]]
+    """
+    with Image.open(image_path) as image:
+        original_size = image.size
+        if min_size is not None:
+            # Only JPEG files support draft, it does nothing for the others
+            image.draft("RGB", min_size)
+        return image.convert("RGB"), original_size
+
+
+def load_image(
+    image_path: Path,
+    size: tuple[int, int] | None = None,
+    cache: DecodedImageCache | None = None,
+) -> tuple[Image.Image, tuple[int, int]]:
+    """
+    Loads an image in RGB, resized to a given size. The image is decoded at a reduced
+    size first whenever the JPEG allows it.
+
+    :param image_path: The path to the image
+    :type image_path: Path
+    :param size: Width and height of the returned image, or None to keep the full size
+    :type size: tuple[int, int] | None
+    :param cache: A cache the image is looked up in and stored to, if any
+    :type cache: DecodedImageCache | None
+    :return: The RGB image and the width and height of the image file, which the box
+        coordinates refer to
+    :rtype: tuple[Image, tuple[int, int]]
+    """
+    size = None if size is None else tuple(size)
+    key = None
+    if cache is not None:
+        key = get_cache_key(image_path, size)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    image, original_size = decode_image(image_path, size)
+    if size is not None and image.size != size:
+        image = image.resize(size)
+    if cache is not None:
+        cache.put(key, image, original_size)
+    return image, original_size
@@ -0,0 +1,330 @@
+"""
+File containing the ImageShardStore class, a preprocessed copy of the training images
+of a split that is read without decoding any JPEG.
+
+Every image of a COCO file is decoded once, at a reduced size where the JPEG allows it,
+converted to RGB and resized to the square training size, then stored as raw uint8
+pixels. The images are grouped in shards of IMAGES_PER_SHARD images, each one a .npy
+file holding an (images, size, size, 3) array which is memory mapped when read, so
+fetching an image is a slice of the page cache. The index holds the file names and the
+boxes of every image, already scaled to the training size, as flat arrays with
+per-image offsets. The shards are written by worker processes, one shard per task. The
+store is rebuilt whenever the fingerprint of the COCO file or the training size
+changes.
+
+Usage: python -m analysis.image_shards [--splits train val] [--dataset-dir DIR]
+    [--images-dir DIR] [--shards-dir DIR] [--num-workers N]
+"""
+
+import argparse
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from analysis.coco_annotations import CocoAnnotations
+from analysis.coco_export import COCO_FILENAME
+from analysis.fingerprints import fingerprint_file, fingerprint_matches
+from analysis.image_loading import load_image
+from config import DATASET_SPLITS, NETWORK_MOUNT, NUM_WORKERS, TRAINING_IMAGE_SIZE
+
+# Bump this whenever the layout of the shards or of the index changes
+SHARD_STORE_VERSION = 3
+# 2048 images of 320 x 320 pixels make shards of about 600 MB
+IMAGES_PER_SHARD = 2048
+
+
+def write_shard(
+    shard_path: Path, images_dir: Path, file_names: list[str], image_size: int
+) -> int:
+    """
+    Decodes and resizes a list of images into a shard file. The shard is written
+    under a temporary name and moved in place once complete.
+
+    :param shard_path: Path to the .npy file of the shard
+    :type shard_path: Path
+    :param images_dir: Directory holding the images
+    :type images_dir: Path
+    :param file_names: Names of the image files, in shard order
+    :type file_names: list[str]
+    :param image_size: Side of the resized images, in pixels
+    :type image_size: int
+    :return: The number of images written
+    :rtype: int
+    """
+    temporary_path = shard_path.with_name(f".{shard_path.name}")
+    pixels = np.lib.format.open_memmap(
+        temporary_path,
+        mode="w+",
+        dtype=np.uint8,
+        shape=(len(file_names), image_size, image_size, 3),
+    )
+    for i, file_name in enumerate(file_names):
+        image, _ = load_image(images_dir / file_name, (image_size, image_size))
+        pixels[i] = np.asarray(image)
+    pixels.flush()
+    del pixels
+    temporary_path.replace(shard_path)
+    return len(file_names)
+
+
+class ImageShardStore:
+    """
+    A class holding the images of a COCO file resized to the training size, in memory
+    mapped shards, along with their scaled boxes
+    """
+
+    def __init__(
+        self,
+        coco_file: Path,
+        images_dir: Path,
+        shards_dir: Path,
+        image_size: int = TRAINING_IMAGE_SIZE,
+    ) -> None:
+        """
+        Initializes the store, nothing is read or written before it is used
+
+        :param coco_file: Path to the COCO detection file of the split
+        :type coco_file: Path
+        :param images_dir: Directory holding the images of the split
+        :type images_dir: Path
+        :param shards_dir: Directory holding the shards and the index
+        :type shards_dir: Path
+        :param image_size: Side of the resized images, in pixels
+        :type image_size: int
+        """
+        self.coco_file = Path(coco_file)
+        self.images_dir = Path(images_dir)
+        self.directory = Path(shards_dir)
+        self.image_size = image_size
+        self.metadata_path = self.directory / "metadata.json"
+        self.index_path = self.directory / "index.npz"
+        self.index = None
+        self.images_per_shard = IMAGES_PER_SHARD
+        # Shards are mapped lazily, so that every DataLoader worker maps its own
+        self.shards = {}
+
+    def get_shard_path(self, shard: int) -> Path:
+        """
+        Returns the path of a shard
+
+        :param shard: Number of the shard
+        :type shard: int
+        :return: The path to the .npy file of the shard
+        :rtype: Path
+        """
+        return self.directory / f"images_{shard:04d}.npy"
+
+    def is_valid(self) -> bool:
+        """
+        Checks whether the store exists and was built from the current COCO file at
+        the current training size
+
+        :return: True if the store can be used as is
+        :rtype: bool
+        """
+        if not (self.metadata_path.exists() and self.index_path.exists()):
+            return False
+        metadata = json.loads(self.metadata_path.read_text())
+        return (
+            metadata.get("version") == SHARD_STORE_VERSION
+            and metadata.get("image_size") == self.image_size
+            and all(
+                self.get_shard_path(shard).exists()
+                for shard in range(metadata.get("shards", 0))
+            )
+            and fingerprint_matches(self.coco_file, metadata.get("source"))
+        )
+
+    def build(self, num_workers: int = NUM_WORKERS) -> int:
+        """
+        Decodes and resizes every image of the COCO file and (re)writes the store. The
+        metadata is removed first and written last, so the store is only valid once
+        complete.
+
+        :param num_workers: Number of processes decoding the images
+        :type num_workers: int
+        :return: The number of images written
+        :rtype: int
+        """
+        fingerprint = fingerprint_file(self.coco_file)
+        annotations = CocoAnnotations(self.coco_file)
+        file_names = annotations.file_names.tolist()
+        jobs = [
+            (
+                self.get_shard_path(shard),
+                self.images_dir,
+                file_names[start : start + IMAGES_PER_SHARD],
+                self.image_size,
+            )
+            for shard, start in enumerate(range(0, len(file_names), IMAGES_PER_SHARD))
+        ]
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.metadata_path.unlink(missing_ok=True)
+        for stale_path in self.directory.glob("images_*.npy"):
+            stale_path.unlink()
+        if num_workers > 1 and len(jobs) > 1:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(
+                min(num_workers, len(jobs)), mp_context=context
+            ) as pool:
+                futures = [pool.submit(write_shard, *job) for job in jobs]
+                for future in futures:
+                    future.result()
+        else:
+            for job in jobs:
+                write_shard(*job)
+        np.savez(
+            self.index_path,
+            file_names=annotations.file_names,
+            image_ids=annotations.image_ids,
+            sizes=annotations.sizes,
+            box_offsets=annotations.offsets,
+            boxes=annotations.get_scaled_boxes(self.image_size, self.image_size),
+            labels=annotations.labels,
+        )
+
+        metadata = {
+            "version": SHARD_STORE_VERSION,
+            "source": fingerprint,
+            "image_size": self.image_size,
+            "images_per_shard": IMAGES_PER_SHARD,
+            "images": len(file_names),
+            "shards": len(jobs),
+        }
+        self.metadata_path.write_text(json.dumps(metadata, indent=2))
+        self.index = None
+        self.shards = {}
+        return len(file_names)
+
+    def load(self) -> "ImageShardStore":
+        """
+        Reads the index, building the store first if needed. The shards themselves are
+        only mapped when their images are read.
+
+        :return: The store
+        :rtype: ImageShardStore
+        """
+        if self.index is None:
+            if not self.is_valid():
+                self.build()
+            metadata = json.loads(self.metadata_path.read_text())
+            self.images_per_shard = metadata["images_per_shard"]
+            with np.load(self.index_path) as index:
+                self.index = {key: index[key] for key in index.files}
+        return self
+
+    def get_shard(self, shard: int) -> np.ndarray:
+        """
+        Returns the read only memory map of a shard
+
+        :param shard: Number of the shard
+        :type shard: int
+        :return: The images x size x size x 3 pixels of the shard
+        :rtype: np.ndarray
+        """
+        pixels = self.shards.get(shard)
+        if pixels is None:
+            pixels = np.load(self.get_shard_path(shard), mmap_mode="r")
+            self.shards[shard] = pixels
+        return pixels
+
+    def __len__(self) -> int:
+        """
+        Returns the number of images in the store
+
+        :return: The number of images
+        :rtype: int
+        """
+        return len(self.load().index["file_names"])
+
+    def __getitem__(self, idx: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns an image and its annotations. The arrays are read only views of the
+        shards and of the index.
+
+        :param idx: Position of the image in the COCO file
+        :type idx: int
+        :return: The size x size x 3 uint8 RGB pixels, the N x 4 x1, y1, x2, y2 boxes
+            scaled to the training size and the N category ids
+        :rtype: tuple[np.ndarray, np.ndarray, np.ndarray]
+        """
+        index = self.load().index
+        if not 0 <= idx < len(index["file_names"]):
+            raise IndexError(f"Image {idx} is not in the store")
+        shard, position = divmod(idx, self.images_per_shard)
+        start, stop = index["box_offsets"][idx : idx + 2]
+        return (
+            self.get_shard(shard)[position],
+            index["boxes"][start:stop],
+            index["labels"][start:stop],
+        )
+
+    def __getstate__(self) -> dict:
+        """
+        Drops the memory maps when the store is sent to a worker process, which maps
+        the shards again on first use
+
+        :return: The state of the store
+        :rtype: dict
+        """
+        return {**self.__dict__, "shards": {}}
+
+
+def main() -> None:
+    """
+    Builds the image shard store of the requested splits
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m analysis.image_shards",
+        description="Stores the training images resized and decoded in memory mapped "
+        "shards",
+    )
+    parser.add_argument(
+        "--splits", nargs="+", choices=list(DATASET_SPLITS), default=["train", "val"]
+    )
+    parser.add_argument("--dataset-dir", default=NETWORK_MOUNT)
+    parser.add_argument(
+        "--images-dir",
+        help="Directory of the image directories of the splits, holding their COCO "
+        "files, within the dataset dir",
+    )
+    parser.add_argument(
+        "--shards-dir",
+        help="Directory the stores are written to, one directory per split. Defaults "
+        "to the images dir.",
+    )
+    parser.add_argument("--num-workers", type=int, default=NUM_WORKERS)
+    args = parser.parse_args()
+
+    images_dir = Path(
+        args.images_dir
+        or (
+            Path(args.dataset_dir)
+            / "bdd100k_images_100k"
+            / "bdd100k"
+            / "images"
+            / "100k"
+        )
+    )
+    shards_dir = Path(args.shards_dir or images_dir)
+    for split in args.splits:
+        start = time.perf_counter()
+        store = ImageShardStore(
+            images_dir / split / COCO_FILENAME,
+            images_dir / split,
+            shards_dir / f"{split}_shards",
+        )
+        if store.is_valid():
+            print(f"{split}: the image shards are up to date")
+            continue
+        images = store.build(args.num_workers)
+        print(f"{split}: stored {images} images in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
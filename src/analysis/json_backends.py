@@ -0,0 +1,158 @@
+"""
+File containing the parser layer used to read the BDD label files.
+
+Two kinds of backends are supported. The ijson backends stream the label objects
+from a binary file handle with constant memory, the fastest one being the yajl2_c
+C extension. The orjson and simdjson backends memory map the file and parse it in
+one go, which is considerably faster but needs enough RAM to hold every parsed
+object. orjson and pysimdjson are not installed by default and are only used when
+they are available.
+"""
+
+import mmap
+import os
+from collections.abc import Iterator
+from pathlib import Path
+
+import ijson
+
+from analysis.label_sharding import ShardReader
+
+# ijson backends, from fastest to slowest
+IJSON_BACKENDS = ["yajl2_c", "yajl2_cffi", "yajl2", "python"]
+# Backends parsing the whole (memory mapped) file at once, from fastest to slowest
+IN_MEMORY_BACKENDS = ["orjson", "simdjson"]
+# Rough ratio between the memory used by the parsed objects and the size of the file
+IN_MEMORY_EXPANSION = 10
+
+
+def get_available_memory() -> int:
+    """
+    Returns the amount of physical memory currently available, in bytes
+
+    :return: Available memory, or 0 if it cannot be determined on this platform
+    :rtype: int
+    """
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return 0
+
+
+def is_backend_available(backend: str) -> bool:
+    """
+    Checks whether a backend can be used in the current environment
+
+    :param backend: Name of the backend
+    :type backend: str
+    :return: True if the backend (and the library it depends on) is installed
+    :rtype: bool
+    """
+    if backend in IJSON_BACKENDS:
+        try:
+            ijson.get_backend(backend)
+        except ImportError:
+            return False
+        return True
+    if backend in IN_MEMORY_BACKENDS:
+        try:
+            __import__(backend)
+        except ImportError:
+            return False
+        return True
+    raise ValueError(f"Unknown JSON backend: {backend}")
+
+
+def get_available_backends() -> list[str]:
+    """
+    Lists the backends that can be used in the current environment, fastest first
+
+    :return: Names of the available backends
+    :rtype: list[str]
+    """
+    return [
+        backend
+        for backend in IN_MEMORY_BACKENDS + IJSON_BACKENDS
+        if is_backend_available(backend)
+    ]
+
+
+def select_backend(label_file: Path, backend: str = "auto") -> str:
+    """
+    Chooses the backend used to parse a label file. With "auto", an in-memory backend
+    is only chosen if the parsed file fits comfortably in the available memory,
+    otherwise the fastest available ijson backend streams the file.
+
+    :param label_file: Path to the BDD label file
+    :type label_file: Path
+    :param backend: Name of a backend, or "auto"
+    :type backend: str
+    :return: Name of the backend to use
+    :rtype: str
+    """
+    if backend != "auto":
+        if not is_backend_available(backend):
+            raise ImportError(f"JSON backend {backend} is not installed")
+        return backend
+    available = get_available_backends()
+    file_size = os.path.getsize(label_file)
+    if file_size * IN_MEMORY_EXPANSION < get_available_memory():
+        for in_memory_backend in IN_MEMORY_BACKENDS:
+            if in_memory_backend in available:
+                return in_memory_backend
+    return next(b for b in IJSON_BACKENDS if b in available)
+
+
+def load_json(data: bytes | memoryview, backend: str) -> list[dict]:
+    """
+    Parses a JSON document held in memory with an in-memory backend
+
+    :param data: The JSON document
+    :type data: bytes | memoryview
+    :param backend: Name of the in-memory backend, orjson or simdjson
+    :type backend: str
+    :return: The parsed document
+    :rtype: list[dict]
+    """
+    if backend == "orjson":
+        import orjson
+
+        return orjson.loads(data)
+    import simdjson
+
+    return simdjson.loads(bytes(data))
+
+
+def iter_label_objects(
+    label_file: Path, backend: str, start: int | None = None, end: int | None = None
+) -> Iterator[dict]:
+    """
+    Yields the label objects of a file, or of the byte range [start, end) of a file,
+    using the given backend. Non-integer numbers are returned as floats.
+
+    :param label_file: Path to the BDD label file
+    :type label_file: Path
+    :param backend: Name of the backend, as returned by select_backend
+    :type backend: str
+    :param start: Offset of the first element of a shard, or None for the whole file
+    :type start: int
+    :param end: Offset one past the last element of a shard, or None for the whole file
+    :type end: int
+    :return: An iterator over the label objects
+    :rtype: Iterator[dict]
+    """
+    with open(label_file, "rb") as f:
+        if backend in IJSON_BACKENDS:
+            source = f if start is None else ShardReader(f, start, end)
+            parser = ijson.get_backend(backend)
+            yield from parser.items(source, "item", use_float=True)
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if start is None:
+                # The view is released before the map is closed, even if parsing fails
+                with memoryview(mapped) as data:
+                    objects = load_json(data, backend)
+            else:
+                objects = load_json(b"[" + mapped[start:end] + b"]", backend)
+    yield from objects
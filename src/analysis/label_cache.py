@@ -0,0 +1,335 @@
+"""
+File containing the LabelCache class, a binary columnar copy of a BDD label file.
+
+The cache holds two Arrow IPC files per split. The image table has one row per image
+(name, weather, scene, timeofday) and the box table one row per bounding box of the
+10 categories (image index, label id, category id, x1, y1, x2, y2, occluded,
+truncated, traffic light color). The files are memory mapped when loaded, so reading
+them takes milliseconds instead of the minutes needed to parse the JSON file. The
+cache is rebuilt whenever the fingerprint of the label file changes.
+"""
+
+import json
+import multiprocessing
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+
+from analysis.box_batch import IMAGES_PER_BATCH, BoxBatch, BoxBatchBuilder
+from analysis.fingerprints import fingerprint_file, fingerprint_matches
+from analysis.json_backends import iter_label_objects, select_backend
+from analysis.label_sharding import find_shard_ranges
+from config import LABEL_CACHE_DIR
+
+# Bump this whenever the layout of the tables changes to invalidate old caches
+CACHE_VERSION = 1
+DICTIONARY_COLUMNS = ["weather", "scene", "timeofday", "traffic_light_color"]
+IMAGE_SCHEMA = pa.schema(
+    [
+        ("name", pa.string()),
+        ("weather", pa.string()),
+        ("scene", pa.string()),
+        ("timeofday", pa.string()),
+    ]
+)
+BOX_SCHEMA = pa.schema(
+    [
+        ("image_index", pa.int32()),
+        ("label_id", pa.int64()),
+        ("category", pa.int8()),
+        ("x1", pa.float64()),
+        ("y1", pa.float64()),
+        ("x2", pa.float64()),
+        ("y2", pa.float64()),
+        ("occluded", pa.bool_()),
+        ("truncated", pa.bool_()),
+        ("traffic_light_color", pa.string()),
+    ]
+)
+
+
+def batch_to_tables(batch: BoxBatch, image_offset: int) -> tuple[pa.Table, pa.Table]:
+    """
+    Converts a batch of labels into an image table and a box table
+
+    :param batch: The labels of a chunk of images
+    :type batch: BoxBatch
+    :param image_offset: Index of the first image of the batch within the label file
+    :type image_offset: int
+    :return: The image table and the box table of the batch
+    :rtype: tuple[Table, Table]
+    """
+    images = pa.table(
+        {
+            "name": batch.image_names,
+            "weather": batch.weather,
+            "scene": batch.scene,
+            "timeofday": batch.timeofday,
+        },
+        schema=IMAGE_SCHEMA,
+    )
+    boxes = pa.table(
+        {
+            "image_index": (batch.image_index + image_offset).astype(np.int32),
+            "label_id": batch.label_id,
+            "category": batch.category,
+            "x1": batch.boxes[:, 0],
+            "y1": batch.boxes[:, 1],
+            "x2": batch.boxes[:, 2],
+            "y2": batch.boxes[:, 3],
+            "occluded": batch.occluded,
+            "truncated": batch.truncated,
+            "traffic_light_color": batch.traffic_light_color,
+        },
+        schema=BOX_SCHEMA,
+    )
+    return images, boxes
+
+
+def build_tables(
+    label_file: Path,
+    json_backend: str,
+    start: int | None = None,
+    end: int | None = None,
+) -> tuple[pa.Table, pa.Table]:
+    """
+    Parses a label file, or the byte range [start, end) of one, into the cache tables.
+    Image indices start at zero for every range.
+
+    :param label_file: Path to the BDD label file
+    :type label_file: Path
+    :param json_backend: Name of the JSON parser backend
+    :type json_backend: str
+    :param start: Offset of the first element of a shard, or None for the whole file
+    :type start: int | None
+    :param end: Offset one past the last element of a shard, or None for the whole file
+    :type end: int | None
+    :return: The image table and the box table
+    :rtype: tuple[Table, Table]
+    """
+    batch_builder = BoxBatchBuilder()
+    image_tables, box_tables = [], []
+    image_count = 0
+    for object in iter_label_objects(label_file, json_backend, start, end):
+        batch_builder.add_object(object)
+        if batch_builder.image_count >= IMAGES_PER_BATCH:
+            images, boxes = batch_to_tables(batch_builder.build(), image_count)
+            image_tables.append(images)
+            box_tables.append(boxes)
+            image_count += len(images)
+    images, boxes = batch_to_tables(batch_builder.build(), image_count)
+    image_tables.append(images)
+    box_tables.append(boxes)
+    return pa.concat_tables(image_tables), pa.concat_tables(box_tables)
+
+
+def concat_shard_tables(
+    shards: list[tuple[pa.Table, pa.Table]],
+) -> tuple[pa.Table, pa.Table]:
+    """
+    Concatenates the tables of consecutive parts of a label file, shifting the image
+    indices of every part by the number of images before it
+
+    :param shards: The image table and the box table of every part, in file order
+    :type shards: list[tuple[Table, Table]]
+    :return: The image table and the box table of the whole file
+    :rtype: tuple[Table, Table]
+    """
+    image_tables, box_tables = [], []
+    image_count = 0
+    for images, boxes in shards:
+        image_index = pa.array(
+            boxes.column("image_index").to_numpy() + image_count, pa.int32()
+        )
+        boxes = boxes.set_column(0, "image_index", image_index)
+        image_tables.append(images)
+        box_tables.append(boxes)
+        image_count += len(images)
+    return pa.concat_tables(image_tables), pa.concat_tables(box_tables)
+
+
+def write_table(table: pa.Table, path: Path) -> None:
+    """
+    Writes a table as a single chunk Arrow IPC file, dictionary encoding the string
+    attribute columns. The file is written next to its destination and then renamed,
+    so a reader never sees a partially written file.
+
+    :param table: The table to write
+    :type table: Table
+    :param path: Destination of the file
+    :type path: Path
+    """
+    table = table.combine_chunks()
+    for column in DICTIONARY_COLUMNS:
+        if column in table.column_names:
+            index = table.schema.get_field_index(column)
+            table = table.set_column(
+                index, column, table.column(column).dictionary_encode()
+            )
+    temporary_path = path.with_suffix(".tmp")
+    with (
+        pa.OSFile(str(temporary_path), "wb") as sink,
+        pa.ipc.new_file(sink, table.schema) as writer,
+    ):
+        writer.write_table(table)
+    temporary_path.replace(path)
+
+
+def read_table(path: Path) -> pa.Table:
+    """
+    Memory maps an Arrow IPC file written by write_table
+
+    :param path: Path to the file
+    :type path: Path
+    :return: A table whose buffers point into the memory mapped file
+    :rtype: Table
+    """
+    return pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+
+
+class LabelCache:
+    """
+    A class managing the binary columnar cache of the labels of one split
+    """
+
+    def __init__(
+        self, split_name: str, label_file: Path, cache_dir: str = LABEL_CACHE_DIR
+    ) -> None:
+        """
+        Initializes the cache of a split. Nothing is read or built yet.
+
+        :param split_name: The name of the split, i.e., train or val
+        :type split_name: str
+        :param label_file: Path to the BDD label file the cache is built from
+        :type label_file: Path
+        :param cache_dir: Directory holding the caches of every split
+        :type cache_dir: str
+        """
+        self.split = split_name
+        self.label_file = Path(label_file)
+        self.directory = Path(cache_dir) / split_name
+        self.images_path = self.directory / "images.arrow"
+        self.boxes_path = self.directory / "boxes.arrow"
+        self.metadata_path = self.directory / "metadata.json"
+
+    def is_valid(self) -> bool:
+        """
+        Checks whether the cache exists and was built from the current label file
+
+        :return: True if the cache can be used as is
+        :rtype: bool
+        """
+        if not (
+            self.metadata_path.exists()
+            and self.images_path.exists()
+            and self.boxes_path.exists()
+        ):
+            return False
+        metadata = json.loads(self.metadata_path.read_text())
+        return metadata.get("version") == CACHE_VERSION and fingerprint_matches(
+            self.label_file, metadata.get("source")
+        )
+
+    def build(self, json_backend: str = "auto", num_workers: int = 1) -> str:
+        """
+        Parses the label file and (re)writes the cache
+
+        :param json_backend: Name of the JSON parser backend, or "auto"
+        :type json_backend: str
+        :param num_workers: Number of processes used to parse the label file
+        :type num_workers: int
+        :return: The name of the JSON parser backend that was used
+        :rtype: str
+        """
+        json_backend = select_backend(self.label_file, json_backend)
+        fingerprint = fingerprint_file(self.label_file)
+        if num_workers > 1:
+            shard_ranges = find_shard_ranges(self.label_file, num_workers)
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(
+                max(len(shard_ranges), 1), mp_context=context
+            ) as pool:
+                futures = [
+                    pool.submit(
+                        build_tables, self.label_file, json_backend, *shard_range
+                    )
+                    for shard_range in shard_ranges
+                ]
+                shards = [future.result() for future in futures]
+            images, boxes = concat_shard_tables(shards)
+        else:
+            images, boxes = build_tables(self.label_file, json_backend)
+        self.write(images, boxes, fingerprint)
+        return json_backend
+
+    def write(self, images: pa.Table, boxes: pa.Table, fingerprint: dict) -> None:
+        """
+        (Re)writes the cache from the tables of the whole label file. The metadata is
+        removed first and written last, so the cache is only valid once complete.
+
+        :param images: The image table
+        :type images: Table
+        :param boxes: The box table, with image indices into the image table
+        :type boxes: Table
+        :param fingerprint: Fingerprint of the label file, taken before it was parsed
+        :type fingerprint: dict
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.metadata_path.unlink(missing_ok=True)
+        write_table(images, self.images_path)
+        write_table(boxes, self.boxes_path)
+        metadata = {
+            "version": CACHE_VERSION,
+            "source": fingerprint,
+            "images": len(images),
+            "boxes": len(boxes),
+        }
+        self.metadata_path.write_text(json.dumps(metadata, indent=2))
+
+    def load(self) -> tuple[pa.Table, pa.Table]:
+        """
+        Memory maps the image and box tables, building the cache first if needed
+
+        :return: The image table and the box table
+        :rtype: tuple[Table, Table]
+        """
+        if not self.is_valid():
+            self.build()
+        return read_table(self.images_path), read_table(self.boxes_path)
+
+    def iter_batches(
+        self, images_per_batch: int = IMAGES_PER_BATCH
+    ) -> Iterator[BoxBatch]:
+        """
+        Yields the cached labels as BoxBatch objects of images_per_batch images
+
+        :param images_per_batch: Number of images in every batch
+        :type images_per_batch: int
+        :return: An iterator over the batches, in file order
+        :rtype: Iterator[BoxBatch]
+        """
+        images, boxes = self.load()
+        image_index = boxes.column("image_index").to_numpy()
+        for first in range(0, len(images), images_per_batch):
+            last = min(first + images_per_batch, len(images))
+            start, end = np.searchsorted(image_index, [first, last])
+            batch_images = images.slice(first, last - first)
+            batch_boxes = boxes.slice(start, end - start)
+            yield BoxBatch(
+                batch_images.column("name").to_pylist(),
+                batch_images.column("weather").to_pylist(),
+                batch_images.column("scene").to_pylist(),
+                batch_images.column("timeofday").to_pylist(),
+                image_index[start:end].astype(np.int64) - first,
+                batch_boxes.column("label_id").to_numpy(),
+                batch_boxes.column("category").to_numpy(),
+                np.column_stack(
+                    [batch_boxes.column(c).to_numpy() for c in ("x1", "y1", "x2", "y2")]
+                ),
+                batch_boxes.column("occluded").to_numpy(),
+                batch_boxes.column("truncated").to_numpy(),
+                batch_boxes.column("traffic_light_color").to_pylist(),
+            )
@@ -0,0 +1,441 @@
+"""
+File containing the label pipeline, which parses the label file of a split once and
+hands every batch of labels to a list of sinks.
+
+A sink consumes BoxBatch objects with add_batch and writes its outputs with save. When
+the label file is parsed by several processes, every process feeds its own empty copy
+of the sinks with one shard of the file, and the copies are merged back in file order,
+so the outputs do not depend on the number of processes. The sinks are:
+
+    SceneStatisticsSink: scene attribute counts and category counts per scene
+    CategoryStatisticsSink: category statistics, records, area cube, anomalies and
+        geometry issues
+    CocoExportSink: COCO detection file of the split
+    LabelCacheSink: binary columnar cache of the labels
+"""
+
+import multiprocessing
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+from analysis.anomaly_rules import AnomalyRuleSet
+from analysis.box_batch import IMAGES_PER_BATCH, BoxBatch, BoxBatchBuilder
+from analysis.category_statistics import CategoryStatistics
+from analysis.coco_export import CocoWriter, get_coco_boxes
+from analysis.fingerprints import fingerprint_file
+from analysis.json_backends import iter_label_objects, select_backend
+from analysis.label_cache import LabelCache, batch_to_tables, concat_shard_tables
+from analysis.label_sharding import find_shard_ranges
+from analysis.progress import ProgressReporter
+from analysis.scene_statistics import SceneStatistics
+from config import CSV_DIR
+
+
+class LabelSink:
+    """
+    Base class of the consumers of the labels of a split
+    """
+
+    def add_batch(self, batch: BoxBatch) -> None:
+        """
+        Consumes the labels of the next chunk of images
+
+        :param batch: The labels of a chunk of images, with at least one image
+        :type batch: BoxBatch
+        """
+        raise NotImplementedError
+
+    def merge(self, other: "LabelSink") -> None:
+        """
+        Merges a sink of the same kind fed with the labels following this sink's
+
+        :param other: The sink to merge
+        :type other: LabelSink
+        """
+        raise NotImplementedError
+
+    def save(self) -> None:
+        """
+        Writes the outputs of the sink
+        """
+        raise NotImplementedError
+
+
+class SceneStatisticsSink(LabelSink):
+    """
+    A sink computing the scene statistics of a split
+    """
+
+    def __init__(self, split_name: str, output_dir: str = CSV_DIR) -> None:
+        """
+        Initializes the sink
+
+        :param split_name: The name of the split, i.e., train or val
+        :type split_name: str
+        :param output_dir: Directory the statistics are saved to
+        :type output_dir: str
+        """
+        self.statistics = SceneStatistics(split_name, output_dir)
+
+    def add_batch(self, batch: BoxBatch) -> None:
+        """
+        Counts the scene attributes and the categories per scene of a batch
+
+        :param batch: The labels of a chunk of images
+        :type batch: BoxBatch
+        """
+        for attribute in ("weather", "scene", "timeofday"):
+            self.statistics.update_stats_counts(attribute, getattr(batch, attribute))
+        self.statistics.add_batch(batch)
+
+    def merge(self, other: "SceneStatisticsSink") -> None:
+        """
+        Adds the counts of a sink fed with the following labels
+
+        :param other: The sink to merge
+        :type other: SceneStatisticsSink
+        """
+        self.statistics.merge(other.statistics)
+
+    def save(self) -> None:
+        """
+        Saves the scene statistics as csv files and the category tensor
+        """
+        self.statistics.save_csvs()
+        self.statistics.save_category_distribution_csv()
+        self.statistics.save_category_tensor()
+
+
+class CategoryStatisticsSink(LabelSink):
+    """
+    A sink computing the category statistics of a split and flagging its anomalies
+    """
+
+    def __init__(
+        self,
+        split_name: str,
+        output_dir: str = CSV_DIR,
+        output_format: str = "parquet",
+        rule_set: AnomalyRuleSet | None = None,
+    ) -> None:
+        """
+        Initializes the sink
+
+        :param split_name: The name of the split, i.e., train or val
+        :type split_name: str
+        :param output_dir: Directory the statistics are saved to
+        :type output_dir: str
+        :param output_format: Format of the records and anomalies, parquet or csv
+        :type output_format: str
+        :param rule_set: The rules flagging the anomalies, the default rules if None
+        :type rule_set: AnomalyRuleSet | None
+        """
+        self.statistics = CategoryStatistics(split_name, output_dir, rule_set)
+        self.output_format = output_format
+
+    def add_batch(self, batch: BoxBatch) -> None:
+        """
+        Updates the category statistics and the anomalies with a batch
+
+        :param batch: The labels of a chunk of images
+        :type batch: BoxBatch
+        """
+        self.statistics.add_batch(batch)
+
+    def merge(self, other: "CategoryStatisticsSink") -> None:
+        """
+        Merges the statistics of a sink fed with the following labels
+
+        :param other: The sink to merge
+        :type other: CategoryStatisticsSink
+        """
+        self.statistics.merge(other.statistics)
+
+    def save(self) -> None:
+        """
+        Saves the statistics, records, anomalies, area cube and geometry issues
+        """
+        self.statistics.save_stats_csv()
+        self.statistics.save_records(self.output_format)
+        self.statistics.save_anomalies(self.output_format)
+        self.statistics.save_area_cube()
+        self.statistics.save_issues_csv()
+
+
+class CocoExportSink(LabelSink):
+    """
+    A sink converting the labels of a split to a COCO detection file. The boxes of a
+    batch are converted at once, and only the boxes kept for the COCO file are held
+    until it is written.
+    """
+
+    def __init__(self, output_file: Path) -> None:
+        """
+        Initializes the sink
+
+        :param output_file: Path to the COCO file
+        :type output_file: Path
+        """
+        self.output_file = Path(output_file)
+        self.image_names = []
+        # Position of the image of every kept box, relative to the first image of
+        # the sink, with its category and COCO box
+        self.image_index = []
+        self.category = []
+        self.bboxes = []
+
+    def add_batch(self, batch: BoxBatch) -> None:
+        """
+        Converts the boxes of a batch and keeps the valid ones
+
+        :param batch: The labels of a chunk of images
+        :type batch: BoxBatch
+        """
+        bboxes, keep = get_coco_boxes(batch.boxes)
+        self.image_index.append(batch.image_index[keep] + len(self.image_names))
+        self.category.append(batch.category[keep])
+        self.bboxes.append(bboxes[keep])
+        self.image_names.extend(batch.image_names)
+
+    def merge(self, other: "CocoExportSink") -> None:
+        """
+        Appends the boxes of a sink fed with the following labels
+
+        :param other: The sink to merge
+        :type other: CocoExportSink
+        """
+        self.image_index.extend(
+            image_index + len(self.image_names) for image_index in other.image_index
+        )
+        self.category.extend(other.category)
+        self.bboxes.extend(other.bboxes)
+        self.image_names.extend(other.image_names)
+
+    def save(self) -> None:
+        """
+        Writes the COCO file, with the images that have at least one valid box. The
+        images keep their position in the label file as id.
+        """
+        image_index = np.concatenate(self.image_index + [np.empty(0, np.int64)])
+        category = np.concatenate(self.category + [np.empty(0, np.int8)])
+        bboxes = np.concatenate(self.bboxes + [np.empty((0, 4))])
+        offsets = np.searchsorted(image_index, np.arange(len(self.image_names) + 1))
+        with CocoWriter(self.output_file) as writer:
+            for image_id in np.flatnonzero(np.diff(offsets)).tolist():
+                start, stop = offsets[image_id], offsets[image_id + 1]
+                writer.add_image(
+                    image_id,
+                    self.image_names[image_id],
+                    category[start:stop].tolist(),
+                    bboxes[start:stop].tolist(),
+                )
+
+
+class LabelCacheSink(LabelSink):
+    """
+    A sink writing the binary columnar cache of the labels of a split
+    """
+
+    def __init__(self, label_cache: LabelCache) -> None:
+        """
+        Initializes the sink. The label file is fingerprinted before it is parsed, so
+        a change during the parse invalidates the cache.
+
+        :param label_cache: The cache to (re)write
+        :type label_cache: LabelCache
+        """
+        self.label_cache = label_cache
+        self.fingerprint = fingerprint_file(label_cache.label_file)
+        # Image and box tables of every batch, with image indices relative to the batch
+        self.tables = []
+
+    def add_batch(self, batch: BoxBatch) -> None:
+        """
+        Converts a batch to cache tables
+
+        :param batch: The labels of a chunk of images
+        :type batch: BoxBatch
+        """
+        self.tables.append(batch_to_tables(batch, 0))
+
+    def merge(self, other: "LabelCacheSink") -> None:
+        """
+        Appends the tables of a sink fed with the following labels
+
+        :param other: The sink to merge
+        :type other: LabelCacheSink
+        """
+        self.tables.extend(other.tables)
+
+    def save(self) -> None:
+        """
+        Writes the cache
+        """
+        images, boxes = concat_shard_tables(self.tables)
+        self.label_cache.write(images, boxes, self.fingerprint)
+
+
+def add_batch(sinks: list[LabelSink], batch: BoxBatch) -> None:
+    """
+    Hands a batch to every sink
+
+    :param sinks: The sinks
+    :type sinks: list[LabelSink]
+    :param batch: The labels of a chunk of images
+    :type batch: BoxBatch
+    """
+    for sink in sinks:
+        sink.add_batch(batch)
+
+
+def add_objects(
+    sinks: list[LabelSink],
+    objects: Iterable[dict],
+    progress: ProgressReporter | None = None,
+) -> int:
+    """
+    Collects label objects into batches of IMAGES_PER_BATCH images and hands every
+    batch to the sinks
+
+    :param sinks: The sinks
+    :type sinks: list[LabelSink]
+    :param objects: The label objects of the images, as read from the JSON file
+    :type objects: Iterable[dict]
+    :param progress: Reporter notified of every image, or None
+    :type progress: ProgressReporter | None
+    :return: Number of images
+    :rtype: int
+    """
+    batch_builder = BoxBatchBuilder()
+    image_count = 0
+    for object in objects:
+        batch_builder.add_object(object)
+        image_count += 1
+        if batch_builder.image_count >= IMAGES_PER_BATCH:
+            add_batch(sinks, batch_builder.build())
+        if progress is not None:
+            progress.advance()
+    if batch_builder.image_count:
+        add_batch(sinks, batch_builder.build())
+    return image_count
+
+
+def parse_shard(
+    label_file: Path,
+    json_backend: str,
+    start: int,
+    end: int,
+    sinks: list[LabelSink],
+) -> tuple[list[LabelSink], int]:
+    """
+    Feeds empty sinks with one byte-range shard of a label file. This runs inside of a
+    worker process.
+
+    :param label_file: Path to the BDD label file
+    :type label_file: Path
+    :param json_backend: Name of the JSON parser backend
+    :type json_backend: str
+    :param start: Offset of the first byte of the shard
+    :type start: int
+    :param end: Offset one past the last byte of the shard
+    :type end: int
+    :param sinks: Empty sinks, copied to the worker process
+    :type sinks: list[LabelSink]
+    :return: The sinks fed with the shard and the number of images
+    :rtype: tuple[list[LabelSink], int]
+    """
+    image_count = add_objects(
+        sinks, iter_label_objects(label_file, json_backend, start, end)
+    )
+    return sinks, image_count
+
+
+class LabelPipeline:
+    """
+    A class parsing the label file of a split once and handing its labels to sinks
+    """
+
+    def __init__(self, label_file: Path, sinks: list[LabelSink]) -> None:
+        """
+        Initializes the pipeline
+
+        :param label_file: Path to the BDD label file
+        :type label_file: Path
+        :param sinks: Empty sinks consuming the labels
+        :type sinks: list[LabelSink]
+        """
+        self.label_file = Path(label_file)
+        self.sinks = sinks
+
+    def run(
+        self,
+        json_backend: str = "auto",
+        num_workers: int = 1,
+        progress: ProgressReporter | None = None,
+    ) -> str:
+        """
+        Parses the label file and feeds the sinks. With more than one worker, the file
+        is split into shards that are parsed in parallel.
+
+        :param json_backend: Name of the JSON parser backend, or "auto"
+        :type json_backend: str
+        :param num_workers: Number of processes used to parse the label file
+        :type num_workers: int
+        :param progress: Reporter notified of the parsed images, or None
+        :type progress: ProgressReporter | None
+        :return: The name of the JSON parser backend that was used
+        :rtype: str
+        """
+        json_backend = select_backend(self.label_file, json_backend)
+        if num_workers <= 1:
+            add_objects(
+                self.sinks, iter_label_objects(self.label_file, json_backend), progress
+            )
+            return json_backend
+
+        shard_ranges = find_shard_ranges(self.label_file, num_workers)
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max(len(shard_ranges), 1), mp_context=context) as pool:
+            futures = [
+                pool.submit(
+                    parse_shard, self.label_file, json_backend, *shard_range, self.sinks
+                )
+                for shard_range in shard_ranges
+            ]
+            for future in as_completed(futures):
+                if progress is not None:
+                    progress.advance(future.result()[1])
+        # Merge the shards in file order so the outputs match the serial path
+        for future in futures:
+            shard_sinks, _ = future.result()
+            for sink, shard_sink in zip(self.sinks, shard_sinks):
+                sink.merge(shard_sink)
+        return json_backend
+
+    def add_batches(
+        self, batches: Iterable[BoxBatch], progress: ProgressReporter | None = None
+    ) -> None:
+        """
+        Feeds the sinks with labels that were already parsed, e.g. from a label cache
+
+        :param batches: The batches of labels, in file order
+        :type batches: Iterable[BoxBatch]
+        :param progress: Reporter notified of the images of every batch, or None
+        :type progress: ProgressReporter | None
+        """
+        for batch in batches:
+            if not batch.image_names:
+                continue
+            add_batch(self.sinks, batch)
+            if progress is not None:
+                progress.advance(len(batch.image_names))
+
+    def save(self) -> None:
+        """
+        Writes the outputs of every sink
+        """
+        for sink in self.sinks:
+            sink.save()
@@ -0,0 +1,145 @@
+"""
+File containing helpers for splitting a BDD label file into byte-range shards
+"""
+
+from pathlib import Path
+from typing import BinaryIO
+
+import numpy as np
+
+# Size of the blocks read from disk while scanning for element boundaries
+SCAN_BLOCK_SIZE = 16 * 1024 * 1024
+
+QUOTE = ord('"')
+BACKSLASH = ord("\\")
+OPENING_BRACKETS = (ord("{"), ord("["))
+CLOSING_BRACKETS = (ord("}"), ord("]"))
+
+
+def find_element_boundaries(label_file: Path) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Scans a JSON file containing a top-level array and returns the byte offsets
+    where each element of that array starts and ends. Brackets inside of strings
+    (including escaped quotes) are ignored, so the offsets are exact.
+
+    :param label_file: Path to the BDD label file
+    :type label_file: Path
+    :return: Start offsets (inclusive) and end offsets (exclusive) of every element
+    :rtype: tuple[ndarray, ndarray]
+    """
+    starts, ends = [np.empty(0, dtype=np.intp)], [np.empty(0, dtype=np.intp)]
+    depth = 0
+    in_string = 0
+    backslash_run = 0
+    offset = 0
+    with open(label_file, "rb") as f:
+        while block := f.read(SCAN_BLOCK_SIZE):
+            data = np.frombuffer(block, dtype=np.uint8)
+            quotes = np.flatnonzero(data == QUOTE)
+
+            # A quote preceded by an odd number of backslashes is escaped
+            is_backslash = data == BACKSLASH
+            if len(quotes) and (backslash_run or is_backslash.any()):
+                positions = np.arange(len(data))
+                last_other = np.maximum.accumulate(
+                    np.where(is_backslash, -1, positions)
+                )
+                before = np.maximum(quotes - 1, 0)
+                run = np.where(
+                    last_other[before] == -1,
+                    quotes + backslash_run,
+                    quotes - 1 - last_other[before],
+                )
+                run[quotes == 0] = backslash_run
+                quotes = quotes[run % 2 == 0]
+
+            # Only brackets outside of strings change the nesting depth
+            brackets = np.flatnonzero(
+                np.isin(data, OPENING_BRACKETS + CLOSING_BRACKETS)
+            )
+            quotes_before = np.searchsorted(quotes, brackets)
+            brackets = brackets[(quotes_before + in_string) % 2 == 0]
+            steps = np.where(np.isin(data[brackets], OPENING_BRACKETS), 1, -1)
+            depths = depth + np.cumsum(steps)
+
+            starts.append(brackets[(steps == 1) & (depths == 2)] + offset)
+            ends.append(brackets[(steps == -1) & (depths == 1)] + offset + 1)
+
+            if len(depths):
+                depth = int(depths[-1])
+            in_string = (in_string + len(quotes)) % 2
+            trailing = np.flatnonzero(~is_backslash)
+            if len(trailing):
+                backslash_run = len(data) - 1 - int(trailing[-1])
+            else:
+                backslash_run += len(data)
+            offset += len(data)
+
+    return np.concatenate(starts), np.concatenate(ends)
+
+
+def find_shard_ranges(label_file: Path, num_shards: int) -> list[tuple[int, int]]:
+    """
+    Splits a label file into at most num_shards byte ranges of roughly equal size.
+    Every range starts and ends on a top-level array element boundary.
+
+    :param label_file: Path to the BDD label file
+    :type label_file: Path
+    :param num_shards: The desired number of shards
+    :type num_shards: int
+    :return: A list of (start, end) byte offsets, in file order
+    :rtype: list[tuple[int, int]]
+    """
+    starts, ends = find_element_boundaries(label_file)
+    if not len(starts):
+        return []
+    targets = np.linspace(starts[0], ends[-1], num_shards + 1)[1:-1]
+    cuts = np.unique(np.searchsorted(starts, targets))
+    cuts = cuts[(cuts > 0) & (cuts < len(starts))]
+    first = np.concatenate(([0], cuts))
+    last = np.concatenate((cuts, [len(starts)])) - 1
+    return [(int(starts[i]), int(ends[j])) for i, j in zip(first, last)]
+
+
+class ShardReader:
+    """
+    A read-only binary file object exposing a byte range of a label file as a
+    standalone JSON array, so that it can be streamed with ijson
+    """
+
+    def __init__(self, file: BinaryIO, start: int, end: int) -> None:
+        """
+        Positions the label file at the start of the shard
+
+        :param file: The label file, opened in binary mode
+        :type file: BinaryIO
+        :param start: Offset of the first byte of the shard
+        :type start: int
+        :param end: Offset one past the last byte of the shard
+        :type end: int
+        """
+        self.file = file
+        self.file.seek(start)
+        self.remaining = end - start
+        self.pending = b"["
+        self.closed_array = False
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Reads up to size bytes of the shard, wrapped in array brackets
+
+        :param size: Maximum number of bytes to return, or -1 for everything
+        :type size: int
+        :return: The next bytes of the shard
+        :rtype: bytes
+        """
+        if size < 0:
+            size = self.remaining + 2
+        chunk = self.file.read(min(size, self.remaining))
+        self.remaining -= len(chunk)
+        if not self.remaining and not self.closed_array:
+            chunk += b"]"
+            self.closed_array = True
+        chunk = self.pending + chunk
+        self.pending = chunk[size:]
+        return chunk[:size]
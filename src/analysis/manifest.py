@@ -0,0 +1,145 @@
+"""
+File containing the AnalysisManifest class, which records what the outputs in the
+CSV directory were computed from so that only outdated splits are recomputed.
+
+For every split the manifest stores the fingerprint of its label file, the version
+of the analysis code and the fingerprint of every output file. A split is up to date
+only if all three still match. The entry of a split is removed before its outputs are
+rewritten and added back once all of them have been written, so an interrupted run
+leaves the split marked as outdated.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+import config
+from analysis.fingerprints import fingerprint_file, fingerprint_matches
+from config import CSV_DIR
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def get_code_version() -> str:
+    """
+    Returns a hash of the source code of the analysis package and of the config, which
+    changes whenever the way the outputs are computed may have changed
+
+    :return: The hex digest of the analysis source files and of the config
+    :rtype: str
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    source_files = sorted(Path(__file__).parent.glob("*.py"))
+    for source_file in source_files + [Path(config.__file__)]:
+        digest.update(source_file.name.encode())
+        digest.update(source_file.read_bytes())
+    return digest.hexdigest()
+
+
+class AnalysisManifest:
+    """
+    A class managing the manifest of the outputs of the dataset analysis
+    """
+
+    def __init__(self, output_dir: str = CSV_DIR) -> None:
+        """
+        Reads the manifest of an output directory, if there is a valid one
+
+        :param output_dir: Directory holding the outputs of the analysis
+        :type output_dir: str
+        """
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir / MANIFEST_FILENAME
+        self.splits = {}
+        try:
+            self.splits = json.loads(self.path.read_text())["splits"]
+        except (OSError, ValueError, KeyError, TypeError):
+            # A missing or corrupt manifest marks every split as outdated
+            pass
+
+    def get_output_files(self, split_name: str) -> list[Path]:
+        """
+        Lists the output files of a split currently in the output directory
+
+        :param split_name: The name of the split, i.e., train or val
+        :type split_name: str
+        :return: Paths of the output files, sorted by name
+        :rtype: list[Path]
+        """
+        return sorted(self.output_dir.glob(f"*_{split_name}.*"))
+
+    def is_up_to_date(
+        self, split_name: str, label_file: Path, output_format: str = "parquet"
+    ) -> bool:
+        """
+        Checks whether the outputs of a split can be reused. If the label file is not
+        available, the outputs are kept as long as they are complete.
+
+        :param split_name: The name of the split, i.e., train or val
+        :type split_name: str
+        :param label_file: Path to the BDD label file of the split
+        :type label_file: Path
+        :param output_format: Format the records and anomalies are expected in
+        :type output_format: str
+        :return: True if the split does not need to be recomputed
+        :rtype: bool
+        """
+        entry = self.splits.get(split_name)
+        if (
+            not entry
+            or entry.get("code_version") != get_code_version()
+            or entry.get("output_format") != output_format
+        ):
+            return False
+        if Path(label_file).exists() and not fingerprint_matches(
+            label_file, entry.get("labels")
+        ):
+            return False
+        outputs = entry.get("outputs", {})
+        return bool(outputs) and all(
+            fingerprint_matches(self.output_dir / name, fingerprint)
+            for name, fingerprint in outputs.items()
+        )
+
+    def invalidate(self, split_name: str) -> None:
+        """
+        Marks a split as outdated, before its outputs are rewritten
+
+        :param split_name: The name of the split, i.e., train or val
+        :type split_name: str
+        """
+        if self.splits.pop(split_name, None) is not None:
+            self.save()
+
+    def record(
+        self, split_name: str, label_file: Path, output_format: str = "parquet"
+    ) -> None:
+        """
+        Marks a split as up to date, after all of its outputs have been written
+
+        :param split_name: The name of the split, i.e., train or val
+        :type split_name: str
+        :param label_file: Path to the BDD label file the outputs were computed from
+        :type label_file: Path
+        :param output_format: Format the records and anomalies were saved in
+        :type output_format: str
+        """
+        self.splits[split_name] = {
+            "code_version": get_code_version(),
+            "output_format": output_format,
+            "labels": fingerprint_file(label_file),
+            "outputs": {
+                output_file.name: fingerprint_file(output_file)
+                for output_file in self.get_output_files(split_name)
+            },
+        }
+        self.save()
+
+    def save(self) -> None:
+        """
+        Writes the manifest next to the outputs, replacing the previous one at once
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        temporary_path = self.path.with_suffix(".tmp")
+        temporary_path.write_text(json.dumps({"splits": self.splits}, indent=2))
+        temporary_path.replace(self.path)
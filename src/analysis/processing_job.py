@@ -0,0 +1,253 @@
+"""
+File containing the ProcessingJob class, which runs the dataset analysis as a
+background process that is independent of any Streamlit session.
+
+The state of the job is persisted as a JSON file, so any page of any session can
+poll it. While a worker is alive it holds an exclusive lock on a lock file, which
+is how a second request to process the dataset is recognised as a duplicate. The
+worker only recomputes the splits that are outdated according to the manifest.
+
+The worker is started with: python -m analysis.processing_job
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import subprocess
+import sys
+import time
+import traceback
+import uuid
+from pathlib import Path
+
+from analysis.progress import ProgressReporter, ProgressUpdate
+from config import DATASET_SPLITS, JOBS_DIR, NUM_WORKERS
+
+# Minimum number of seconds between two writes of the progress of a split
+PROGRESS_INTERVAL = 0.5
+SRC_DIR = Path(__file__).resolve().parent.parent
+
+
+class ProcessingJob:
+    """
+    A class managing the background job that processes the dataset
+    """
+
+    def __init__(self, jobs_dir: str = JOBS_DIR) -> None:
+        """
+        Initializes the paths of the state, lock and log files of the job
+
+        :param jobs_dir: Directory holding the files of the job
+        :type jobs_dir: str
+        """
+        self.directory = Path(jobs_dir)
+        self.state_path = self.directory / "processing.json"
+        self.lock_path = self.directory / "processing.lock"
+        self.log_path = self.directory / "processing.log"
+
+    def read_state(self) -> dict:
+        """
+        Reads the persisted state of the job. A job that died without recording it
+        is reported as failed.
+
+        :return: The state of the last submitted job, with status "idle" if there is none
+        :rtype: dict
+        """
+        try:
+            state = json.loads(self.state_path.read_text())
+        except (OSError, ValueError):
+            return {"status": "idle", "splits": {}}
+        if state["status"] in ("queued", "running") and not self.is_running():
+            state["status"] = "failed"
+            state["error"] = f"The worker exited unexpectedly, see {self.log_path}"
+        return state
+
+    def write_state(self, state: dict) -> None:
+        """
+        Persists the state of the job, replacing the previous state at once
+
+        :param state: The state of the job
+        :type state: dict
+        """
+        temporary_path = self.state_path.with_suffix(".tmp")
+        temporary_path.write_text(json.dumps(state, indent=2))
+        temporary_path.replace(self.state_path)
+
+    def is_running(self) -> bool:
+        """
+        Checks whether a worker currently holds the lock of the job
+
+        :return: True if a worker is alive
+        :rtype: bool
+        """
+        if not self.lock_path.exists():
+            return False
+        with open(self.lock_path, "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return False
+
+    def submit(self, num_workers: int = NUM_WORKERS) -> bool:
+        """
+        Starts a worker process, unless one is already running. The lock is taken
+        here and handed over to the worker, so concurrent submissions cannot both
+        start a worker.
+
+        :param num_workers: Number of processes used to parse each label file
+        :type num_workers: int
+        :return: True if a worker was started, False if the job was already running
+        :rtype: bool
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT)
+        try:
+            try:
+                fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            self.write_state(
+                {
+                    "id": uuid.uuid4().hex,
+                    "status": "queued",
+                    "submitted": time.time(),
+                    "splits": {},
+                }
+            )
+            environment = dict(os.environ)
+            environment["PYTHONPATH"] = os.pathsep.join(
+                filter(None, [str(SRC_DIR), environment.get("PYTHONPATH")])
+            )
+            with open(self.log_path, "ab") as log_file:
+                subprocess.Popen(
+                    [
+                        sys.executable,
+                        "-m",
+                        "analysis.processing_job",
+                        "--jobs-dir",
+                        str(self.directory),
+                        "--lock-fd",
+                        str(lock_fd),
+                        "--num-workers",
+                        str(num_workers),
+                    ],
+                    cwd=SRC_DIR,
+                    env=environment,
+                    stdin=subprocess.DEVNULL,
+                    stdout=log_file,
+                    stderr=subprocess.STDOUT,
+                    pass_fds=(lock_fd,),
+                    start_new_session=True,
+                )
+            return True
+        finally:
+            # The worker keeps the lock through its own copy of the descriptor
+            os.close(lock_fd)
+
+    def run(self, num_workers: int = NUM_WORKERS) -> None:
+        """
+        Processes every outdated split, persisting the progress as it goes.
+        This runs inside of the worker process, which must hold the lock.
+
+        :param num_workers: Number of processes used to parse each label file
+        :type num_workers: int
+        """
+        # Imported here so that polling the job does not import the analysis code
+        from analysis.dataset_analyzer import DatasetAnalyzer
+
+        state = self.read_state()
+        state.update(status="running", pid=os.getpid(), started=time.time())
+        dataset_analyzer = DatasetAnalyzer()
+        for split in DATASET_SPLITS:
+            up_to_date = dataset_analyzer.is_up_to_date(split)
+            state["splits"][split] = {
+                "status": "skipped" if up_to_date else "queued",
+                "progress": 1.0 if up_to_date else 0.0,
+                "message": "Already up to date" if up_to_date else "Waiting",
+            }
+        self.write_state(state)
+        try:
+            for split, split_state in state["splits"].items():
+                if split_state["status"] == "skipped":
+                    continue
+                split_state.update(status="running", message="Reading the labels")
+                self.write_state(state)
+                split_state["json_backend"] = dataset_analyzer.compute_statistics(
+                    split,
+                    JobProgress(self, state, split),
+                    num_workers=num_workers,
+                    use_label_cache=True,
+                )
+                split_state["message"] = "Rendering the anomaly thumbnails"
+                self.write_state(state)
+                dataset_analyzer.precompute_thumbnails(split)
+                split_state.update(status="done", progress=1.0)
+                self.write_state(state)
+        except Exception:
+            state.update(status="failed", error=traceback.format_exc())
+            raise
+        else:
+            state["status"] = "done"
+        finally:
+            state["finished"] = time.time()
+            self.write_state(state)
+
+
+class JobProgress(ProgressReporter):
+    """
+    Reports the progress of a split by writing it to the job state
+    """
+
+    def __init__(self, job: ProcessingJob, state: dict, split_name: str) -> None:
+        """
+        Initializes the progress of a split
+
+        :param job: The job whose state is updated
+        :type job: ProcessingJob
+        :param state: The state of the job
+        :type state: dict
+        :param split_name: The name of the split being processed
+        :type split_name: str
+        """
+        super().__init__(interval=PROGRESS_INTERVAL)
+        self.job = job
+        self.state = state
+        self.split_state = state["splits"][split_name]
+
+    def emit(self, update: ProgressUpdate) -> None:
+        """
+        Persists the progress of the split
+
+        :param update: The current progress
+        :type update: ProgressUpdate
+        """
+        self.split_state.update(
+            progress=update.fraction or 0.0,
+            message=str(update),
+            rate=update.rate,
+            eta=update.eta,
+        )
+        self.job.write_state(self.state)
+
+
+def main() -> None:
+    """
+    Entrypoint of the worker process
+    """
+    parser = argparse.ArgumentParser(
+        description="Processes the dataset in the background"
+    )
+    parser.add_argument("--jobs-dir", default=JOBS_DIR)
+    parser.add_argument("--lock-fd", type=int, required=True)
+    parser.add_argument("--num-workers", type=int, default=NUM_WORKERS)
+    args = parser.parse_args()
+    # Keep the inherited lock until the process exits
+    fcntl.flock(args.lock_fd, fcntl.LOCK_EX)
+    ProcessingJob(args.jobs_dir).run(args.num_workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+File containing the progress reporters used by the dataset analysis.
+
+The analysis code only calls advance() on a reporter. The reporter decides when an
+update is worth emitting, at most once every interval seconds and/or every count
+items, and computes the throughput and the estimated time remaining. ProgressReporter
+itself emits nothing, so it is the reporter used when running headless. Subclasses
+override emit() to forward the updates to a job state file or a log.
+"""
+
+import sys
+import time
+from typing import TextIO
+
+# Default minimum number of seconds between two emitted updates
+PROGRESS_INTERVAL = 0.25
+
+
+def format_duration(seconds: float) -> str:
+    """
+    Formats a duration as minutes and seconds, or hours, minutes and seconds
+
+    :param seconds: The duration in seconds
+    :type seconds: float
+    :return: The formatted duration, e.g. 1:05 or 1:02:05
+    :rtype: str
+    """
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+class ProgressUpdate:
+    """
+    A snapshot of the progress of a task
+    """
+
+    def __init__(
+        self, description: str, count: int, total: int | None, elapsed: float
+    ) -> None:
+        """
+        Initializes a snapshot
+
+        :param description: Human readable name of the task
+        :type description: str
+        :param count: Number of items processed so far
+        :type count: int
+        :param total: Total number of items, or None if it is not known
+        :type total: int | None
+        :param elapsed: Number of seconds since the task started
+        :type elapsed: float
+        """
+        self.description = description
+        self.count = count
+        self.total = total
+        self.elapsed = elapsed
+
+    @property
+    def fraction(self) -> float | None:
+        """
+        Fraction of the items that have been processed, capped at 1
+
+        :return: The fraction, or None if the total is not known
+        :rtype: float | None
+        """
+        if not self.total:
+            return None
+        return min(self.count / self.total, 1.0)
+
+    @property
+    def rate(self) -> float:
+        """
+        Number of items processed per second
+
+        :return: The throughput of the task so far
+        :rtype: float
+        """
+        return self.count / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float | None:
+        """
+        Estimated number of seconds until the task is complete
+
+        :return: The estimate, or None if it cannot be computed yet
+        :rtype: float | None
+        """
+        if not self.total or not self.rate:
+            return None
+        return max(self.total - self.count, 0) / self.rate
+
+    def __str__(self) -> str:
+        """
+        Formats the snapshot as a one line status message
+
+        :return: e.g. "Training split: 42.00% processed, 1,234 images/s, ETA 0:31"
+        :rtype: str
+        """
+        if self.fraction is None:
+            message = f"{self.description}: {self.count:,} processed"
+        else:
+            message = f"{self.description}: {self.fraction * 100:.2f}% processed"
+        message += f", {self.rate:,.0f} images/s"
+        if self.eta is not None:
+            message += f", ETA {format_duration(self.eta)}"
+        return message
+
+
+class ProgressReporter:
+    """
+    Tracks the progress of a task and emits throttled updates. This base class
+    discards the updates, so it can be used whenever nobody is watching.
+    """
+
+    def __init__(
+        self, interval: float | None = PROGRESS_INTERVAL, every: int | None = None
+    ) -> None:
+        """
+        Initializes a reporter. An update is emitted once interval seconds have passed
+        or once every items were processed since the last update, whichever is first.
+
+        :param interval: Minimum number of seconds between updates, or None
+        :type interval: float | None
+        :param every: Number of items between updates, or None
+        :type every: int | None
+        """
+        self.interval = interval
+        self.every = every
+        self.start("", None)
+
+    def start(self, description: str, total: int | None) -> None:
+        """
+        Starts tracking a new task
+
+        :param description: Human readable name of the task
+        :type description: str
+        :param total: Total number of items, or None if it is not known
+        :type total: int | None
+        """
+        self.description = description
+        self.total = total
+        self.count = 0
+        self.started = time.monotonic()
+        self.last_emitted = self.started
+        self.last_emitted_count = 0
+
+    def advance(self, count: int = 1) -> None:
+        """
+        Records that more items were processed, emitting an update if one is due
+
+        :param count: Number of items processed since the last call
+        :type count: int
+        """
+        self.count += count
+        now = time.monotonic()
+        if (self.interval is not None and now - self.last_emitted >= self.interval) or (
+            self.every is not None
+            and self.count - self.last_emitted_count >= self.every
+        ):
+            self.emit_update(now)
+
+    def finish(self) -> None:
+        """
+        Emits a final update for the current task
+        """
+        self.emit_update(time.monotonic())
+
+    def emit_update(self, now: float) -> None:
+        """
+        Emits an update with the current progress
+
+        :param now: The current value of time.monotonic()
+        :type now: float
+        """
+        self.last_emitted = now
+        self.last_emitted_count = self.count
+        self.emit(
+            ProgressUpdate(self.description, self.count, self.total, now - self.started)
+        )
+
+    def emit(self, update: ProgressUpdate) -> None:
+        """
+        Publishes an update. Subclasses override this method.
+
+        :param update: The current progress
+        :type update: ProgressUpdate
+        """
+
+
+class StreamProgressReporter(ProgressReporter):
+    """
+    Writes the updates as lines of text to a stream, for headless runs
+    """
+
+    def __init__(
+        self,
+        stream: TextIO = sys.stderr,
+        interval: float | None = 5.0,
+        every: int | None = None,
+    ) -> None:
+        """
+        Initializes a reporter writing to the given stream
+
+        :param stream: The stream the updates are written to
+        :type stream: TextIO
+        :param interval: Minimum number of seconds between updates, or None
+        :type interval: float | None
+        :param every: Number of items between updates, or None
+        :type every: int | None
+        """
+        super().__init__(interval, every)
+        self.stream = stream
+
+    def emit(self, update: ProgressUpdate) -> None:
+        """
+        Writes the update as one line
+
+        :param update: The current progress
+        :type update: ProgressUpdate
+        """
+        print(update, file=self.stream, flush=True)
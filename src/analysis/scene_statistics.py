@@ -2,10 +2,29 @@
 File containing the scene statistics class
 """
 
-from collections import defaultdict
+from collections import Counter, defaultdict
+import numpy as np
 import pandas as pd
 from pathlib import Path
 from config import CSV_DIR, CATEGORIES
+from analysis.box_batch import BoxBatch
+
+# Values of the scene attributes along the axes of the category tensor, in the order
+# of the rows of the categories by scene parameters csv
+TIMEOFDAY_VALUES = sorted(["daytime", "dawn/dusk", "night", "undefined"])
+WEATHER_VALUES = sorted(
+    ["clear", "rainy", "undefined", "snowy", "overcast", "partly cloudy", "foggy"]
+)
+
+
+def int_counter() -> defaultdict:
+    """
+    Returns an empty counter for the values of one attribute
+
+    :return: A defaultdict of ints
+    :rtype: defaultdict
+    """
+    return defaultdict(int)
 
 
 class SceneStatistics:
@@ -13,17 +32,20 @@ class SceneStatistics:
     A class for computing the scene level statistics of the BDD100K dataset
     """
 
-    def __init__(self, split_name: str) -> None:
+    def __init__(self, split_name: str, output_dir: str = CSV_DIR) -> None:
         """
         Initializes an instance of the class for a particular split
 
         :param self: Description
         :param split_name: One of the two splits
         :type split_name: str
+        :param output_dir: Directory the statistics are saved to
+        :type output_dir: str
         """
         self.split = split_name
-        self.stats = defaultdict(lambda: defaultdict(int))
-        self.category_distribution = defaultdict(lambda: defaultdict(int))
+        self.output_dir = Path(output_dir)
+        self.stats = defaultdict(int_counter)
+        self.category_distribution = defaultdict(int_counter)
 
     def update_stats_counter(self, key: str, value: str) -> None:
         """
@@ -36,26 +58,60 @@ class SceneStatistics:
         """
         self.stats[key][value] += 1
 
-    def update_category_distribution(
-        self, weather: str, timeofday: str, category: str
-    ) -> None:
+    def update_stats_counts(self, key: str, values: list[str]) -> None:
+        """
+        Update one of the three stats: weather, scene, timeofday with the values of many images
+
+        :param key: attribute name
+        :type key: str
+        :param values: class name of every image
+        :type values: list[str]
+        """
+        for value, count in Counter(values).items():
+            self.stats[key][value] += count
+
+    def add_batch(self, batch: BoxBatch) -> None:
+        """
+        Update the category distribution by weather and time of day with a batch of labels
+
+        :param batch: The bounding box labels of a chunk of images
+        :type batch: BoxBatch
+        """
+        scene_params = list(zip(batch.timeofday, batch.weather))
+        scene_codes = {key: i for i, key in enumerate(dict.fromkeys(scene_params))}
+        image_scene = np.array(
+            [scene_codes[key] for key in scene_params], dtype=np.intp
+        )
+        counts = np.bincount(
+            image_scene[batch.image_index] * len(CATEGORIES) + batch.category,
+            minlength=len(scene_codes) * len(CATEGORIES),
+        ).reshape(len(scene_codes), len(CATEGORIES))
+        for key, code in scene_codes.items():
+            for category, category_id in CATEGORIES.items():
+                if counts[code, category_id]:
+                    self.category_distribution[key][category] += int(
+                        counts[code, category_id]
+                    )
+
+    def merge(self, other: "SceneStatistics") -> None:
         """
-        Update the category distribution by weather and time of day
+        Adds the counts computed over another part of the same split to this instance
 
-        :param weather: The weather condition of the scene
-        :type weather: str
-        :param timeofday: The time of day of the image setting
-        :type timeofday: str
-        :param category: One of the 10 classes
-        :type category: str
+        :param other: Statistics computed over the images following this instance's
+        :type other: SceneStatistics
         """
-        self.category_distribution[(timeofday, weather)][category] += 1
+        for key, counts in other.stats.items():
+            for value, count in counts.items():
+                self.stats[key][value] += count
+        for scene, counts in other.category_distribution.items():
+            for category, count in counts.items():
+                self.category_distribution[scene][category] += count
 
     def save_csvs(self) -> None:
         """
         Saves csv files of statistics to the output directory
         """
-        output_dir = Path(CSV_DIR)
+        output_dir = self.output_dir
         output_dir.mkdir(parents=True, exist_ok=True)
 
         for stat_name, counts in self.stats.items():
@@ -63,31 +119,19 @@ class SceneStatistics:
             stat_df = pd.DataFrame(counts.items(), columns=["attribute", "count"])
             stat_df.to_csv(output_path, index=False)
 
-        return f"csvs were written to: {CSV_DIR}"
+        return f"csvs were written to: {output_dir}"
 
     def save_category_distribution_csv(self) -> None:
         """
         Saves the distribution of categories by weather and time of day to the output directory
         """
-        output_dir = Path(CSV_DIR)
+        output_dir = self.output_dir
         output_dir.mkdir(parents=True, exist_ok=True)
 
-        timeofday_list = sorted(["daytime", "dawn/dusk", "night", "undefined"])
-        weather_list = sorted(
-            [
-                "clear",
-                "rainy",
-                "undefined",
-                "snowy",
-                "overcast",
-                "partly cloudy",
-                "foggy",
-            ]
-        )
         rows = []
 
-        for time_of_day in timeofday_list:
-            for weather in weather_list:
+        for time_of_day in TIMEOFDAY_VALUES:
+            for weather in WEATHER_VALUES:
                 for category in CATEGORIES.keys():
                     rows.append(
                         (
@@ -105,4 +149,51 @@ class SceneStatistics:
         output_path = output_dir / f"categories_by_scene_params_{self.split}.csv"
         category_distribution_df.to_csv(output_path, index=False)
 
-        return f"csvs were written to: {CSV_DIR}"
+        return f"csvs were written to: {output_dir}"
+
+    def get_category_tensor(self) -> np.ndarray:
+        """
+        Returns the dense counts of the categories by time of day and weather
+
+        :return: A timeofday x weather x category array of counts, along
+            TIMEOFDAY_VALUES, WEATHER_VALUES and the category ids
+        :rtype: np.ndarray
+        """
+        tensor = np.zeros(
+            (len(TIMEOFDAY_VALUES), len(WEATHER_VALUES), len(CATEGORIES)),
+            dtype=np.int64,
+        )
+        for i, time_of_day in enumerate(TIMEOFDAY_VALUES):
+            for j, weather in enumerate(WEATHER_VALUES):
+                counts = self.category_distribution.get((time_of_day, weather), {})
+                for category, category_id in CATEGORIES.items():
+                    tensor[i, j, category_id] = counts.get(category, 0)
+        return tensor
+
+    def save_category_tensor(self) -> None:
+        """
+        Saves the counts of the categories by time of day and weather as an npz file,
+        with the labels of its axes, so it can be displayed without any processing
+        """
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        np.savez(
+            self.output_dir / f"scene_tensor_{self.split}.npz",
+            counts=self.get_category_tensor(),
+            timeofday=np.array(TIMEOFDAY_VALUES),
+            weather=np.array(WEATHER_VALUES),
+            categories=np.array(list(CATEGORIES)),
+        )
+
+
+def load_category_tensor(path: Path) -> dict[str, np.ndarray]:
+    """
+    Loads the counts of the categories by time of day and weather saved with
+    save_category_tensor
+
+    :param path: Path to the file
+    :type path: Path
+    :return: The counts and the labels of the time of day, weather and category axes
+    :rtype: dict[str, np.ndarray]
+    """
+    with np.load(path) as arrays:
+        return {name: arrays[name] for name in arrays.files}
@@ -2,17 +2,24 @@
 Main entrypoint of streamlit application
 """
 
+import time
+
 import streamlit as st
-from analysis.dataset_analyzer import DatasetAnalyzer
-from config import CSV_DIR
-from pathlib import Path
+from analysis.processing_job import ProcessingJob
+from config import DATASET_SPLITS
+
+# Number of seconds between two refreshes of the page while the dataset is processed
+POLL_INTERVAL = 1.0
 
 
 def process_dataset():
     """
-    Sets a session state variable to indicate that processing has begun
+    Submits the background job that processes the dataset. If the job is already
+    running, for example because it was started from another session, nothing new
+    is started.
     """
-    st.session_state.start_processing = True
+    if not ProcessingJob().submit():
+        st.info("The dataset is already being processed, showing its progress below")
 
 
 def main():
@@ -31,29 +38,38 @@ def main():
             
             Thank you for taking the time to review my submission.
             
-            To process the dataset and generate the analysis in the next pages, please press the button below. Please note, that due to the way
-            that streamlit manages multipage applications, this page needs to stay open until the processing is complete.
-            If you navigate away to another page before it is complete, you will need to restart the processing by clicking the button again.
+            To process the dataset and generate the analysis in the next pages, please press the button below.
+            The processing runs in the background, so you can navigate away from this page, or open the app in
+            another tab, and come back to check on its progress at any time.
+            Only the splits whose labels changed since they were last processed are processed again.
             Thank you for your understanding!
         """
     )
     if st.button("Process Dataset"):
         process_dataset()
 
-    if st.session_state.get("start_processing"):
-        csv_files = sorted(Path(CSV_DIR).glob("*.csv"))
-        if not csv_files:
-            dataset_analyzer = DatasetAnalyzer()
-            # Start by reading the labels
-            for split in ["train", "val"]:  # ["train", "val"]:
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                dataset_analyzer.compute_statistics(split, progress_bar, status_text)
-
-        else:
-            st.success(
-                "You have already finished processing the dataset. Please navigate to the next pages using the sidebar navigation"
+    state = ProcessingJob().read_state()
+    if state["status"] == "idle":
+        return
+    for split, split_state in state["splits"].items():
+        st.progress(
+            min(split_state["progress"], 1.0),
+            text=f"{DATASET_SPLITS[split]['full_name']} split: {split_state['message']}",
+        )
+        if split_state.get("json_backend"):
+            st.caption(
+                f"Parsed the {split} labels with the {split_state['json_backend']} parser"
             )
+    if state["status"] in ("queued", "running"):
+        st.write("Processing the dataset...")
+        time.sleep(POLL_INTERVAL)
+        st.rerun()
+    elif state["status"] == "failed":
+        st.error(f"Processing the dataset failed:\n\n{state.get('error')}")
+    else:
+        st.success(
+            "You have already finished processing the dataset. Please navigate to the next pages using the sidebar navigation"
+        )
         st.write("Processing Complete!")
 
 
@@ -0,0 +1,195 @@
+"""
+File containing the data access layer shared by the pages of the app.
+
+The outputs of the analysis are loaded once per process with st.cache_resource, so
+every session and page gets the same objects instead of its own copy. The objects
+are shared and must not be modified in place: pages deriving columns work on a copy.
+Every cached object is keyed by the version of the outputs, derived from the
+processing manifest, so a new run of the analysis is picked up on the next rerun and
+the objects of the previous version are evicted.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from analysis.area_cube import AreaCube
+from analysis.category_statistics import find_table, load_table
+from analysis.image_index import AnomalyIndex
+from analysis.manifest import MANIFEST_FILENAME
+from analysis.scene_statistics import load_category_tensor
+from config import CSV_DIR
+
+# Number of tables kept in memory, across versions of the outputs
+MAX_CACHED_TABLES = 32
+MAX_CACHED_CUBES = 4
+MAX_CACHED_INDEXES = 4
+
+
+def has_outputs(output_dir: str = CSV_DIR) -> bool:
+    """
+    Checks whether the analysis has written any output yet, in either format
+
+    :param output_dir: Directory holding the outputs of the analysis
+    :type output_dir: str
+    :return: True if there are outputs to show
+    :rtype: bool
+    """
+    return any(Path(output_dir).glob("*_*.*"))
+
+
+def get_outputs_version(output_dir: str = CSV_DIR) -> str:
+    """
+    Returns a token changing whenever the outputs of the analysis are rewritten. The
+    manifest is rewritten at the start and at the end of every run; outputs copied
+    without a manifest are versioned by the files themselves.
+
+    :param output_dir: Directory holding the outputs of the analysis
+    :type output_dir: str
+    :return: The version of the outputs
+    :rtype: str
+    """
+    output_dir = Path(output_dir)
+    manifest = output_dir / MANIFEST_FILENAME
+    files = [manifest] if manifest.exists() else sorted(output_dir.glob("*_*.*"))
+    version = []
+    for path in files:
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        version.append(f"{path.name}:{stat.st_mtime_ns}:{stat.st_size}")
+    return ";".join(version)
+
+
+@st.cache_resource(max_entries=MAX_CACHED_TABLES, show_spinner=False)
+def _load_table(filename: str, version: str) -> pd.DataFrame:
+    """
+    Reads an output table, once per version of the outputs
+
+    :param filename: Name of the CSV or Parquet file in the CSV directory
+    :type filename: str
+    :param version: The version of the outputs, used as the cache key
+    :type version: str
+    :return: The table
+    :rtype: DataFrame
+    """
+    return load_table(filename)
+
+
+@st.cache_resource(max_entries=MAX_CACHED_CUBES, show_spinner=False)
+def _load_area_cube(split: str, version: str) -> AreaCube:
+    """
+    Reads the area cube of a split, once per version of the outputs. Its arrays are
+    made read-only since the cube is shared.
+
+    :param split: The name of the dataset split, i.e., train or val
+    :type split: str
+    :param version: The version of the outputs, used as the cache key
+    :type version: str
+    :return: The area cube
+    :rtype: AreaCube
+    """
+    area_cube = AreaCube.load(Path(CSV_DIR) / f"area_cube_{split}.npz")
+    for array in vars(area_cube).values():
+        array.setflags(write=False)
+    return area_cube
+
+
+@st.cache_resource(max_entries=MAX_CACHED_CUBES, show_spinner=False)
+def _load_scene_tensor(split: str, version: str) -> dict[str, np.ndarray]:
+    """
+    Reads the counts of the categories by time of day and weather of a split, once
+    per version of the outputs. The arrays are made read-only since they are shared.
+
+    :param split: The name of the dataset split, i.e., train or val
+    :type split: str
+    :param version: The version of the outputs, used as the cache key
+    :type version: str
+    :return: The counts and the labels of their axes
+    :rtype: dict[str, np.ndarray]
+    """
+    scene_tensor = load_category_tensor(Path(CSV_DIR) / f"scene_tensor_{split}.npz")
+    for array in scene_tensor.values():
+        array.setflags(write=False)
+    return scene_tensor
+
+
+@st.cache_resource(max_entries=MAX_CACHED_INDEXES, show_spinner=False)
+def _load_anomaly_index(split: str, version: str) -> AnomalyIndex:
+    """
+    Indexes the anomalies of a split by image, once per version of the outputs
+
+    :param split: The name of the dataset split, i.e., train or val
+    :type split: str
+    :param version: The version of the outputs, used as the cache key
+    :type version: str
+    :return: The anomaly index
+    :rtype: AnomalyIndex
+    """
+    return AnomalyIndex(_load_table(find_table("anomalies", split), version))
+
+
+def get_table(filename: str) -> pd.DataFrame:
+    """
+    Returns an output table shared by all sessions. It must not be modified in place.
+
+    :param filename: Name of the CSV or Parquet file in the CSV directory
+    :type filename: str
+    :return: The table
+    :rtype: DataFrame
+    """
+    return _load_table(filename, get_outputs_version())
+
+
+def get_anomalies(split: str) -> pd.DataFrame:
+    """
+    Returns the anomalies of a split, in whichever format they were saved, shared by
+    all sessions. They must not be modified in place.
+
+    :param split: The name of the dataset split, i.e., train or val
+    :type split: str
+    :return: The table with one row per anomaly
+    :rtype: DataFrame
+    """
+    return get_table(find_table("anomalies", split))
+
+
+def get_area_cube(split: str) -> AreaCube:
+    """
+    Returns the read-only area cube of a split, shared by all sessions
+
+    :param split: The name of the dataset split, i.e., train or val
+    :type split: str
+    :return: The area cube
+    :rtype: AreaCube
+    """
+    return _load_area_cube(split, get_outputs_version())
+
+
+def get_scene_tensor(split: str) -> dict[str, np.ndarray]:
+    """
+    Returns the read-only counts of the categories by time of day and weather of a
+    split, shared by all sessions
+
+    :param split: The name of the dataset split, i.e., train or val
+    :type split: str
+    :return: The timeofday x weather x category counts, and the labels of the
+        timeofday, weather and categories axes
+    :rtype: dict[str, np.ndarray]
+    """
+    return _load_scene_tensor(split, get_outputs_version())
+
+
+def get_anomaly_index(split: str) -> AnomalyIndex:
+    """
+    Returns the index of the anomalies of a split by image, shared by all sessions
+
+    :param split: The name of the dataset split, i.e., train or val
+    :type split: str
+    :return: The anomaly index
+    :rtype: AnomalyIndex
+    """
+    return _load_anomaly_index(split, get_outputs_version())
@@ -3,10 +3,9 @@ Third page of the app showcasing scene statistics
 """
 
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-from pathlib import Path
-from config import CSV_DIR
+import numpy as np
+import plotly.graph_objects as go
+from data_access import get_scene_tensor, get_table, has_outputs
 
 
 def populate_scene_statistics_page():
@@ -31,9 +30,7 @@ def populate_scene_statistics_page():
         and assess whether the model is likely to encounter distribution shifts during evaluation.
         """
     )
-    csv_files = sorted(Path(CSV_DIR).glob("*.csv"))
-
-    if not csv_files:
+    if not has_outputs():
         st.warning(
             'Please use the sidebar navigation to navigate to the page called "Process Dataset" and process the dataset first. Thank you.'
         )
@@ -80,24 +77,19 @@ def populate_scene_statistics_page():
 
 def display_heatmaps() -> None:
     """
-    Creates (weather, timeofday) vs category heatmaps for both splits
+    Creates (weather, timeofday) vs category heatmaps for both splits, from the count
+    tensors saved by the analysis
     """
-    train_df = load_data("train")
-    val_df = load_data("val")
-
-    train_pivot_df = build_matrix(train_df)
-    val_pivot_df = build_matrix(val_df)
-
-    fig_train = plot_heatmap(train_pivot_df)
-    fig_val = plot_heatmap(val_pivot_df)
+    fig_train = plot_heatmap(get_scene_tensor("train"))
+    fig_val = plot_heatmap(get_scene_tensor("val"))
 
     col1, col2 = st.columns(2)
     with col1:
         st.subheader("Training Split Heatmap")
-        st.pyplot(fig_train)
+        st.plotly_chart(fig_train, use_container_width=True)
     with col2:
         st.subheader("Validation Split Heatmap")
-        st.pyplot(fig_val)
+        st.plotly_chart(fig_val, use_container_width=True)
 
 
 def display_barcharts(attribute_name: str) -> None:
@@ -107,8 +99,8 @@ def display_barcharts(attribute_name: str) -> None:
     :param attribute_name: Scene attribute for fetching computed CSV file
     :type attribute_name: str
     """
-    df_train = pd.read_csv(Path(CSV_DIR) / f"{attribute_name}_train.csv")
-    df_val = pd.read_csv(Path(CSV_DIR) / f"{attribute_name}_val.csv")
+    df_train = get_table(f"{attribute_name}_train.csv")
+    df_val = get_table(f"{attribute_name}_val.csv")
     col1, col2 = st.columns(2)
     with col1:
         st.subheader("Training Split")
@@ -118,72 +110,39 @@ def display_barcharts(attribute_name: str) -> None:
         st.bar_chart(data=df_val, x="attribute", y="count")
 
 
-def load_data(split: str) -> None:
-    """
-    Loads csv for categories by scene parameters for given split
-
-    :param split: Name of split, i.e. train or test
-    :type split: str
-    """
-    csv_path = Path(CSV_DIR) / f"categories_by_scene_params_{split}.csv"
-    return pd.read_csv(csv_path)
-
-
-def build_matrix(df: pd.DataFrame) -> None:
+def plot_heatmap(scene_tensor: dict[str, np.ndarray]) -> go.Figure:
     """
-    Builds pivot table for a given dataframe for heatmap generation
-
-    :param df: Dataframe for which pivot table should be built
-    :type df: pd.DataFrame
+    Plots the heatmap of the category counts by time of day and weather, with one row
+    per combination of the two. The counts are sent to the browser as one array and
+    the cell labels are drawn there by Plotly.
+
+    :param scene_tensor: The timeofday x weather x category counts and their labels
+    :type scene_tensor: dict[str, np.ndarray]
+    :return: The heatmap figure
+    :rtype: Figure
     """
-    pivot = df.pivot_table(
-        index=["weather", "time"], columns="class", values="value", fill_value=0
+    counts = scene_tensor["counts"]
+    rows = [
+        f"{time_of_day} & {weather}"
+        for time_of_day in scene_tensor["timeofday"]
+        for weather in scene_tensor["weather"]
+    ]
+    fig = go.Figure(
+        go.Heatmap(
+            z=counts.reshape(-1, counts.shape[-1]),
+            x=scene_tensor["categories"].tolist(),
+            y=rows,
+            colorscale="Inferno",
+            colorbar={"title": {"text": "Count"}},
+            texttemplate="%{z:.0f}",
+            textfont={"size": 9},
+            hovertemplate="%{y}<br>%{x}: %{z:.0f}<extra></extra>",
+        )
     )
-
-    return pivot
-
-
-def plot_heatmap(pivot_df: pd.DataFrame) -> None:
-    """
-    Plots the heatmap for the scene statistics dataframe onto the UI
-
-    :param pivot_df: Pivot table for scene statistics dataframe
-    :type pivot_df: pd.DataFrame
-    """
-    matrix = pivot_df.values
-    fig, ax = plt.subplots(figsize=(8, 12))
-
-    im = ax.imshow(matrix, aspect="auto", cmap="inferno")
-
-    threshold = matrix.max() / 2.0
-
-    for i in range(matrix.shape[0]):
-        for j in range(matrix.shape[1]):
-            val = matrix[i, j]
-
-            text_color = "white" if val < threshold else "black"
-
-            ax.text(
-                j,
-                i,
-                f"{val:.0f}",
-                ha="center",
-                va="center",
-                fontsize=7,
-                color=text_color,
-                weight="bold",
-            )
-
-    fig.colorbar(im, ax=ax, label="Count")
-
-    rows = [f"{w} & {t}" for w, t in pivot_df.index]
-    cols = pivot_df.columns
-    ax.set_yticks(range(len(rows)))
-    ax.set_yticklabels(rows, fontsize=8)
-    ax.set_xticks(range(len(cols)))
-    ax.set_xticklabels(cols, rotation=45, ha="right")
-
-    plt.tight_layout()
+    fig.update_layout(height=900, margin={"l": 0, "r": 0, "t": 10, "b": 0})
+    fig.update_xaxes(tickangle=45)
+    # Match the top to bottom row order of the former image
+    fig.update_yaxes(autorange="reversed", tickfont={"size": 10})
     return fig
 
 
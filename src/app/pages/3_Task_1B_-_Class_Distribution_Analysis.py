@@ -3,10 +3,9 @@ Fourth page of the app showcasing class statistics. This page will show the most
 """
 
 import streamlit as st
-from config import CSV_DIR
+from data_access import get_table, has_outputs
 import pandas as pd
 import plotly.express as px
-from pathlib import Path
 
 
 def populate_class_distribution_analysis_page():
@@ -27,9 +26,7 @@ def populate_class_distribution_analysis_page():
             convergence and detection accuracy.
         """
     )
-    csv_files = sorted(Path(CSV_DIR).glob("*.csv"))
-
-    if not csv_files:
+    if not has_outputs():
         st.warning(
             'Please use the sidebar navigation to navigate to the page called "Process Dataset" and process the dataset first. Thank you.'
         )
@@ -66,19 +63,16 @@ def populate_class_distribution_analysis_page():
         plot_truncation_percentage(train_df, val_df)
 
 
-@st.cache_data
 def load_data(split: str) -> pd.DataFrame:
     """
-    Loads and caches a csv file as a datframe
+    Loads the category stats of a split, shared by all sessions
 
     :param split: Name of the dataset split, i.e., train or test
     :type split: str
     :return: A pandas dataframe of the category stands
     :rtype: DataFrame
     """
-    file_path = Path(CSV_DIR) / f"category_stats_{split}.csv"
-    df = pd.read_csv(file_path)
-    return df
+    return get_table(f"category_stats_{split}.csv")
 
 
 def get_adjusted_df(split: str) -> pd.DataFrame:
@@ -90,8 +84,10 @@ def get_adjusted_df(split: str) -> pd.DataFrame:
     :return: Returns a pandas datframe to be used by the plotters
     :rtype: DataFrame
     """
-    df = load_data(split)
-    df["non_anomalies"] = df["total_count"] - df["anomalies"]
+    # The shared dataframe is left untouched, the percentages are added to a copy
+    df = load_data(split).copy()
+    # A box flagged by several rules is counted once, so the bars add up to the total
+    df["non_anomalies"] = df["total_count"] - df["anomalous_boxes"]
     df["occluded_pct"] = (df["occluded"] / df["total_count"]) * 100
     df["non_occluded_pct"] = 100 - df["occluded_pct"]
     df["truncated_pct"] = (df["truncated"] / df["total_count"]) * 100
@@ -118,12 +114,12 @@ def plot_anomaly_counts(train_df: pd.DataFrame, val_df: pd.DataFrame) -> None:
         fig1 = px.bar(
             train_df,
             y="class",
-            x=["anomalies", "non_anomalies"],
+            x=["anomalous_boxes", "non_anomalies"],
             orientation="h",
             title="Total Count (Anomalies vs Non-Anomalies)",
             labels={"value": "Count", "class": "Category"},
             color_discrete_map={
-                "anomalies": "#FF4B4B",
+                "anomalous_boxes": "#FF4B4B",
                 "non_anomalies": "#E0E0E0",
             },  # Red & Grey
         )
@@ -140,12 +136,12 @@ def plot_anomaly_counts(train_df: pd.DataFrame, val_df: pd.DataFrame) -> None:
         fig1 = px.bar(
             val_df,
             y="class",
-            x=["anomalies", "non_anomalies"],
+            x=["anomalous_boxes", "non_anomalies"],
             orientation="h",
             title="Total Count (Anomalies vs Non-Anomalies)",
             labels={"value": "Count", "class": "Category"},
             color_discrete_map={
-                "anomalies": "#FF4B4B",
+                "anomalous_boxes": "#FF4B4B",
                 "normal": "#E0E0E0",
             },  # Red & Grey
         )
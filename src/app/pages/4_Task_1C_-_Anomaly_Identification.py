@@ -3,11 +3,20 @@ Fifth page of the app showcasing class statistics. This page will show details o
 """
 
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
-from config import CSV_DIR, NETWORK_MOUNT
+from concurrent.futures import ThreadPoolExecutor
+from analysis.anomaly_thumbnails import (
+    TOP_IMAGES_PER_TYPE,
+    ThumbnailCache,
+    get_thumbnail,
+)
+from analysis.anomaly_rules import AnomalyRuleSet
+from analysis.image_index import AnomalyIndex
+from config import CATEGORIES
+from data_access import get_anomalies, get_anomaly_index, has_outputs
 from pathlib import Path
-from PIL import Image, ImageDraw
 
 
 def populate_anomaly_identification_page():
@@ -35,11 +44,16 @@ def populate_anomaly_identification_page():
         * **Ultra-Narrow:** $AR < 0.1$ (Height is more than 10x the width)
         * **Ultra-Wide:** $AR > 10.0$ (Width is more than 10x the height)
         
+        ### 3. Geometry Anomalies (optional)
+        Optional rules, left out of the default rule set, flag boxes extending past the borders of the $1280 \\times 720$ frame, and boxes with a zero height.
+
+        ### 4. Duplicate Boxes (optional)
+        Two boxes of the same class in one image with an IoU of at least 0.9 are most likely the same object annotated twice. The optional duplicate box rule flags the later box of every such pair.
+
         > **Note:** These thresholds help isolate potential labeling errors or edge cases that might require specialized augmentation during model training.
         """
     )
-    csv_files = sorted(Path(CSV_DIR).glob("*.csv"))
-    if not csv_files:
+    if not has_outputs():
         st.warning(
             'Please use the sidebar navigation to navigate to the page called "Process Dataset" and process the dataset first. Thank you.'
         )
@@ -58,22 +72,25 @@ def populate_anomaly_identification_page():
         render_bar_chart_and_top_images("val")
 
 
-@st.cache_data
+# Readable labels of the anomaly types
+ANOMALY_TYPE_NAMES = AnomalyRuleSet().get_type_names()
+# Layout of a page of the anomaly gallery
+GALLERY_COLUMNS = 3
+GALLERY_PAGE_SIZE = 9
+# Number of threads rendering the thumbnails of the gallery
+GALLERY_WORKERS = 4
+
+
 def load_data(split: str) -> pd.DataFrame:
     """
-    Loads a dataframe from a csv file and caches it
+    Loads the anomalies of a split, shared by all sessions
 
     :param split: Denotes the split of the dataset, i.e., train or val
     :type split: str
-    :return: Returns a pandas dataframe for the csv file
+    :return: Returns a pandas dataframe with one row per anomaly
     :rtype: DataFrame
     """
-    # Loading the CSV saved from your specific DataFrame
-    df = pd.read_csv(Path(CSV_DIR) / f"anomalies_{split}.csv")
-    # Map 'type' 0 and 1 to readable labels
-    type_map = {0: "Area Anomaly", 1: "Aspect Ratio Anomaly"}
-    df["anomaly_name"] = df["type"].map(type_map)
-    return df
+    return get_anomalies(split)
 
 
 def render_bar_chart_and_top_images(split: str) -> None:
@@ -85,23 +102,23 @@ def render_bar_chart_and_top_images(split: str) -> None:
     """
     try:
         df = load_data(split)
-        top_aspect_images = (
-            df[df["type"] == 1]["image_name"].value_counts().head(3).index.tolist()
-        )
+        anomaly_index = get_anomaly_index(split)
+        top_aspect_images = anomaly_index.get_top_images(1, TOP_IMAGES_PER_TYPE)
         # Type 0: Area Anomalies
-        top_area_images = (
-            df[df["type"] == 0]["image_name"].value_counts().head(3).index.tolist()
-        )
+        top_area_images = anomaly_index.get_top_images(0, TOP_IMAGES_PER_TYPE)
 
         col1, col2 = st.columns(2)
         col1.metric("Total Anomalies", len(df))
         col2.metric("Split", f"{split}")
 
         # Create the Chart
-        # We aggregate by category and the mapped anomaly_name
+        # We aggregate by category and type, then map the type to a readable name
         chart_df = (
-            df.groupby(["category", "anomaly_name"]).size().reset_index(name="count")
+            df.groupby(["category", "type"], observed=True)
+            .size()
+            .reset_index(name="count")
         )
+        chart_df["anomaly_name"] = chart_df["type"].map(ANOMALY_TYPE_NAMES)
 
         fig = px.bar(
             chart_df,
@@ -125,7 +142,9 @@ def render_bar_chart_and_top_images(split: str) -> None:
         )
         cols1 = st.columns(3)
         for i, img_name in enumerate(top_aspect_images):
-            annotated = get_annotated_image(img_name, df)
+            annotated = get_annotated_image(
+                img_name, anomaly_index, get_thumbnail_cache()
+            )
             with cols1[i]:
                 if annotated:
                     st.image(
@@ -141,7 +160,9 @@ def render_bar_chart_and_top_images(split: str) -> None:
         )
         cols2 = st.columns(3)
         for i, img_name in enumerate(top_area_images):
-            annotated = get_annotated_image(img_name, df)
+            annotated = get_annotated_image(
+                img_name, anomaly_index, get_thumbnail_cache()
+            )
             with cols2[i]:
                 if annotated:
                     st.image(
@@ -152,65 +173,165 @@ def render_bar_chart_and_top_images(split: str) -> None:
                 else:
                     st.warning(f"File {img_name} not found in path.")
 
+        render_anomaly_gallery(split, anomaly_index)
+
     except FileNotFoundError:
-        st.error(
-            "File 'anomalies.csv' not found. Please ensure you saved the DataFrame correctly."
+        st.warning(
+            f'The anomalies of the {split} split have not been computed yet. Please process the dataset on the page called "Process Dataset".'
         )
 
 
-def get_annotated_image(img_name: str, dataframe: pd.DataFrame):
+def render_anomaly_gallery(split: str, anomaly_index: AnomalyIndex) -> None:
+    """
+    Renders a paginated gallery of the images with anomalies matching the filters,
+    most matching anomalies first. Only the thumbnails of the visible page are
+    rendered before the page is shown, the ones of the next page are rendered in the
+    background.
+
+    :param split: The name of the dataset split, i.e., train or val
+    :type split: str
+    :param anomaly_index: Index of the anomalies of the split by image
+    :type anomaly_index: AnomalyIndex
     """
-    Gets an annotated image to render in the UI
+    st.subheader(f"Anomaly gallery - {split}")
+    anomalies = anomaly_index.table
+
+    col1, col2 = st.columns(2)
+    categories = col1.multiselect(
+        "Categories", list(CATEGORIES), default=list(CATEGORIES), key=f"cat_{split}"
+    )
+    types = col2.multiselect(
+        "Anomaly types",
+        list(ANOMALY_TYPE_NAMES),
+        default=list(ANOMALY_TYPE_NAMES),
+        format_func=ANOMALY_TYPE_NAMES.get,
+        key=f"type_{split}",
+    )
+    col1, col2 = st.columns(2)
+    mask = (
+        anomalies["category"].isin(categories).to_numpy()
+        & np.isin(anomalies["type"].to_numpy(), types)
+        & filter_range(col1, "Area (px²)", anomalies["area"], f"area_{split}")
+        & filter_range(
+            col2, "Aspect ratio", anomalies["aspect_ratio"], f"aspect_{split}"
+        )
+    )
+    image_names = anomaly_index.image_names[anomaly_index.rank_images(mask)]
+    if not len(image_names):
+        st.info("No anomalies match the filters.")
+        return
+
+    num_pages = -(-len(image_names) // GALLERY_PAGE_SIZE)
+    # Narrower filters can leave the selected page past the last one
+    if st.session_state.get(f"page_{split}", 1) > num_pages:
+        st.session_state[f"page_{split}"] = num_pages
+    page = st.number_input(
+        f"Page (of {num_pages}, {len(image_names)} images, {mask.sum()} anomalies)",
+        min_value=1,
+        max_value=num_pages,
+        key=f"page_{split}",
+    )
+    start = (page - 1) * GALLERY_PAGE_SIZE
+    visible = image_names[start : start + GALLERY_PAGE_SIZE].tolist()
+    upcoming = image_names[
+        start + GALLERY_PAGE_SIZE : start + 2 * GALLERY_PAGE_SIZE
+    ].tolist()
+
+    executor = get_gallery_executor()
+    thumbnail_cache = get_thumbnail_cache()
+    thumbnails = list(
+        executor.map(
+            lambda img_name: get_annotated_image(
+                img_name, anomaly_index, thumbnail_cache
+            ),
+            visible,
+        )
+    )
+    # Rendered while the page is viewed, so the next page is served from the cache
+    for img_name in upcoming:
+        executor.submit(get_annotated_image, img_name, anomaly_index, thumbnail_cache)
+
+    cols = st.columns(GALLERY_COLUMNS)
+    for i, (img_name, annotated) in enumerate(zip(visible, thumbnails)):
+        with cols[i % GALLERY_COLUMNS]:
+            if annotated:
+                st.image(
+                    annotated,
+                    caption=f"/{split}/{img_name}",
+                    use_container_width=True,
+                )
+            else:
+                st.warning(f"File {img_name} not found in path.")
+
+
+def filter_range(container, label: str, values: pd.Series, key: str) -> np.ndarray:
+    """
+    Renders a range slider over the finite values of a column and returns the mask of
+    the selected rows. Rows with a missing or infinite value are only kept while the
+    whole range is selected.
+
+    :param container: The container the slider is rendered in
+    :param label: The label of the slider
+    :type label: str
+    :param values: The values to filter
+    :type values: pd.Series
+    :param key: The key of the slider widget
+    :type key: str
+    :return: Mask of the rows within the selected range
+    :rtype: np.ndarray
+    """
+    values = values.to_numpy(np.float64)
+    finite = values[np.isfinite(values)]
+    if not len(finite) or finite.min() == finite.max():
+        return np.ones(len(values), dtype=bool)
+    full_range = (float(finite.min()), float(finite.max()))
+    low, high = container.slider(label, *full_range, full_range, key=key)
+    if (low, high) == full_range:
+        return np.ones(len(values), dtype=bool)
+    return (values >= low) & (values <= high)
+
+
+@st.cache_resource
+def get_gallery_executor() -> ThreadPoolExecutor:
+    """
+    Returns the thread pool rendering the thumbnails, shared by all sessions
+
+    :return: The thread pool
+    :rtype: ThreadPoolExecutor
+    """
+    return ThreadPoolExecutor(GALLERY_WORKERS, thread_name_prefix="thumbnails")
+
+
+@st.cache_resource
+def get_thumbnail_cache() -> ThumbnailCache:
+    """
+    Returns the thumbnail cache, shared by all sessions so its size is tracked once
+
+    :return: The thumbnail cache
+    :rtype: ThumbnailCache
+    """
+    return ThumbnailCache()
+
+
+def get_annotated_image(
+    img_name: str, anomaly_index: AnomalyIndex, thumbnail_cache: ThumbnailCache
+) -> Path | None:
+    """
+    Gets the annotated thumbnail of an image to render in the UI. Thumbnails of the
+    top images are rendered by the processing job, the others on first use.
 
     :param img_name: Name of the image
     :type img_name: str
-    :param dataframe: Search df for image details
-    :type dataframe: pd.DataFrame
-    """
-    row_info = dataframe[dataframe["image_name"] == img_name].iloc[0]
-    # Ok haha I guess I don't need to pass split as param
-    split = row_info["split"]
-    img_path = (
-        Path(NETWORK_MOUNT)
-        / "bdd100k_images_100k"
-        / "bdd100k"
-        / "images"
-        / "100k"
-        / split
-        / img_name
-    )
-    try:
-        img = Image.open(img_path).convert("RGB")
-        draw = ImageDraw.Draw(img)
-        img_annos = dataframe[dataframe["image_name"] == img_name]
-
-        for _, row in img_annos.iterrows():
-            # Ensure coordinates are numeric and ordered correctly
-            try:
-                # Pillow needs [x0, y0, x1, y1] where x0 < x1 and y0 < y1
-                coords = [
-                    float(row["x1"]),
-                    float(row["y1"]),
-                    float(row["x2"]),
-                    float(row["y2"]),
-                ]
-                # Re-order just in case they are flipped
-                shape = [
-                    min(coords[0], coords[2]),
-                    min(coords[1], coords[3]),
-                    max(coords[0], coords[2]),
-                    max(coords[1], coords[3]),
-                ]
-
-                color = "#FF0000" if row["type"] == 1 else "#0000FF"
-                draw.rectangle(shape, outline=color, width=4)
-                draw.text((shape[0], shape[1] - 12), str(row["category"]), fill=color)
-            except (ValueError, TypeError):
-                continue  # Skip rows with bad data
-
-        return img
-    except FileNotFoundError:
-        return None
+    :param anomaly_index: Index of the anomalies of the split by image
+    :type anomaly_index: AnomalyIndex
+    :param thumbnail_cache: The cache the thumbnail is looked up in and stored to
+    :type thumbnail_cache: ThumbnailCache
+    :return: Path of the thumbnail, or None if the image is not found
+    :rtype: Path | None
+    """
+    img_annos = anomaly_index.get(img_name)
+    split = str(img_annos["split"].iloc[0])
+    return get_thumbnail(split, img_name, img_annos, thumbnail_cache)
 
 
 populate_anomaly_identification_page()
@@ -3,11 +3,12 @@ Class visualizer page
 """
 
 import streamlit as st
-from pathlib import Path
-import pandas as pd
-import seaborn as sns
-from config import CSV_DIR
-import matplotlib.pyplot as plt
+import plotly.express as px
+import plotly.graph_objects as go
+from analysis.area_cube import AreaCube
+from analysis.category_statistics import CATEGORY_NAMES, SIZE_GROUP_NAMES
+from config import CATEGORIES
+from data_access import get_area_cube, has_outputs
 
 
 def populate_class_visualizer_page():
@@ -26,27 +27,25 @@ def populate_class_visualizer_page():
             This section contains a visualizer that lets you filter the train dataset using UI controls
         """
     )
-    csv_files = sorted(Path(CSV_DIR).glob("*.csv"))
-
-    if not csv_files:
+    if not has_outputs():
         st.warning(
             'Please use the sidebar navigation to navigate to the page called "Process Dataset" and process the dataset first. Thank you.'
         )
     else:
-        df = load_data()
+        area_cube = load_data()
         st.sidebar.header("Filter Statistics")
 
         selected_cats = st.sidebar.multiselect(
             "Select Categories",
-            options=list(CATEGORIES_MAP.values()),
+            options=list(CATEGORIES),
             default=["traffic light", "car", "person"],  # Default focus
         )
 
         # 2. Size Group Filter
         selected_sizes = st.sidebar.multiselect(
             "Select COCO Size Groups",
-            options=["Small", "Medium", "Large"],
-            default=["Small", "Medium", "Large"],
+            options=SIZE_GROUP_NAMES,
+            default=SIZE_GROUP_NAMES,
         )
 
         # 3. Boolean Filters
@@ -56,68 +55,32 @@ def populate_class_visualizer_page():
         filter_truncated = st.sidebar.radio(
             "Truncation Filter", ["All", "Only Truncated", "Only Non-Truncated"]
         )
+        occluded = FLAG_FILTERS[filter_occluded]
+        truncated = FLAG_FILTERS[filter_truncated]
 
-        mask = (df["category_name"].isin(selected_cats)) & (
-            df["size_name"].isin(selected_sizes)
-        )
-
-        if filter_occluded == "Only Occluded":
-            mask &= df["occluded"]
-        elif filter_occluded == "Only Non-Occluded":
-            mask &= not df["occluded"]
-
-        if filter_truncated == "Only Truncated":
-            mask &= df["truncated"]
-        elif filter_truncated == "Only Non-Truncated":
-            mask &= not df["truncated"]
-
-        filtered_df = df[mask]
+        # Every filter combination is answered by merging cells of the cube
+        categories = sorted(CATEGORIES[category] for category in selected_cats)
+        sizes = [SIZE_GROUP_NAMES.index(size) for size in selected_sizes]
+        summary = area_cube.summarize(categories, sizes, occluded, truncated)
 
-        if filtered_df.empty:
+        if not summary.count:
             st.warning("No data found for the selected filters.")
         else:
             st.subheader(f"Area Distribution for {', '.join(selected_cats)}")
 
-            # Create static plot
-            fig, ax = plt.subplots(figsize=(12, 6))
-
-            sns.boxplot(
-                data=filtered_df,
-                x="category_name",
-                y="area",
-                hue="size_name",  # Color-code by S/M/L
-                hue_order=["Small", "Medium", "Large"],
-                ax=ax,
-                showfliers=False,  # ESSENTIAL: Keeps memory usage low for 160k+ rows
+            st.plotly_chart(
+                plot_boxplot(area_cube, categories, sizes, occluded, truncated),
+                use_container_width=True,
             )
 
-            num_cats = len(filtered_df["category_name"].unique())
-
-            # Draw a vertical line at every 'half' position between categories
-            for i in range(num_cats - 1):
-                ax.axvline(i + 0.5, color="gray", linestyle="--", alpha=0.3, lw=1)
-
-            ax.set_yscale("log")
-            ax.set_title("Bounding Box Area by Category (S/M/L Groups Separated)")
-            ax.set_ylabel("Area (Log Scale)")
-            ax.set_xlabel("Object Category")
-
-            # Move legend to the outside so it doesn't overlap data
-            ax.legend(title="Size Group", bbox_to_anchor=(1.05, 1), loc="upper left")
-
-            plt.xticks(rotation=45)
-            plt.tight_layout()  # Ensures labels aren't cut off
-
-            st.pyplot(fig)
-
             col1, col2, col3, col4 = st.columns(4)
-            col1.metric("Total Instances", f"{len(filtered_df):,}")
-            col2.metric("Median Area", f"{int(filtered_df['area'].median())} px")
+            col1.metric("Total Instances", f"{summary.count:,}")
+            col2.metric("Median Area", f"{int(summary.quantiles([0.5])[0])} px")
             col3.metric(
-                "Occlusion Rate", f"{(filtered_df['occluded'].mean() * 100):.1f}%"
+                "Occlusion Rate", f"{(summary.occluded / summary.count * 100):.1f}%"
             )
             col4.metric(
-                "Truncated Rate", f"{(filtered_df['truncated'].mean() * 100):.1f}%"
+                "Truncated Rate", f"{(summary.truncated / summary.count * 100):.1f}%"
             )
 
             st.write("""
@@ -125,34 +88,86 @@ def populate_class_visualizer_page():
             It basically confirms that the dataset is full of small and medium sized images.""")
 
 
-CATEGORIES_MAP = {
-    0: "traffic sign",
-    1: "traffic light",
-    2: "car",
-    3: "rider",
-    4: "motor",
-    5: "person",
-    6: "bus",
-    7: "truck",
-    8: "bike",
-    9: "train",
+def plot_boxplot(
+    area_cube: AreaCube,
+    categories: list[int],
+    sizes: list[int],
+    occluded: bool | None,
+    truncated: bool | None,
+) -> go.Figure:
+    """
+    Plots the area boxplot of every selected category and size group. Only the
+    precomputed quartiles, whiskers and means of the boxes are sent to the browser,
+    which draws the figure.
+
+    :param area_cube: The area cube of the train split
+    :type area_cube: AreaCube
+    :param categories: Selected category ids
+    :type categories: list[int]
+    :param sizes: Selected size groups
+    :type sizes: list[int]
+    :param occluded: Occlusion filter, None for all boxes
+    :type occluded: bool | None
+    :param truncated: Truncation filter, None for all boxes
+    :type truncated: bool | None
+    :return: The boxplot figure
+    :rtype: Figure
+    """
+    colors = px.colors.qualitative.Plotly
+    fig = go.Figure()
+    for size in sizes:
+        names, stats = [], []
+        for category in categories:
+            cell = area_cube.summarize([category], [size], occluded, truncated)
+            if cell.count:
+                names.append(CATEGORY_NAMES[category])
+                stats.append(cell.box_stats())
+        if not stats:
+            continue
+        fig.add_trace(
+            go.Box(
+                name=SIZE_GROUP_NAMES[size],
+                x=names,
+                lowerfence=[stat["whislo"] for stat in stats],
+                q1=[stat["q1"] for stat in stats],
+                median=[stat["med"] for stat in stats],
+                q3=[stat["q3"] for stat in stats],
+                upperfence=[stat["whishi"] for stat in stats],
+                mean=[stat["mean"] for stat in stats],
+                marker_color=colors[size],
+            )
+        )
+    fig.update_layout(
+        title="Bounding Box Area by Category (S/M/L Groups Separated)",
+        boxmode="group",
+        height=550,
+        legend_title_text="Size Group",
+        xaxis_title="Object Category",
+        yaxis_title="Area (Log Scale)",
+        yaxis_type="log",
+    )
+    return fig
+
+
+# Value of the occluded and truncated arguments of AreaCube.summarize for every option
+FLAG_FILTERS = {
+    "All": None,
+    "Only Occluded": True,
+    "Only Non-Occluded": False,
+    "Only Truncated": True,
+    "Only Non-Truncated": False,
 }
-SIZE_NAME_MAP = {0: "Small", 1: "Medium", 2: "Large"}
 
 
-@st.cache_data
-def load_data():
+def load_data() -> AreaCube:
     """
-    Reads csv file from path and caches it
+    Returns the cube of the train box areas, shared by all sessions. The cube is a few
+    hundred kilobytes, instead of one row per box.
+
+    :return: The area cube of the train split
+    :rtype: AreaCube
     """
-    # Update this path to your actual filename in Docker
-    records_path = Path(CSV_DIR) / "records_train.csv"
-    df = pd.read_csv(records_path)
-
-    # Map the IDs to names for the UI and Plot labels
-    df["category_name"] = df["category"].map(CATEGORIES_MAP)
-    df["size_name"] = df["size_group"].map(SIZE_NAME_MAP)
-    return df
+    return get_area_cube("train")
 
 
 populate_class_visualizer_page()
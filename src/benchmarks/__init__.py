@@ -0,0 +1,3 @@
+"""
+Init file to help install benchmarks module
+"""
@@ -0,0 +1,150 @@
+"""
+Benchmark comparing the images per second of the image loading paths.
+
+The full path decodes every JPEG at its full size with PIL and resizes it, as the
+training and evaluation notebooks used to. The draft path loads the images with
+analysis.image_loading, which decodes them at a reduced size first. The cached path
+loads them again from a DecodedImageCache filled by a first pass. The mean absolute
+difference of the pixels of the draft path from the full path is reported as well.
+Without --images-dir, --synthetic-images JPEGs of the size of the dataset images are
+generated in a temporary directory.
+
+Usage: python -m benchmarks.image_loading [--images-dir DIR | --synthetic-images N]
+    [--limit N] [--size 320 320] [--repeat N]
+"""
+
+import argparse
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from analysis.image_loading import DecodedImageCache, get_image_bytes, load_image
+from config import IMAGE_HEIGHT, IMAGE_WIDTH, TRAINING_IMAGE_SIZE
+
+
+def load_full_image(image_path: Path, size: tuple[int, int]) -> Image.Image:
+    """
+    Loads an image the way the notebooks did before the draft path, decoding it at
+    its full size and then resizing it
+
+    :param image_path: The path to the image
+    :type image_path: Path
+    :param size: Width and height of the returned image
+    :type size: tuple[int, int]
+    :return: The resized RGB image
+    :rtype: Image
+    """
+    with Image.open(image_path) as image:
+        return image.convert("RGB").resize(size)
+
+
+def write_synthetic_images(directory: Path, count: int, seed: int = 0) -> list[Path]:
+    """
+    Writes JPEGs of the size of the dataset images, made of smooth noise so that they
+    compress about as well as photographs
+
+    :param directory: Directory the images are written to
+    :type directory: Path
+    :param count: Number of images
+    :type count: int
+    :param seed: Seed of the random generator
+    :type seed: int
+    :return: The paths of the images
+    :rtype: list[Path]
+    """
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        noise = rng.integers(0, 256, (IMAGE_HEIGHT // 8, IMAGE_WIDTH // 8, 3))
+        path = directory / f"{i:08d}.jpg"
+        Image.fromarray(noise.astype(np.uint8)).resize(
+            (IMAGE_WIDTH, IMAGE_HEIGHT), Image.BILINEAR
+        ).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def benchmark_path(
+    image_paths: list[Path], load: Callable[[Path], Image.Image], repeat: int
+) -> float:
+    """
+    Loads every image with a loading path and returns the best throughput of the runs
+
+    :param image_paths: The paths of the images
+    :type image_paths: list[Path]
+    :param load: Function loading an image from its path
+    :type load: Callable[[Path], Image]
+    :param repeat: Number of runs
+    :type repeat: int
+    :return: The images per second of the fastest run
+    :rtype: float
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for image_path in image_paths:
+            load(image_path)
+        best = min(best, time.perf_counter() - start)
+    return len(image_paths) / best
+
+
+def main() -> None:
+    """
+    Runs the benchmark and prints the images per second of every loading path
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images-dir", type=Path, help="Directory of JPEG images")
+    parser.add_argument("--synthetic-images", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--size", type=int, nargs=2, default=[TRAINING_IMAGE_SIZE] * 2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    size = tuple(args.size)
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        if args.images_dir:
+            image_paths = sorted(args.images_dir.glob("*.jpg"))[: args.limit]
+        else:
+            image_paths = write_synthetic_images(
+                Path(temporary_dir), args.synthetic_images
+            )
+        if not image_paths:
+            parser.error(f"No JPEG images in {args.images_dir}")
+
+        cache = DecodedImageCache(
+            max_bytes=len(image_paths) * get_image_bytes(Image.new("RGB", size))
+        )
+        paths = {
+            "full": lambda path: load_full_image(path, size),
+            "draft": lambda path: load_image(path, size)[0],
+            "cached": lambda path: load_image(path, size, cache)[0],
+        }
+        # Fills the cache, so the cached path is timed on hits only
+        benchmark_path(image_paths, paths["cached"], 1)
+
+        print(f"{len(image_paths)} images loaded at {size[0]} x {size[1]}")
+        print(f"{'path':<8}{'images/s':>10}{'speedup':>10}")
+        full_rate = None
+        for name, load in paths.items():
+            rate = benchmark_path(image_paths, load, args.repeat)
+            full_rate = full_rate or rate
+            print(f"{name:<8}{rate:>10.0f}{rate / full_rate:>9.1f}x")
+
+        difference = np.mean(
+            [
+                np.abs(
+                    np.asarray(paths["draft"](path), dtype=np.int16)
+                    - np.asarray(load_full_image(path, size), dtype=np.int16)
+                ).mean()
+                for path in image_paths
+            ]
+        )
+        print(f"Mean absolute pixel difference of draft from full: {difference:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark comparing the label parsing throughput of every available JSON backend.
+
+Usage: python -m benchmarks.json_backends [--labels-dir DIR] [--splits train val]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from analysis.dataset_analyzer import DatasetAnalyzer
+from analysis.json_backends import get_available_backends, iter_label_objects
+from config import BDD_LABELS_PREFIX
+
+
+def benchmark_backend(label_file: Path, backend: str) -> tuple[int, float]:
+    """
+    Parses every label object of a file with one backend and times it
+
+    :param label_file: Path to the BDD label file
+    :type label_file: Path
+    :param backend: Name of the JSON backend
+    :type backend: str
+    :return: The number of label objects and the elapsed time in seconds
+    :rtype: tuple[int, float]
+    """
+    start = time.perf_counter()
+    records = sum(1 for _ in iter_label_objects(label_file, backend))
+    return records, time.perf_counter() - start
+
+
+def main() -> None:
+    """
+    Runs the benchmark for the requested splits and prints the records per second
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--labels-dir",
+        type=Path,
+        default=DatasetAnalyzer().get_bdd_labels_path(),
+        help="Directory containing the BDD label files",
+    )
+    parser.add_argument("--splits", nargs="+", default=["train", "val"])
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=get_available_backends(),
+        help="Backends to compare (defaults to every installed backend)",
+    )
+    args = parser.parse_args()
+
+    print(f"{'split':<8}{'backend':<12}{'records':>10}{'seconds':>10}{'records/s':>12}")
+    for split in args.splits:
+        label_file = args.labels_dir / f"{BDD_LABELS_PREFIX}{split}.json"
+        for backend in args.backends:
+            records, elapsed = benchmark_backend(label_file, backend)
+            print(
+                f"{split:<8}{backend:<12}{records:>10}{elapsed:>10.2f}"
+                f"{records / elapsed:>12.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
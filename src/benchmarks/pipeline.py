@@ -0,0 +1,260 @@
+"""
+Benchmark of the dataset analysis pipeline.
+
+Times DatasetAnalyzer.compute_statistics and every save method of the statistics
+classes, records the throughput and the peak resident memory, and writes everything
+to a JSON report. When a baseline report is given, the stages that got slower than
+the tolerance allows are reported and the exit status is 1. Without --dataset-dir, a
+synthetic dataset of --synthetic-images images is generated in a temporary directory.
+
+Usage: python -m benchmarks.pipeline [--dataset-dir DIR | --synthetic-images N]
+    [--splits train val] [--workers N] [--json-backend NAME] [--label-cache]
+    [--repeat N] [--report FILE] [--baseline FILE] [--tolerance 0.1]
+"""
+
+import argparse
+import json
+import platform
+import resource
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+from analysis.category_statistics import CategoryStatistics
+from analysis.dataset_analyzer import DatasetAnalyzer
+from analysis.progress import ProgressReporter
+from analysis.scene_statistics import SceneStatistics
+from benchmarks.synthetic_labels import write_dataset
+from config import DATASET_SPLITS, NUM_WORKERS
+
+# Methods timed as separate stages, on top of compute_statistics as a whole
+TIMED_METHODS = [
+    (SceneStatistics, "save_csvs"),
+    (SceneStatistics, "save_category_distribution_csv"),
+    (SceneStatistics, "save_category_tensor"),
+    (CategoryStatistics, "save_stats_csv"),
+    (CategoryStatistics, "save_records"),
+    (CategoryStatistics, "save_anomalies"),
+    (CategoryStatistics, "save_area_cube"),
+    (CategoryStatistics, "save_issues_csv"),
+]
+
+
+def get_peak_rss_mb() -> dict[str, float]:
+    """
+    Returns the peak resident memory of this process and of its finished children
+
+    :return: The peaks in megabytes, with the keys self and children
+    :rtype: dict[str, float]
+    """
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2**20,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        * unit
+        / 2**20,
+    }
+
+
+@contextmanager
+def timed_methods(timings: dict[str, float]):
+    """
+    Temporarily wraps the methods in TIMED_METHODS so that the time spent in each of
+    them is added to timings
+
+    :param timings: Seconds spent in every method, keyed by the method name
+    :type timings: dict[str, float]
+    """
+    originals = [(cls, name, getattr(cls, name)) for cls, name in TIMED_METHODS]
+
+    def timed(name, method):
+        """
+        Wraps a method to time it
+
+        :param name: The key of the method in timings
+        :type name: str
+        :param method: The method to wrap
+        :return: The wrapped method
+        """
+
+        def wrapper(*args, **kwargs):
+            """
+            Calls the method and adds its duration to timings
+
+            :return: The return value of the method
+            """
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+        return wrapper
+
+    for cls, name, method in originals:
+        setattr(cls, name, timed(name, method))
+    try:
+        yield
+    finally:
+        for cls, name, method in originals:
+            setattr(cls, name, method)
+
+
+def benchmark_split(
+    dataset_analyzer: DatasetAnalyzer, split: str, args: argparse.Namespace
+) -> dict:
+    """
+    Runs the analysis of one split args.repeat times and keeps the fastest run
+
+    :param dataset_analyzer: The analyzer reading the dataset and writing the outputs
+    :type dataset_analyzer: DatasetAnalyzer
+    :param split: Name of the dataset split
+    :type split: str
+    :param args: The command line arguments
+    :type args: Namespace
+    :return: The timings, throughput and memory use of the split
+    :rtype: dict
+    """
+    best = None
+    for _ in range(args.repeat):
+        stages = {}
+        progress = ProgressReporter(interval=None)
+        with timed_methods(stages):
+            start = time.perf_counter()
+            json_backend = dataset_analyzer.compute_statistics(
+                split,
+                progress,
+                num_workers=args.workers,
+                json_backend=args.json_backend,
+                use_label_cache=args.label_cache,
+            )
+            stages["compute_statistics"] = time.perf_counter() - start
+        stages["parse_and_compute"] = stages["compute_statistics"] - sum(
+            seconds
+            for name, seconds in stages.items()
+            if name not in ("compute_statistics", "parse_and_compute")
+        )
+        if best is None or stages["compute_statistics"] < best[0]["compute_statistics"]:
+            best = (stages, json_backend, progress.count)
+
+    stages, json_backend, images = best
+    stats = pd.read_csv(
+        Path(dataset_analyzer.output_dir) / f"category_stats_{split}.csv"
+    )
+    boxes = int(stats["total_count"].sum())
+    seconds = stages["compute_statistics"]
+    return {
+        "json_backend": json_backend,
+        "images": images,
+        "boxes": boxes,
+        "seconds": seconds,
+        "images_per_second": images / seconds,
+        "boxes_per_second": boxes / seconds,
+        "stages": stages,
+        "peak_rss_mb": get_peak_rss_mb(),
+    }
+
+
+def compare_reports(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compares the stage timings of a report with the ones of a baseline report
+
+    :param report: The report of the current run
+    :type report: dict
+    :param baseline: The report of the reference run
+    :type baseline: dict
+    :param tolerance: Allowed relative slowdown, e.g. 0.1 for 10%
+    :type tolerance: float
+    :return: One line per stage that got slower than allowed
+    :rtype: list[str]
+    """
+    regressions = []
+    for split, result in report["splits"].items():
+        baseline_stages = baseline.get("splits", {}).get(split, {}).get("stages", {})
+        for stage, seconds in result["stages"].items():
+            reference = baseline_stages.get(stage)
+            if reference and seconds > reference * (1 + tolerance):
+                regressions.append(
+                    f"{split} {stage}: {seconds:.3f} s vs {reference:.3f} s"
+                    f" (+{(seconds / reference - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def main() -> int:
+    """
+    Runs the benchmark, writes the report and compares it with the baseline
+
+    :return: The exit status, 1 if a regression was found
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dataset-dir", type=Path)
+    parser.add_argument("--synthetic-images", type=int, default=10000)
+    parser.add_argument("--splits", nargs="+", default=list(DATASET_SPLITS))
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--json-backend", default="auto")
+    parser.add_argument("--label-cache", action="store_true")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--report", type=Path, default=Path("benchmark_report.json"))
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporary_dir:
+        dataset_dir = args.dataset_dir
+        if dataset_dir is None:
+            dataset_dir = Path(temporary_dir) / "data"
+            write_dataset(
+                dataset_dir,
+                {
+                    split: max(args.synthetic_images // (7 if split == "val" else 1), 1)
+                    for split in args.splits
+                },
+            )
+        dataset_analyzer = DatasetAnalyzer(
+            dataset_dir,
+            Path(temporary_dir) / "outputs",
+            Path(temporary_dir) / "cache",
+        )
+        report = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dataset_dir": str(args.dataset_dir) if args.dataset_dir else "synthetic",
+            "workers": args.workers,
+            "label_cache": args.label_cache,
+            "splits": {
+                split: benchmark_split(dataset_analyzer, split, args)
+                for split in args.splits
+            },
+        }
+
+    args.report.write_text(json.dumps(report, indent=2))
+    print(f"{'split':<8}{'images':>10}{'seconds':>10}{'images/s':>12}{'peak MB':>10}")
+    for split, result in report["splits"].items():
+        print(
+            f"{split:<8}{result['images']:>10}{result['seconds']:>10.2f}"
+            f"{result['images_per_second']:>12.0f}{result['peak_rss_mb']['self']:>10.0f}"
+        )
+    print(f"Report written to {args.report}")
+
+    if args.baseline:
+        regressions = compare_reports(
+            report, json.loads(args.baseline.read_text()), args.tolerance
+        )
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            return 1
+        print(f"No regression compared to {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
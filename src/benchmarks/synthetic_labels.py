@@ -0,0 +1,271 @@
+"""
+Generator of synthetic label files in the BDD100K format, so that the analysis can be
+benchmarked without the real dataset.
+
+The frequencies of the categories and of the weather, scene and time of day attributes
+follow the ones of the BDD100K train split. Box areas are drawn from a per category
+log-normal distribution and a small share of the boxes are made tiny or extremely
+thin, so that both kinds of anomalies occur. Every image also carries a drivable area
+and a lane label, like the real files, so parsing costs are comparable.
+
+Usage: python -m benchmarks.synthetic_labels --dataset-dir DIR [--train-images N]
+    [--val-images N] [--seed SEED]
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from config import BDD_LABELS_PREFIX, IMAGE_HEIGHT, IMAGE_WIDTH
+
+# Average number of boxes of the 10 categories per image
+BOXES_PER_IMAGE = 18.4
+# Share of the boxes that are made tiny, and that are made extremely thin
+TINY_BOX_RATE = 0.02
+THIN_BOX_RATE = 0.005
+# Number of boxes of every category in the train split
+CATEGORY_COUNTS = {
+    "car": 713211,
+    "traffic sign": 239686,
+    "traffic light": 186117,
+    "person": 91349,
+    "truck": 29971,
+    "bus": 11672,
+    "bike": 7210,
+    "rider": 4517,
+    "motor": 3002,
+    "train": 136,
+}
+# Median area in pixels and median width / height ratio of the boxes of every category
+CATEGORY_SHAPES = {
+    "car": (2500, 1.3),
+    "traffic sign": (500, 1.2),
+    "traffic light": (300, 0.5),
+    "person": (1200, 0.4),
+    "truck": (8000, 1.2),
+    "bus": (10000, 1.2),
+    "bike": (1500, 1.0),
+    "rider": (1800, 0.5),
+    "motor": (2000, 1.0),
+    "train": (15000, 1.5),
+}
+WEATHER_COUNTS = {
+    "clear": 37344,
+    "overcast": 8770,
+    "undefined": 8119,
+    "snowy": 5549,
+    "rainy": 5070,
+    "partly cloudy": 4881,
+    "foggy": 130,
+}
+SCENE_COUNTS = {
+    "city street": 43516,
+    "highway": 17379,
+    "residential": 8074,
+    "parking lot": 377,
+    "undefined": 361,
+    "tunnel": 129,
+    "gas stations": 27,
+}
+TIMEOFDAY_COUNTS = {
+    "daytime": 36728,
+    "night": 27971,
+    "dawn/dusk": 5027,
+    "undefined": 137,
+}
+TRAFFIC_LIGHT_COLORS = {"green": 0.4, "red": 0.3, "yellow": 0.05, "none": 0.25}
+
+
+def choose(rng: np.random.Generator, counts: dict, size: int | None = None):
+    """
+    Draws values with probabilities proportional to their counts
+
+    :param rng: The random number generator
+    :type rng: np.random.Generator
+    :param counts: The count of every value
+    :type counts: dict
+    :param size: Number of values to draw, or None for a single value
+    :type size: int | None
+    :return: The drawn value or an array of drawn values
+    """
+    weights = np.array(list(counts.values()), dtype=np.float64)
+    return rng.choice(list(counts), size=size, p=weights / weights.sum())
+
+
+def generate_boxes(rng: np.random.Generator, categories: np.ndarray) -> np.ndarray:
+    """
+    Draws a bounding box for every label
+
+    :param rng: The random number generator
+    :type rng: np.random.Generator
+    :param categories: The category of every label
+    :type categories: np.ndarray
+    :return: N x 4 array of x1, y1, x2, y2 coordinates, rounded like the real labels
+    :rtype: np.ndarray
+    """
+    median_area, median_aspect = (
+        np.array(
+            [CATEGORY_SHAPES[category] for category in categories], dtype=np.float64
+        )
+        .reshape(-1, 2)
+        .T
+    )
+    area = median_area * rng.lognormal(0.0, 1.2, len(categories))
+    aspect = median_aspect * rng.lognormal(0.0, 0.3, len(categories))
+    tiny = rng.random(len(categories)) < TINY_BOX_RATE
+    area[tiny] = rng.uniform(4, 256, tiny.sum())
+    thin = rng.random(len(categories)) < THIN_BOX_RATE
+    aspect[thin] = np.where(
+        rng.random(thin.sum()) < 0.5,
+        rng.uniform(0.02, 0.1, thin.sum()),
+        rng.uniform(10, 30, thin.sum()),
+    )
+    width = np.clip(np.sqrt(area * aspect), 1, IMAGE_WIDTH - 1)
+    height = np.clip(np.sqrt(area / aspect), 1, IMAGE_HEIGHT - 1)
+    x1 = rng.uniform(0, IMAGE_WIDTH - width)
+    y1 = rng.uniform(0, IMAGE_HEIGHT - height)
+    return np.round(np.column_stack((x1, y1, x1 + width, y1 + height)), 6)
+
+
+def generate_image(rng: np.random.Generator, index: int) -> dict:
+    """
+    Draws the label object of one image
+
+    :param rng: The random number generator
+    :type rng: np.random.Generator
+    :param index: Index of the image, used to derive its name
+    :type index: int
+    :return: The label object, in the format of the BDD label files
+    :rtype: dict
+    """
+    categories = choose(rng, CATEGORY_COUNTS, rng.poisson(BOXES_PER_IMAGE))
+    boxes = generate_boxes(rng, categories)
+    occluded = rng.random(len(categories)) < 0.47
+    truncated = rng.random(len(categories)) < 0.07
+    labels = []
+    for label_id, category in enumerate(categories):
+        color = (
+            str(choose(rng, TRAFFIC_LIGHT_COLORS))
+            if category == "traffic light"
+            else "none"
+        )
+        x1, y1, x2, y2 = boxes[label_id].tolist()
+        labels.append(
+            {
+                "category": str(category),
+                "attributes": {
+                    "occluded": bool(occluded[label_id]),
+                    "truncated": bool(truncated[label_id]),
+                    "trafficLightColor": color,
+                },
+                "manualShape": True,
+                "manualAttributes": True,
+                "box2d": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
+                "id": label_id,
+            }
+        )
+    vertices = np.round(rng.uniform(0, [IMAGE_WIDTH, IMAGE_HEIGHT], (6, 2)), 6).tolist()
+    labels.append(
+        {
+            "category": "drivable area",
+            "attributes": {"areaType": "direct"},
+            "manualShape": True,
+            "manualAttributes": True,
+            "poly2d": [{"vertices": vertices, "types": "LLLLLL", "closed": True}],
+            "id": len(labels),
+        }
+    )
+    labels.append(
+        {
+            "category": "lane",
+            "attributes": {
+                "laneDirection": "parallel",
+                "laneStyle": "solid",
+                "laneType": "road curb",
+            },
+            "manualShape": True,
+            "manualAttributes": True,
+            "poly2d": [{"vertices": vertices[:2], "types": "LL", "closed": False}],
+            "id": len(labels),
+        }
+    )
+    return {
+        "name": f"{index:08x}-{rng.integers(1 << 32):08x}.jpg",
+        "attributes": {
+            "weather": str(choose(rng, WEATHER_COUNTS)),
+            "scene": str(choose(rng, SCENE_COUNTS)),
+            "timeofday": str(choose(rng, TIMEOFDAY_COUNTS)),
+        },
+        "timestamp": 10000,
+        "labels": labels,
+    }
+
+
+def write_label_file(
+    label_file: Path, num_images: int, seed: int = 0, indent: int | None = 4
+) -> None:
+    """
+    Writes a synthetic label file one image at a time, so memory use stays constant
+
+    :param label_file: Destination of the label file
+    :type label_file: Path
+    :param num_images: Number of images in the file
+    :type num_images: int
+    :param seed: Seed of the random number generator
+    :type seed: int
+    :param indent: Indentation of the JSON, or None for a compact file
+    :type indent: int | None
+    """
+    rng = np.random.default_rng(seed)
+    label_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(label_file, "w") as f:
+        f.write("[")
+        for index in range(num_images):
+            if index:
+                f.write(",")
+            f.write(json.dumps(generate_image(rng, index), indent=indent))
+        f.write("]")
+
+
+def write_dataset(
+    dataset_dir: Path, split_sizes: dict[str, int], seed: int = 0
+) -> None:
+    """
+    Writes a synthetic label file for every split, in the directory layout of the
+    BDD100K dataset
+
+    :param dataset_dir: Directory standing in for the dataset mount
+    :type dataset_dir: Path
+    :param split_sizes: Number of images of every split
+    :type split_sizes: dict[str, int]
+    :param seed: Seed of the random number generator
+    :type seed: int
+    """
+    labels_dir = Path(dataset_dir) / "bdd100k_labels_release" / "bdd100k" / "labels"
+    for offset, (split, num_images) in enumerate(split_sizes.items()):
+        write_label_file(
+            labels_dir / f"{BDD_LABELS_PREFIX}{split}.json", num_images, seed + offset
+        )
+
+
+def main() -> None:
+    """
+    Writes a synthetic dataset with the requested number of images
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dataset-dir", type=Path, required=True)
+    parser.add_argument("--train-images", type=int, default=69863)
+    parser.add_argument("--val-images", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    write_dataset(
+        args.dataset_dir,
+        {"train": args.train_images, "val": args.val_images},
+        args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
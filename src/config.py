@@ -2,6 +2,8 @@
 This file contains constants and precomputed results which are used in other modules.
 """
 
+import os
+
 DATASET_SPLITS = {
     "train": {"count": 69863, "full_name": "Training"},
     "val": {"count": 10000, "full_name": "Validation"},
@@ -10,6 +12,16 @@ BDD_LABELS_PREFIX = "bdd100k_labels_images_"
 NETWORK_MOUNT = "/data"
 CSV_DIR = "/code/src/analysis/csv/"
 PRECOMPUTED_DIR = "/code/src/app/precomputed/"
+LABEL_CACHE_DIR = "/code/src/analysis/cache/"
+JOBS_DIR = "/code/src/analysis/jobs/"
+THUMBNAIL_DIR = "/code/src/analysis/thumbnails/"
+# Size of every image of the dataset, in pixels
+IMAGE_WIDTH = 1280
+IMAGE_HEIGHT = 720
+# Side of the square images the detector is trained on, a multiple of 32 for RF-DETR
+TRAINING_IMAGE_SIZE = 320
+# Number of processes used to parse each label file
+NUM_WORKERS = os.cpu_count() or 1
 CATEGORIES = {
     "traffic sign": 0,
     "traffic light": 1,
@@ -0,0 +1,121 @@
+"""
+File containing the fixtures shared by the tests: small random label files in the
+format of the BDD100K labels, and an analyzer saving their statistics to a temporary
+directory.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from analysis.dataset_analyzer import DatasetAnalyzer
+from config import BDD_LABELS_PREFIX, CATEGORIES
+
+WEATHER = ["clear", "overcast", "rainy", "snowy", "partly cloudy", "undefined"]
+SCENES = ["city street", "highway", "residential", "tunnel", "undefined"]
+TIMES_OF_DAY = ["daytime", "night", "dawn/dusk", "undefined"]
+
+
+def generate_label_object(rng: np.random.Generator, index: int) -> dict:
+    """
+    Draws the label object of one image. Some names hold quotes, brackets and
+    backslashes, and some boxes are tiny, huge or thin, so they are anomalies.
+    """
+    labels = []
+    for label_id in range(rng.integers(0, 12)):
+        width, height = rng.uniform(2, 300, 2).round(4)
+        kind = rng.random()
+        if kind < 0.1:
+            width, height = rng.uniform(2, 15, 2).round(4)
+        elif kind < 0.15:
+            width, height = 1100.5, 620.25
+        elif kind < 0.2:
+            height = round(rng.uniform(2, 40), 4)
+            width = round(height * rng.uniform(10, 20), 4)
+        x1, y1 = rng.uniform(0, [1280 - width, 720 - height]).round(4)
+        labels.append(
+            {
+                "category": str(rng.choice(list(CATEGORIES))),
+                "attributes": {
+                    "occluded": bool(rng.random() < 0.4),
+                    "truncated": bool(rng.random() < 0.1),
+                    "trafficLightColor": "none",
+                },
+                "manualShape": True,
+                "box2d": {
+                    "x1": float(x1),
+                    "y1": float(y1),
+                    "x2": float(x1 + width),
+                    "y2": float(y1 + height),
+                },
+                "id": int(label_id),
+            }
+        )
+    labels.append(
+        {
+            "category": "lane",
+            "attributes": {"laneDirection": "parallel"},
+            "poly2d": [{"vertices": [[0, 0], [10.5, 20]], "closed": False}],
+            "id": len(labels),
+        }
+    )
+    name = f"{index:06d}-{rng.integers(1 << 32):08x}.jpg"
+    if index % 7 == 3:
+        name = f'{index:06d} "quoted" [{{bracket}}] \\back\\slash\\.jpg'
+    return {
+        "name": name,
+        "attributes": {
+            "weather": str(rng.choice(WEATHER)),
+            "scene": str(rng.choice(SCENES)),
+            "timeofday": str(rng.choice(TIMES_OF_DAY)),
+        },
+        "timestamp": 10000,
+        "labels": labels,
+    }
+
+
+def write_label_file(label_file: Path, num_images: int, seed: int = 0) -> list[dict]:
+    """
+    Writes a random label file and returns its label objects
+    """
+    rng = np.random.default_rng(seed)
+    objects = [generate_label_object(rng, index) for index in range(num_images)]
+    label_file.parent.mkdir(parents=True, exist_ok=True)
+    label_file.write_text(json.dumps(objects, indent=4))
+    return objects
+
+
+@pytest.fixture
+def dataset_dir(tmp_path) -> Path:
+    """
+    A dataset mount holding the random label files of a train and a val split
+    """
+    dataset_dir = tmp_path / "dataset"
+    labels_dir = dataset_dir / "bdd100k_labels_release" / "bdd100k" / "labels"
+    write_label_file(labels_dir / f"{BDD_LABELS_PREFIX}train.json", 1500, seed=1)
+    write_label_file(labels_dir / f"{BDD_LABELS_PREFIX}val.json", 300, seed=2)
+    return dataset_dir
+
+
+@pytest.fixture
+def output_dir(tmp_path) -> Path:
+    """
+    The directory the statistics and their manifest are saved to
+    """
+    return tmp_path / "output"
+
+
+@pytest.fixture
+def analyzer(tmp_path, dataset_dir, output_dir) -> DatasetAnalyzer:
+    """
+    An analyzer of the random dataset, saving its outputs, label caches and
+    thumbnails to temporary directories
+    """
+    return DatasetAnalyzer(
+        str(dataset_dir),
+        str(output_dir),
+        str(tmp_path / "cache"),
+        str(tmp_path / "thumbnails"),
+    )
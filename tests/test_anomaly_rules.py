@@ -0,0 +1,325 @@
+"""
+File containing the tests of the anomaly rules, evaluated on hand-built label objects.
+"""
+
+import numpy as np
+import pytest
+
+from analysis.anomaly_rules import (
+    DEFAULT_RULES,
+    DENSE_GROUP_SIZE,
+    INVERTED,
+    NON_FINITE,
+    OPTIONAL_RULES,
+    VALID_GEOMETRY,
+    ZERO_SIZE,
+    AnomalyRuleSet,
+    OutOfFrameRule,
+    OverlapRule,
+    ThresholdRule,
+    ZeroSizeRule,
+    count_anomalies,
+    get_box_columns,
+)
+from analysis.box_batch import BoxBatch, BoxBatchBuilder
+from config import CATEGORIES
+
+# Hand-built boxes of the cars of a single image, by name
+BOXES = {
+    "valid": {"x1": 100, "y1": 100, "x2": 200, "y2": 150},
+    "zero width": {"x1": 10, "y1": 10, "x2": 10, "y2": 50},
+    "zero height": {"x1": 10, "y1": 10, "x2": 50, "y2": 10},
+    "zero size": {"x1": 10, "y1": 10, "x2": 10, "y2": 10},
+    "negative width": {"x1": 50, "y1": 10, "x2": 20, "y2": 60},
+    "negative height": {"x1": 10, "y1": 60, "x2": 50, "y2": 20},
+    "tiny": {"x1": 300, "y1": 300, "x2": 310, "y2": 305},
+    "thin": {"x1": 400, "y1": 100, "x2": 405, "y2": 300},
+    "left of frame": {"x1": -5, "y1": 10, "x2": 100, "y2": 100},
+    "below frame": {"x1": 500, "y1": 600, "x2": 600, "y2": 721},
+    "missing box2d": None,
+    "missing coordinate": {"x1": 10, "y1": 10, "y2": 50},
+    "null coordinate": {"x1": 10, "y1": None, "x2": 50, "y2": 50},
+    "text coordinate": {"x1": 10, "y1": "ten", "x2": 50, "y2": 50},
+}
+
+
+def get_batch(boxes: dict[str, dict | None]) -> BoxBatch:
+    """
+    Returns the batch of an image holding one car per box
+    """
+    labels = []
+    for label_id, box in enumerate(boxes.values()):
+        label = {"category": "car", "id": label_id}
+        if box is not None:
+            label["box2d"] = box
+        labels.append(label)
+    builder = BoxBatchBuilder()
+    builder.add_object({"name": "image.jpg", "attributes": {}, "labels": labels})
+    return builder.build()
+
+
+def get_columns(boxes: dict[str, dict | None]) -> dict[str, np.ndarray]:
+    """
+    Returns the rule columns of an image holding one car per box
+    """
+    return get_box_columns(get_batch(boxes))
+
+
+def get_flagged(rule, boxes: dict[str, dict | None] = BOXES) -> set[str]:
+    """
+    Returns the names of the boxes flagged by a rule
+    """
+    mask = rule.evaluate(get_columns(boxes))
+    return {name for name, flagged in zip(boxes, mask) if flagged}
+
+
+def test_box_columns():
+    """
+    Inverted boxes are measured between their sorted corners, and boxes without
+    finite coordinates get no size
+    """
+    columns = get_columns(BOXES)
+    index = {name: i for i, name in enumerate(BOXES)}
+    assert columns["width"][index["negative width"]] == 30
+    assert columns["height"][index["negative height"]] == 40
+    assert columns["area"][index["valid"]] == 5000
+    assert columns["aspect_ratio"][index["valid"]] == 2
+    assert np.isnan(columns["aspect_ratio"][index["zero height"]])
+    assert columns["aspect_ratio"][index["zero width"]] == 0
+    for name in ("missing box2d", "missing coordinate", "text coordinate"):
+        assert columns["width"][index[name]] == columns["height"][index[name]] == 0
+        assert np.isnan(columns["aspect_ratio"][index[name]])
+    assert not np.isnan(columns["area"]).any()
+
+
+def test_geometry_issues():
+    """
+    Every box gets the first issue it has
+    """
+    issues = dict(zip(BOXES, get_columns(BOXES)["geometry_issue"].tolist()))
+    assert issues == {
+        "valid": VALID_GEOMETRY,
+        "zero width": ZERO_SIZE,
+        "zero height": ZERO_SIZE,
+        "zero size": ZERO_SIZE,
+        "negative width": INVERTED,
+        "negative height": INVERTED,
+        "tiny": VALID_GEOMETRY,
+        "thin": VALID_GEOMETRY,
+        "left of frame": VALID_GEOMETRY,
+        "below frame": VALID_GEOMETRY,
+        "missing box2d": NON_FINITE,
+        "missing coordinate": NON_FINITE,
+        "null coordinate": NON_FINITE,
+        "text coordinate": NON_FINITE,
+    }
+
+
+def test_area_threshold_rule():
+    """
+    Boxes at most as large as the low limit are flagged
+    """
+    rule = ThresholdRule(0, "Area Anomaly", "area", low=16**2, high=1024 * 576)
+    assert get_flagged(rule) == {
+        "zero width",
+        "zero height",
+        "zero size",
+        "tiny",
+        # Boxes without coordinates have no area, the rule set leaves them out
+        "missing box2d",
+        "missing coordinate",
+        "null coordinate",
+        "text coordinate",
+    }
+
+
+def test_aspect_ratio_threshold_rule():
+    """
+    Boxes without a height have no aspect ratio and are never flagged
+    """
+    rule = ThresholdRule(1, "Aspect Ratio Anomaly", "aspect_ratio", low=0.1, high=10)
+    assert get_flagged(rule) == {"zero width", "thin"}
+
+
+def test_threshold_rule_category_limits():
+    """
+    The limits of a category override the default limits for its boxes only
+    """
+    rule = ThresholdRule(
+        0, "Area Anomaly", "area", low=100, category_limits={"car": [6000, None]}
+    )
+    columns = get_columns({"valid": BOXES["valid"], "tiny": BOXES["tiny"]})
+    assert rule.evaluate(columns).tolist() == [True, True]
+    columns["category"][:] = CATEGORIES["person"]
+    assert rule.evaluate(columns).tolist() == [False, True]
+
+
+def test_out_of_frame_rule():
+    """
+    Boxes with a corner outside of the image are flagged, within the tolerance
+    """
+    assert get_flagged(OutOfFrameRule(2, "Out of Frame")) == {
+        "left of frame",
+        "below frame",
+    }
+    assert get_flagged(OutOfFrameRule(2, "Out of Frame", tolerance=1)) == {
+        "left of frame"
+    }
+
+
+def test_zero_size_rule():
+    """
+    Boxes with a zero extent along a checked dimension are flagged, inverted boxes
+    are not since they are measured between their sorted corners
+    """
+    zero_size = {"zero width", "zero height", "zero size"}
+    missing = {
+        "missing box2d",
+        "missing coordinate",
+        "null coordinate",
+        "text coordinate",
+    }
+    assert get_flagged(ZeroSizeRule(3, "Zero Size")) == zero_size | missing
+    assert get_flagged(ZeroSizeRule(3, "Zero Height", ["height"])) == (
+        {"zero height", "zero size"} | missing
+    )
+    assert get_flagged(ZeroSizeRule(3, "Zero Width", ["width"])) == (
+        {"zero width", "zero size"} | missing
+    )
+
+
+def test_overlap_rule():
+    """
+    The later box of a duplicate pair is flagged, for inverted boxes too, but boxes
+    of different categories are only compared with any_category set
+    """
+    boxes = {
+        "first": {"x1": 100, "y1": 100, "x2": 200, "y2": 200},
+        "duplicate": {"x1": 100, "y1": 100, "x2": 200, "y2": 200},
+        "shifted": {"x1": 102, "y1": 101, "x2": 202, "y2": 201},
+        "half": {"x1": 150, "y1": 100, "x2": 250, "y2": 200},
+        "inverted": {"x1": 500, "y1": 500, "x2": 400, "y2": 400},
+        "inverted duplicate": {"x1": 400, "y1": 400, "x2": 500, "y2": 500},
+        "zero size": {"x1": 10, "y1": 10, "x2": 10, "y2": 10},
+        "zero size duplicate": {"x1": 10, "y1": 10, "x2": 10, "y2": 10},
+    }
+    rule = OverlapRule(4, "Duplicate Box", iou_threshold=0.9)
+    assert get_flagged(rule, boxes) == {
+        "duplicate",
+        "shifted",
+        "inverted duplicate",
+    }
+
+    columns = get_columns(boxes)
+    columns["category"][1] = CATEGORIES["truck"]
+    flagged = rule.evaluate(columns)
+    assert flagged.tolist()[:3] == [False, False, True]
+    any_category = OverlapRule(4, "Overlap", iou_threshold=0.9, any_category=True)
+    assert any_category.evaluate(columns).tolist()[:3] == [False, True, True]
+
+
+def get_naive_overlaps(columns: dict[str, np.ndarray], iou_threshold: float):
+    """
+    Flags the later box of every overlapping pair by comparing every pair of boxes
+    """
+    x1 = np.minimum(columns["x1"], columns["x2"])
+    y1 = np.minimum(columns["y1"], columns["y2"])
+    x2 = np.maximum(columns["x1"], columns["x2"])
+    y2 = np.maximum(columns["y1"], columns["y2"])
+    mask = np.zeros(len(x1), dtype=bool)
+    for j in range(len(x1)):
+        for i in range(j):
+            if (columns["image_index"][i], columns["category"][i]) != (
+                columns["image_index"][j],
+                columns["category"][j],
+            ):
+                continue
+            width = min(x2[i], x2[j]) - max(x1[i], x1[j])
+            height = min(y2[i], y2[j]) - max(y1[i], y1[j])
+            intersection = max(width, 0) * max(height, 0)
+            union = (x2[i] - x1[i]) * (y2[i] - y1[i]) + (x2[j] - x1[j]) * (
+                y2[j] - y1[j]
+            )
+            union -= intersection
+            if intersection > 0 and intersection / union >= iou_threshold:
+                mask[j] = True
+    return mask
+
+
+@pytest.mark.parametrize("iou_threshold", [0.5, 0.9, 1.0])
+def test_overlap_sweep_matches_pairwise(iou_threshold):
+    """
+    The sweep of the dense groups flags the same boxes as comparing every pair
+    """
+    rng = np.random.default_rng(0)
+    size = 3 * DENSE_GROUP_SIZE
+    x1 = rng.integers(0, 300, size).astype(float)
+    y1 = rng.integers(0, 200, size).astype(float)
+    width = rng.integers(0, 40, size)
+    height = rng.integers(0, 40, size)
+    # Copies and near copies of earlier boxes, some of them inverted
+    source = rng.integers(0, size // 2, size // 2)
+    x1[size // 2 :] = x1[source] + rng.integers(0, 2, len(source))
+    y1[size // 2 :] = y1[source]
+    width[size // 2 :] = width[source]
+    height[size // 2 :] = height[source]
+    boxes = {
+        str(i): {
+            "x1": x1[i],
+            "y1": y1[i],
+            "x2": x1[i] + width[i],
+            "y2": y1[i] + height[i],
+        }
+        for i in range(size)
+    }
+    for i in range(0, size, 7):
+        boxes[str(i)]["x1"], boxes[str(i)]["x2"] = (
+            boxes[str(i)]["x2"],
+            boxes[str(i)]["x1"],
+        )
+    columns = get_columns(boxes)
+    # Two categories, so the image holds a dense group and a small group
+    columns["category"][rng.random(size) < 0.2] = CATEGORIES["bus"]
+    expected = get_naive_overlaps(columns, iou_threshold)
+    assert expected.any()
+    rule = OverlapRule(4, "Duplicate Box", iou_threshold=iou_threshold)
+    np.testing.assert_array_equal(rule.evaluate(columns), expected)
+
+
+def test_rule_set_leaves_out_non_finite_boxes():
+    """
+    The default rules only flag the area and aspect ratio anomalies. With the
+    optional rules, the rule set returns the anomalies in label order then rule
+    order, never flags a box without finite coordinates, and counts them per
+    category and rule
+    """
+    assert list(AnomalyRuleSet().get_type_names()) == [0, 1]
+    rule_set = AnomalyRuleSet(DEFAULT_RULES + OPTIONAL_RULES)
+    columns = get_columns(BOXES)
+    rows, types = rule_set.evaluate(columns)
+    names = list(BOXES)
+    anomalies = [(names[row], anomaly_type) for row, anomaly_type in zip(rows, types)]
+    assert anomalies == [
+        ("zero width", 0),
+        ("zero width", 1),
+        ("zero height", 0),
+        ("zero height", 3),
+        ("zero size", 0),
+        ("zero size", 3),
+        ("tiny", 0),
+        ("thin", 1),
+        ("left of frame", 2),
+        ("below frame", 2),
+    ]
+    counts = count_anomalies(rule_set, [get_batch(BOXES)])
+    assert counts.loc["car"].tolist() == [4, 2, 2, 2, 0]
+    assert counts.drop("car").to_numpy().sum() == 0
+    assert list(counts.columns) == list(rule_set.get_type_names().values())
+
+
+def test_rule_set_rejects_unknown_kind():
+    """
+    A declaration with an unknown kind of rule is an error
+    """
+    with pytest.raises(ValueError, match="Unknown anomaly rule kind"):
+        AnomalyRuleSet([{"kind": "volume", "anomaly_type": 0, "name": "Volume"}])
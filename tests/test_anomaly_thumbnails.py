@@ -0,0 +1,126 @@
+"""
+File containing the tests of the anomaly thumbnails and of their cache.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import pytest
+from PIL import Image
+
+from analysis import anomaly_thumbnails
+from analysis.anomaly_thumbnails import (
+    THUMBNAIL_SIZE,
+    ThumbnailCache,
+    get_image_path,
+    get_thumbnail,
+    precompute_thumbnails,
+)
+
+
+@pytest.fixture
+def anomalies() -> pd.DataFrame:
+    """
+    The anomalies of three images, the first one having the most of both types
+    """
+    rows = [
+        ("a.jpg", "car", 0, 10.0, 20.0, 14.0, 24.0),
+        ("a.jpg", "bus", 1, 100.0, 200.0, 600.0, 230.0),
+        ("a.jpg", "bus", 1, 700.0, 300.0, 710.0, 650.0),
+        ("b.jpg", "person", 0, 1270.0, 710.0, 1266.0, 706.0),
+        ("c.jpg", "truck", 1, 0.0, 0.0, 1280.0, 30.0),
+    ]
+    return pd.DataFrame(
+        rows, columns=["image_name", "category", "type", "x1", "y1", "x2", "y2"]
+    )
+
+
+@pytest.fixture
+def image_dir(tmp_path) -> str:
+    """
+    A dataset mount holding gray images of the size of the BDD100K images
+    """
+    for name in ("a.jpg", "b.jpg", "c.jpg"):
+        path = get_image_path("val", name, str(tmp_path / "dataset"))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        Image.new("RGB", (1280, 720), "gray").save(path)
+    return str(tmp_path / "dataset")
+
+
+def test_thumbnail_is_rendered_once(tmp_path, image_dir, anomalies, monkeypatch):
+    """
+    A thumbnail is rendered at the thumbnail size on first use, then served from the
+    cache until its anomalies change
+    """
+    cache = ThumbnailCache(str(tmp_path / "thumbnails"))
+    image_anomalies = anomalies[anomalies["image_name"] == "a.jpg"]
+    path = get_thumbnail("val", "a.jpg", image_anomalies, cache, image_dir)
+    with Image.open(path) as thumbnail:
+        assert thumbnail.format == "WEBP"
+        assert thumbnail.size == THUMBNAIL_SIZE
+        # The outline of the thin bus box is drawn at the thumbnail scale
+        assert thumbnail.getpixel((50, 100)) != thumbnail.getpixel((50, 110))
+
+    def fail(*args):
+        """
+        Stands in for the renderer, which must not be called anymore
+        """
+        raise AssertionError("rendered again")
+
+    monkeypatch.setattr(anomaly_thumbnails, "render_thumbnail", fail)
+    assert get_thumbnail("val", "a.jpg", image_anomalies, cache, image_dir) == path
+    with pytest.raises(AssertionError, match="rendered again"):
+        get_thumbnail("val", "a.jpg", image_anomalies[:2], cache, image_dir)
+    assert (
+        get_thumbnail("val", "missing.jpg", image_anomalies, cache, image_dir) is None
+    )
+
+
+def test_cache_evicts_least_recently_used(tmp_path, image_dir, anomalies):
+    """
+    Once the cache exceeds its size limit, the least recently used thumbnails go
+    """
+    cache = ThumbnailCache(str(tmp_path / "thumbnails"))
+    paths = {}
+    for name, image_anomalies in anomalies.groupby("image_name"):
+        paths[name] = get_thumbnail("val", name, image_anomalies, cache, image_dir)
+    for time, name in enumerate(["b.jpg", "a.jpg", "c.jpg"]):
+        os.utime(paths[name], (time, time))
+    cache.max_bytes = paths["a.jpg"].stat().st_size + paths["c.jpg"].stat().st_size
+    key = paths["a.jpg"].stem
+    assert cache.get(key) == paths["a.jpg"]
+    cache.evict()
+    assert not paths["b.jpg"].exists()
+    assert paths["a.jpg"].exists() and paths["c.jpg"].exists()
+
+
+def test_top_images_are_precomputed(tmp_path, image_dir, anomalies):
+    """
+    The images with the most anomalies of every type are rendered ahead of time
+    """
+    cache = ThumbnailCache(str(tmp_path / "thumbnails"))
+    assert precompute_thumbnails("val", anomalies, cache, image_dir, top_n=1) == 1
+    assert precompute_thumbnails("val", anomalies, cache, image_dir) == 3
+    assert len(list(cache.cache_dir.glob("*/*.webp"))) == 3
+    assert precompute_thumbnails("train", anomalies, cache, image_dir) == 0
+
+
+def test_cache_shared_by_threads(tmp_path, image_dir, anomalies):
+    """
+    Threads rendering thumbnails at once keep the size of the cache up to date and
+    within its limit
+    """
+    cache = ThumbnailCache(str(tmp_path / "thumbnails"))
+    keys = [f"{i:032x}" for i in range(40)]
+    with Image.open(get_image_path("val", "a.jpg", image_dir)) as image:
+        image.thumbnail(THUMBNAIL_SIZE)
+        thumbnail = image.convert("RGB")
+    cache.put(keys[0], thumbnail)
+    cache.max_bytes = cache.total_bytes * 10
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(lambda key: cache.put(key, thumbnail), keys[1:]))
+    paths = list(cache.cache_dir.glob("*/*.webp"))
+    assert cache.total_bytes == sum(path.stat().st_size for path in paths)
+    assert cache.total_bytes <= cache.max_bytes
+    assert not list(cache.cache_dir.glob("*/*.tmp"))
@@ -0,0 +1,104 @@
+"""
+File containing the tests of the area cube, compared to the same aggregations computed
+with pandas on the records of the split.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis.area_cube import SKETCH_RELATIVE_ACCURACY, AreaCube
+
+
+@pytest.fixture
+def records() -> pd.DataFrame:
+    """
+    Random records spanning every category, size group and flag
+    """
+    rng = np.random.default_rng(0)
+    size = 20000
+    area = np.exp(rng.uniform(0, np.log(1280 * 720), size))
+    return pd.DataFrame(
+        {
+            "category": rng.integers(0, 10, size),
+            "size_group": np.digitize(area, [32**2, 96**2 + 1e-9]),
+            "occluded": rng.random(size) < 0.4,
+            "truncated": rng.random(size) < 0.1,
+            "area": area,
+        }
+    )
+
+
+def build_cube(records: pd.DataFrame) -> AreaCube:
+    """
+    Adds records to a new cube
+    """
+    cube = AreaCube()
+    cube.add(*(records[column].to_numpy() for column in records))
+    return cube
+
+
+@pytest.mark.parametrize(
+    "selection",
+    [
+        {},
+        {"categories": [2]},
+        {"categories": [0, 7], "size_groups": [1, 2]},
+        {"occluded": True},
+        {"categories": [4], "occluded": False, "truncated": True},
+    ],
+)
+def test_summary_matches_pandas(records, selection):
+    """
+    The summary of a selection holds the counts, sums and extremes of the selected
+    records, and quantiles within the accuracy of the sketch
+    """
+    mask = np.ones(len(records), dtype=bool)
+    if "categories" in selection:
+        mask &= records["category"].isin(selection["categories"])
+    if "size_groups" in selection:
+        mask &= records["size_group"].isin(selection["size_groups"])
+    for flag in ("occluded", "truncated"):
+        if flag in selection:
+            mask &= records[flag] == selection[flag]
+    selected = records[mask]
+
+    summary = build_cube(records).summarize(**selection)
+    assert summary.count == len(selected)
+    assert summary.occluded == selected["occluded"].sum()
+    assert summary.truncated == selected["truncated"].sum()
+    assert summary.area_sum == pytest.approx(selected["area"].sum(), rel=1e-12)
+    assert summary.area_min == selected["area"].min()
+    assert summary.area_max == selected["area"].max()
+    q = [0.05, 0.25, 0.5, 0.75, 0.95]
+    np.testing.assert_allclose(
+        summary.quantiles(q),
+        np.quantile(selected["area"], q, method="lower"),
+        rtol=SKETCH_RELATIVE_ACCURACY * 1.01,
+    )
+
+
+def test_cubes_merge_and_roundtrip(records, tmp_path):
+    """
+    Merging the cubes of two halves gives the cube of the whole, which is read back
+    as it was saved
+    """
+    whole = build_cube(records)
+    merged = build_cube(records[:7000])
+    merged.merge(build_cube(records[7000:]))
+    whole.save(tmp_path / "cube.npz")
+    loaded = AreaCube.load(tmp_path / "cube.npz")
+    for name in ("count", "area_min", "area_max", "histogram"):
+        np.testing.assert_array_equal(getattr(merged, name), getattr(whole, name))
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(whole, name))
+    np.testing.assert_allclose(merged.area_sum, whole.area_sum, rtol=1e-12)
+
+
+def test_empty_selection():
+    """
+    An empty selection has no quantiles and no mean
+    """
+    summary = AreaCube().summarize(categories=[3])
+    assert summary.count == 0
+    assert np.isnan(summary.quantiles([0.5])).all()
+    assert np.isnan(summary.box_stats()["mean"])
@@ -0,0 +1,73 @@
+"""
+File containing the tests of the synthetic label generator and of the pipeline
+benchmark.
+"""
+
+import argparse
+import json
+
+import numpy as np
+import pytest
+
+from analysis.dataset_analyzer import DatasetAnalyzer
+from benchmarks.pipeline import benchmark_split, compare_reports
+from benchmarks.synthetic_labels import (
+    IMAGE_HEIGHT,
+    IMAGE_WIDTH,
+    write_dataset,
+    write_label_file,
+)
+from config import CATEGORIES
+
+
+def test_synthetic_labels(tmp_path):
+    """
+    The synthetic labels are reproducible, stay within the frame and hold both kinds
+    of anomalies
+    """
+    label_file = tmp_path / "labels.json"
+    write_label_file(label_file, 2000, seed=5, indent=None)
+    objects = json.loads(label_file.read_text())
+    assert len(objects) == 2000
+    write_label_file(tmp_path / "again.json", 2000, seed=5, indent=None)
+    assert (tmp_path / "again.json").read_bytes() == label_file.read_bytes()
+
+    boxes = np.array(
+        [
+            [label["box2d"][key] for key in ("x1", "y1", "x2", "y2")]
+            for object in objects
+            for label in object["labels"]
+            if label["category"] in CATEGORIES
+        ]
+    )
+    assert (boxes[:, :2] >= 0).all()
+    assert (boxes[:, 2] <= IMAGE_WIDTH).all()
+    assert (boxes[:, 3] <= IMAGE_HEIGHT).all()
+    width, height = boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]
+    assert (width * height <= 16**2).any()
+    assert ((width / height <= 0.1) | (width / height >= 10)).any()
+
+
+def test_benchmark_report(tmp_path):
+    """
+    The benchmark times every stage of a split, and flags the stages that got slower
+    than the tolerance allows
+    """
+    write_dataset(tmp_path / "dataset", {"val": 200}, seed=1)
+    analyzer = DatasetAnalyzer(
+        str(tmp_path / "dataset"), str(tmp_path / "output"), str(tmp_path / "cache")
+    )
+    args = argparse.Namespace(
+        repeat=2, workers=1, json_backend="auto", label_cache=False
+    )
+    result = benchmark_split(analyzer, "val", args)
+    assert result["images"] == 200
+    assert result["boxes"] > 0
+    assert result["stages"]["parse_and_compute"] > 0
+    assert sum(result["stages"].values()) == pytest.approx(2 * result["seconds"])
+
+    report = {"splits": {"val": result}}
+    assert compare_reports(report, report, tolerance=0.0) == []
+    slower = {"splits": {"val": {"stages": {"compute_statistics": 1e-9}}}}
+    (regression,) = compare_reports(report, slower, tolerance=0.5)
+    assert regression.startswith("val compute_statistics:")
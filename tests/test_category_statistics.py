@@ -0,0 +1,297 @@
+"""
+File containing the tests of the batched statistics engine, compared to the statistics
+computed one label at a time as the analysis did before it.
+"""
+
+import json
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis.box_batch import BoxBatchBuilder
+from analysis.category_statistics import CategoryStatistics, find_table, load_table
+from analysis.manifest import MANIFEST_FILENAME
+from config import CATEGORIES
+
+
+def compute_reference_outputs(objects: list[dict], split: str) -> dict:
+    """
+    Computes the statistics of a split one label at a time, the way the analysis did
+    before the batched engine, and returns the frame saved to every output file
+    """
+    # Every box of the random labels has a valid geometry
+    stats = defaultdict(lambda: [0, 0, 0, 0.0, 0.0, float("inf"), 0, 0, 0, 0, 0, 0])
+    scene = defaultdict(lambda: defaultdict(int))
+    distribution = defaultdict(lambda: defaultdict(int))
+    records, anomalies = [], []
+    for object in objects:
+        for attribute, value in object["attributes"].items():
+            scene[attribute][value] += 1
+        weather = object["attributes"].get("weather", "undefined")
+        timeofday = object["attributes"].get("timeofday", "undefined")
+        for label in object["labels"]:
+            category = label["category"]
+            if category not in CATEGORIES:
+                continue
+            row = stats[category]
+            occluded = label["attributes"]["occluded"]
+            truncated = label["attributes"]["truncated"]
+            distribution[(timeofday, weather)][category] += 1
+            box = label["box2d"]
+            x1, y1, x2, y2 = box["x1"], box["y1"], box["x2"], box["y2"]
+            area = (y2 - y1) * (x2 - x1)
+            aspect_ratio = (x2 - x1) / (y2 - y1)
+            row[0] += 1
+            row[1] += occluded
+            row[2] += truncated
+            row[3] += area
+            row[4] = max(row[4], area)
+            row[5] = min(row[5], area)
+            size_group = 0 if area < 32**2 else 1 if area <= 96**2 else 2
+            row[7 + size_group] += 1
+            flags = (
+                area <= 16**2 or area >= 1024 * 576,
+                aspect_ratio <= 0.1 or aspect_ratio >= 10,
+            )
+            row[11] += any(flags)
+            for anomaly_type, anomalous in enumerate(flags):
+                if anomalous:
+                    row[6] += 1
+                    anomalies.append(
+                        (object["name"], category, anomaly_type, aspect_ratio, area)
+                        + (x1, y1, x2, y2, split)
+                    )
+            records.append(
+                (CATEGORIES[category], area, occluded, truncated, size_group)
+            )
+
+    columns = ["total_count", "occluded", "truncated", "total_area", "max_area"]
+    columns += ["min_area", "anomalies", "small", "medium", "large", "invalid_geometry"]
+    columns += ["anomalous_boxes"]
+    outputs = {
+        f"category_stats_{split}.csv": pd.DataFrame.from_dict(
+            stats, orient="index", columns=columns
+        ).reset_index(names="class"),
+        f"records_{split}.parquet": pd.DataFrame(
+            records,
+            columns=["category", "area", "occluded", "truncated", "size_group"],
+        ),
+        f"anomalies_{split}.parquet": pd.DataFrame(
+            anomalies,
+            columns=["image_name", "category", "type", "aspect_ratio", "area"]
+            + ["x1", "y1", "x2", "y2", "split"],
+        ),
+    }
+    outputs[f"issues_{split}.csv"] = pd.DataFrame(
+        columns=["image_name", "label_id", "category", "issue", "x1", "y1", "x2", "y2"]
+    )
+    for attribute, counts in scene.items():
+        outputs[f"{attribute}_{split}.csv"] = pd.DataFrame(
+            counts.items(), columns=["attribute", "count"]
+        )
+    times_of_day = sorted(["daytime", "dawn/dusk", "night", "undefined"])
+    weathers = sorted(
+        ["clear", "rainy", "undefined", "snowy", "overcast", "partly cloudy", "foggy"]
+    )
+    rows = [
+        (time, weather, category, distribution[(time, weather)][category])
+        for time in times_of_day
+        for weather in weathers
+        for category in CATEGORIES
+    ]
+    outputs[f"categories_by_scene_params_{split}.csv"] = pd.DataFrame(
+        rows, columns=["weather", "time", "class", "value"]
+    )
+    return outputs
+
+
+def read_output(path) -> pd.DataFrame:
+    """
+    Reads an output file, with the categorical columns of the parquet files turned
+    back into the values the per label statistics hold: ids in the records and names
+    in the anomalies
+    """
+    if path.suffix == ".csv":
+        return pd.read_csv(path)
+    df = pd.read_parquet(path)
+    if "size_group" in df:
+        df["category"] = df["category"].map(CATEGORIES).astype(int)
+        df["size_group"] = df["size_group"].cat.codes
+    else:
+        for column in ("image_name", "category", "split"):
+            df[column] = df[column].astype(str)
+    return df
+
+
+@pytest.mark.parametrize(
+    "num_workers, output_format", [(1, "parquet"), (3, "parquet"), (1, "csv")]
+)
+def test_outputs_match_per_label_statistics(
+    analyzer, output_dir, num_workers, output_format
+):
+    """
+    Every output file holds the statistics computed one label at a time, with the
+    same columns and rows in the same order, the records and anomalies in single
+    precision. The area cube and the scene tensor are checked on their own.
+    """
+    analyzer.compute_statistics(
+        "train", num_workers=num_workers, output_format=output_format
+    )
+    label_file = analyzer.get_bdd_labels_path() / "bdd100k_labels_images_train.json"
+    reference = compute_reference_outputs(json.loads(label_file.read_text()), "train")
+    expected = {
+        name.replace(".parquet", f".{output_format}"): frame
+        for name, frame in reference.items()
+    }
+    names = [
+        path.name for path in output_dir.iterdir() if path.name != MANIFEST_FILENAME
+    ]
+    assert sorted(names) == sorted(
+        [*expected, "area_cube_train.npz", "scene_tensor_train.npz"]
+    )
+    for name, frame in expected.items():
+        single = name.startswith(("records_", "anomalies_"))
+        pd.testing.assert_frame_equal(
+            read_output(output_dir / name),
+            frame,
+            check_dtype=False,
+            rtol=1e-6 if single else 1e-12,
+        )
+
+
+def test_statistics_do_not_depend_on_batching(dataset_dir):
+    """
+    The statistics of labels added in one batch, in batches of one image, or merged
+    from two halves are the same
+    """
+    label_file = next(dataset_dir.rglob("*_val.json"))
+    objects = json.loads(label_file.read_text())
+
+    def collect(chunks: list[list[dict]]) -> CategoryStatistics:
+        """
+        Adds the labels of every chunk of images as one batch
+        """
+        statistics = CategoryStatistics("val")
+        for chunk in chunks:
+            builder = BoxBatchBuilder()
+            for object in chunk:
+                builder.add_object(object)
+            statistics.add_batch(builder.build())
+        return statistics
+
+    whole = collect([objects])
+    single = collect([[object] for object in objects])
+    merged = collect([objects[:100]])
+    merged.merge(collect([objects[100:]]))
+    for statistics in (single, merged):
+        pd.testing.assert_frame_equal(statistics.get_stats_df(), whole.get_stats_df())
+        assert statistics.get_records_table().equals(whole.get_records_table())
+    assert np.isfinite(whole.get_stats_df()["min_area"]).all()
+
+
+def test_parquet_columns_are_typed(analyzer, output_dir):
+    """
+    The records and anomalies are read back with categorical names, flags and single
+    precision numbers
+    """
+    analyzer.compute_statistics("val")
+    records = load_table("records_val.parquet", str(output_dir))
+    assert list(records["category"].cat.categories) == list(CATEGORIES)
+    assert list(records["size_group"].cat.categories) == ["Small", "Medium", "Large"]
+    assert records["occluded"].dtype == bool
+    assert records["area"].dtype == np.float32
+    anomalies = load_table("anomalies_val.parquet", str(output_dir))
+    for column in ("image_name", "category", "split"):
+        assert isinstance(anomalies[column].dtype, pd.CategoricalDtype), column
+    assert set(anomalies["split"]) == {"val"}
+    assert anomalies["x1"].dtype == np.float32
+
+
+def test_table_found_in_saved_format(analyzer, output_dir):
+    """
+    The table of a split is found in the format the manifest records, even when a
+    file of the other format is left over
+    """
+    with pytest.raises(FileNotFoundError):
+        find_table("anomalies", "val", str(output_dir))
+    analyzer.compute_statistics("val", output_format="csv")
+    analyzer.compute_statistics("val")
+    assert (output_dir / "anomalies_val.csv").exists()
+    assert find_table("anomalies", "val", str(output_dir)) == "anomalies_val.parquet"
+    analyzer.compute_statistics("val", output_format="csv")
+    assert find_table("anomalies", "val", str(output_dir)) == "anomalies_val.csv"
+
+
+def test_invalid_geometry_is_reported():
+    """
+    Boxes with invalid geometry are counted and reported instead of failing the
+    analysis, and boxes without coordinates are left out of the area statistics
+    """
+    box = {"x1": 100.5, "y1": 200, "x2": 300, "y2": 260.25}
+    labels = [
+        {"category": "car", "box2d": box},
+        {"category": "car", "box2d": {**box, "x2": 100.5}},
+        {"category": "bus", "box2d": {**box, "y2": 150}},
+        {"category": "person", "box2d": {**box, "x1": -4, "y2": None}},
+        {"category": "truck"},
+    ]
+    builder = BoxBatchBuilder()
+    builder.add_object(
+        {
+            "name": "invalid.jpg",
+            "attributes": {},
+            "labels": [{**label, "id": i} for i, label in enumerate(labels)],
+        }
+    )
+    statistics = CategoryStatistics("val")
+    statistics.add_batch(builder.build())
+    stats = statistics.get_stats_df().set_index("class")
+    assert stats["total_count"].to_dict() == {
+        "car": 2,
+        "bus": 1,
+        "person": 1,
+        "truck": 1,
+    }
+    assert stats["invalid_geometry"].to_dict() == {
+        "car": 1,
+        "bus": 1,
+        "person": 1,
+        "truck": 1,
+    }
+    assert stats[["small", "medium", "large"]].sum(axis=1)["car"] == 2
+    assert np.isnan(stats.loc["truck", "min_area"])
+    issues = statistics.get_issues_df()
+    assert issues["label_id"].tolist() == [1, 2, 3, 4]
+    assert issues["issue"].tolist() == [
+        "zero size",
+        "inverted box",
+        "non-finite coordinates",
+        "non-finite coordinates",
+    ]
+
+
+def test_anomalous_boxes_are_counted_once():
+    """
+    The anomalies have one count per rule hit, while a box flagged by several rules
+    is a single anomalous box
+    """
+    labels = [
+        {"category": "car", "box2d": {"x1": 10, "y1": 10, "x2": 11, "y2": 30}},
+        {"category": "car", "box2d": {"x1": 10, "y1": 10, "x2": 20, "y2": 20}},
+        {"category": "car", "box2d": {"x1": 100, "y1": 100, "x2": 200, "y2": 150}},
+    ]
+    builder = BoxBatchBuilder()
+    builder.add_object(
+        {
+            "name": "thin.jpg",
+            "attributes": {},
+            "labels": [{**label, "id": i} for i, label in enumerate(labels)],
+        }
+    )
+    statistics = CategoryStatistics("val")
+    statistics.add_batch(builder.build())
+    stats = statistics.get_stats_df().set_index("class")
+    assert stats.loc["car", "anomalies"] == 3
+    assert stats.loc["car", "anomalous_boxes"] == 2
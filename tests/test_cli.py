@@ -0,0 +1,92 @@
+"""
+File containing the tests of the command line entrypoint of the analysis.
+"""
+
+import pytest
+
+from analysis.__main__ import (
+    EXIT_FAILURE,
+    EXIT_MISSING_LABELS,
+    EXIT_SUCCESS,
+    EXIT_USAGE,
+    main,
+)
+from analysis.coco_export import COCO_FILENAME
+
+
+@pytest.fixture
+def arguments(tmp_path, dataset_dir, output_dir) -> list[str]:
+    """
+    The arguments pointing the analysis at the random dataset and temporary outputs
+    """
+    return [
+        "--dataset-dir",
+        str(dataset_dir),
+        "--output-dir",
+        str(output_dir),
+        "--cache-dir",
+        str(tmp_path / "cache"),
+        "--thumbnail-dir",
+        str(tmp_path / "thumbnails"),
+        "--workers",
+        "2",
+        "--quiet",
+    ]
+
+
+def test_outdated_splits_are_processed(arguments, output_dir, capsys):
+    """
+    The requested splits are processed, then skipped until forced
+    """
+    assert main(arguments + ["--splits", "val"]) == EXIT_SUCCESS
+    assert (output_dir / "records_val.parquet").exists()
+    assert not (output_dir / "records_train.parquet").exists()
+    assert "val: done" in capsys.readouterr().err
+
+    assert main(arguments + ["--splits", "val"]) == EXIT_SUCCESS
+    assert "val: up to date, skipped" in capsys.readouterr().err
+    assert main(arguments + ["--splits", "val", "--force"]) == EXIT_SUCCESS
+    assert "val: done" in capsys.readouterr().err
+
+
+def test_missing_coco_labels_are_written(tmp_path, arguments, capsys):
+    """
+    An up to date split is processed again when its COCO labels are asked for and
+    missing, then skipped once they are written
+    """
+    assert main(arguments + ["--splits", "val"]) == EXIT_SUCCESS
+    coco_arguments = arguments + ["--splits", "val", "--coco-dir", str(tmp_path)]
+    assert main(coco_arguments) == EXIT_SUCCESS
+    assert "val: done" in capsys.readouterr().err.splitlines()[-1]
+    assert (tmp_path / "val" / COCO_FILENAME).exists()
+    assert main(coco_arguments) == EXIT_SUCCESS
+    assert "val: up to date, skipped" in capsys.readouterr().err
+
+
+def test_switching_format_recomputes(arguments, output_dir, capsys):
+    """
+    Asking for another output format than the one saved recomputes the split
+    """
+    assert main(arguments + ["--splits", "val"]) == EXIT_SUCCESS
+    assert main(arguments + ["--splits", "val", "--format", "csv"]) == EXIT_SUCCESS
+    assert "val: done" in capsys.readouterr().err.splitlines()[-1]
+    assert (output_dir / "records_val.csv").exists()
+    assert (output_dir / "anomalies_val.csv").exists()
+
+
+def test_exit_status(arguments, dataset_dir, capsys):
+    """
+    Invalid arguments, missing label files and failed analyses have their own exit
+    status
+    """
+    with pytest.raises(SystemExit) as exit_info:
+        main(arguments + ["--workers", "0"])
+    assert exit_info.value.code == EXIT_USAGE
+
+    label_file = next(dataset_dir.rglob("*_val.json"))
+    label_file.write_text("[{")
+    assert main(arguments + ["--no-label-cache"]) == EXIT_FAILURE
+    assert "analysis failed" in capsys.readouterr().err
+    label_file.unlink()
+    assert main(arguments) == EXIT_MISSING_LABELS
+    assert str(label_file) in capsys.readouterr().err
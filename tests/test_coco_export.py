@@ -0,0 +1,214 @@
+"""
+File containing the tests of the COCO export, compared to the converter the training
+notebook used before it, which is kept here as the reference.
+"""
+
+import json
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pytest
+
+from analysis.coco_export import COCO_FILENAME, convert_splits, convert_to_coco
+from analysis.dataset_analyzer import DatasetAnalyzer
+from benchmarks.synthetic_labels import generate_image
+from config import BDD_LABELS_PREFIX, CATEGORIES
+
+
+def bdd2coco_detection(
+    categories_dict: dict[str, int], bdd_labels: Any, images_root: str, split: str
+) -> None:
+    """
+    The converter of the training notebook, as it was before analysis.coco_export,
+    without its progress bar and summary
+    """
+    coco = {
+        "type": "instances",
+        "images": [],
+        "annotations": [],
+        "categories": [
+            {
+                "supercategory": "object_supercategory",
+                "id": v,
+                "name": k,
+            }
+            for k, v in categories_dict.items()
+        ],
+    }
+
+    annotation_id = 0
+    for img_id, obj in enumerate(bdd_labels):
+        file_name = obj["name"]
+        w_img, h_img = 1280, 720
+        image_entry = {
+            "id": img_id,
+            "file_name": file_name,
+            "width": w_img,
+            "height": h_img,
+        }
+
+        has_valid_label = False
+
+        for label in obj.get("labels", []):
+            if "box2d" not in label or label["category"] not in categories_dict:
+                continue
+
+            x1 = max(0, float(label["box2d"]["x1"]))
+            y1 = max(0, float(label["box2d"]["y1"]))
+            x2 = min(float(w_img), float(label["box2d"]["x2"]))
+            y2 = min(float(h_img), float(label["box2d"]["y2"]))
+
+            w_box = x2 - x1
+            h_box = y2 - y1
+
+            if w_box < 2 or h_box < 2:
+                continue
+
+            has_valid_label = True
+
+            coco["annotations"].append(
+                {
+                    "id": annotation_id,
+                    "image_id": img_id,
+                    "category_id": categories_dict[label["category"]],
+                    "bbox": [float(x1), float(y1), float(w_box), float(h_box)],
+                    "area": float(w_box * h_box),
+                    "iscrowd": 0,
+                }
+            )
+            annotation_id += 1
+
+        if has_valid_label:
+            coco["images"].append(image_entry)
+
+    with open(Path(images_root) / split / "_annotations.coco.json", "w") as f:
+        json.dump(coco, f)
+
+
+def get_edge_case_objects() -> list[dict]:
+    """
+    Returns label objects with the boxes the converter clips or leaves out
+    """
+
+    def label(category: str, x1: float, y1: float, x2: float, y2: float) -> dict:
+        """
+        Returns a label of a category with a box
+        """
+        box = {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
+        return {"category": category, "attributes": {}, "box2d": box}
+
+    attributes = {"weather": "rainy", "scene": "highway", "timeofday": "night"}
+    return [
+        {
+            "name": "clipped.jpg",
+            "attributes": attributes,
+            "labels": [
+                label("car", -12.5, -3, 50, 40),
+                label("bus", 1200, 650, 1300.25, 800),
+                label("truck", -10, 20, 1290, 30),
+            ],
+        },
+        {
+            "name": "nothing valid.jpg",
+            "attributes": attributes,
+            "labels": [
+                label("car", 10, 10, 11.5, 50),
+                label("person", 10, 10, 50, 11),
+                label("car", 1279, 10, 1300, 50),
+                label("car", 50, 10, 20, 60),
+                {"category": "drivable area", "attributes": {}, "poly2d": []},
+                label("drivable area", 0, 0, 100, 100),
+            ],
+        },
+        {"name": "no labels.jpg", "attributes": attributes, "labels": []},
+        {
+            "name": 'quote" and \\ backslash.jpg',
+            "attributes": attributes,
+            "labels": [
+                {"category": "car", "attributes": {"occluded": True}},
+                label("car", 10, 10, 12, 12),
+                label("train", 0.1, 0.2, 1280, 720),
+            ],
+        },
+    ]
+
+
+@pytest.fixture
+def analyzer(tmp_path) -> DatasetAnalyzer:
+    """
+    An analyzer of a train split mixing synthetic images and the edge cases, which
+    straddle the first batch of labels
+    """
+    analyzer = DatasetAnalyzer(
+        str(tmp_path / "dataset"),
+        str(tmp_path / "output"),
+        str(tmp_path / "cache"),
+        str(tmp_path / "thumbnails"),
+    )
+    rng = np.random.default_rng(7)
+    objects = [generate_image(rng, index) for index in range(1100)]
+    objects[1022:1022] = get_edge_case_objects()
+    label_file = analyzer.get_label_file("train")
+    label_file.parent.mkdir(parents=True)
+    label_file.write_text(json.dumps(objects, indent=4))
+    return analyzer
+
+
+@pytest.fixture
+def label_file(analyzer) -> Path:
+    """
+    The label file of the train split
+    """
+    return analyzer.get_label_file("train")
+
+
+def write_reference(label_file: Path, images_dir: Path) -> bytes:
+    """
+    Converts a label file with the notebook converter and returns the COCO file
+    """
+    (images_dir / "train").mkdir(parents=True)
+    with open(label_file) as f:
+        bdd2coco_detection(CATEGORIES, json.load(f), str(images_dir), "train")
+    return (images_dir / "train" / COCO_FILENAME).read_bytes()
+
+
+@pytest.mark.parametrize("json_backend", ["auto", "python"])
+def test_convert_to_coco_matches_notebook(tmp_path, label_file, json_backend):
+    """
+    The streaming converter writes the same bytes as the notebook converter
+    """
+    reference = write_reference(label_file, tmp_path / "reference")
+    output_file = tmp_path / "output" / COCO_FILENAME
+    images, annotations = convert_to_coco(label_file, output_file, json_backend)
+    assert output_file.read_bytes() == reference
+    coco = json.loads(reference)
+    assert (images, annotations) == (len(coco["images"]), len(coco["annotations"]))
+    assert not list(output_file.parent.glob(".*.tmp"))
+
+
+def test_convert_splits(tmp_path, label_file):
+    """
+    Converting the splits in parallel writes every split to its images directory
+    """
+    reference = write_reference(label_file, tmp_path / "reference")
+    labels_dir = label_file.parent
+    (labels_dir / f"{BDD_LABELS_PREFIX}val.json").write_text("[]")
+    counts = convert_splits(["train", "val"], labels_dir, tmp_path / "images")
+    assert (tmp_path / "images" / "train" / COCO_FILENAME).read_bytes() == reference
+    assert counts["val"] == (0, 0)
+    val = json.loads((tmp_path / "images" / "val" / COCO_FILENAME).read_text())
+    assert val["images"] == val["annotations"] == []
+
+
+@pytest.mark.parametrize("num_workers", [1, 3])
+def test_coco_sink_matches_notebook(tmp_path, analyzer, label_file, num_workers):
+    """
+    The COCO file written along with the statistics matches the notebook converter
+    too, whether the labels are parsed by one process or in shards
+    """
+    reference = write_reference(label_file, tmp_path / "reference")
+    analyzer.compute_statistics(
+        "train", num_workers=num_workers, coco_dir=str(tmp_path / "images")
+    )
+    assert (tmp_path / "images" / "train" / COCO_FILENAME).read_bytes() == reference
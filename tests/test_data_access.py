@@ -0,0 +1,32 @@
+"""
+File containing the tests of the data access module shared by the pages of the app.
+"""
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+from app import data_access
+
+
+def test_outputs_version_changes_with_each_run(analyzer, output_dir):
+    """
+    Every run of the analysis changes the version of the outputs
+    """
+    analyzer.compute_statistics("val")
+    version = data_access.get_outputs_version(str(output_dir))
+    assert version == data_access.get_outputs_version(str(output_dir))
+    analyzer.compute_statistics("val", output_format="csv")
+    assert data_access.get_outputs_version(str(output_dir)) != version
+
+
+def test_shared_area_cube_is_read_only(analyzer, output_dir, monkeypatch):
+    """
+    Every session gets the same area cube, which cannot be modified
+    """
+    monkeypatch.setattr(data_access, "CSV_DIR", str(output_dir))
+    analyzer.compute_statistics("val")
+    area_cube = data_access.get_area_cube("val")
+    assert data_access.get_area_cube("val") is area_cube
+    with pytest.raises(ValueError, match="read-only"):
+        area_cube.count[0] = 1
@@ -0,0 +1,37 @@
+"""
+File containing the tests of DatasetAnalyzer, checking that the sharded parallel mode
+saves the same statistics as the serial mode.
+"""
+
+import pytest
+
+from analysis.manifest import MANIFEST_FILENAME
+
+
+def get_output_files(output_dir) -> dict:
+    """
+    Returns the contents of the files saved to a directory, by name, except for the
+    manifest which records when they were saved
+    """
+    return {
+        path.name: path.read_bytes()
+        for path in sorted(output_dir.iterdir())
+        if path.name != MANIFEST_FILENAME
+    }
+
+
+@pytest.mark.parametrize("split_name", ["train", "val"])
+def test_parallel_matches_serial(analyzer, output_dir, split_name):
+    """
+    Every statistic saved by the sharded parallel mode is byte for byte the one
+    saved by the serial mode
+    """
+    analyzer.compute_statistics(split_name)
+    expected = get_output_files(output_dir)
+    assert f"category_stats_{split_name}.csv" in expected
+    assert f"area_cube_{split_name}.npz" in expected
+    for num_workers in (2, 4):
+        for path in output_dir.iterdir():
+            path.unlink()
+        analyzer.compute_statistics(split_name, num_workers=num_workers)
+        assert get_output_files(output_dir) == expected, num_workers
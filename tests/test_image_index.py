@@ -0,0 +1,81 @@
+"""
+File containing the tests of the indexes giving the rows of a table by image.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis.image_index import AnomalyIndex, ImageIndex
+from analysis.label_cache import LabelCache
+
+
+@pytest.fixture
+def anomalies() -> pd.DataFrame:
+    """
+    Random anomalies of a hundred images, in random order
+    """
+    rng = np.random.default_rng(0)
+    size = 2000
+    return pd.DataFrame(
+        {
+            "image_name": [f"{i:03d}.jpg" for i in rng.integers(0, 100, size)],
+            "type": rng.integers(0, 3, size),
+            "row": np.arange(size),
+        }
+    )
+
+
+@pytest.mark.parametrize("grouped", [False, True])
+def test_rows_of_every_image(anomalies, grouped):
+    """
+    The rows of an image are the ones a mask over the table selects, in table order,
+    whether or not the table is already grouped by image
+    """
+    if grouped:
+        anomalies = anomalies.sort_values("image_name", kind="stable")
+        anomalies["image_name"] = anomalies["image_name"].astype("category")
+    index = ImageIndex(anomalies)
+    assert len(index) == anomalies["image_name"].nunique()
+    for image_name in anomalies["image_name"].unique():
+        expected = anomalies[anomalies["image_name"] == image_name]
+        np.testing.assert_array_equal(
+            index.get(image_name)["row"], expected["row"], image_name
+        )
+    assert "missing.jpg" not in index
+    assert index.get("missing.jpg").empty
+    assert index.get_counts().sum() == len(anomalies)
+
+
+def test_images_are_ranked_by_anomalies(anomalies):
+    """
+    The images with anomalies of a type are ranked by their number of anomalies of
+    that type, most anomalies first
+    """
+    index = AnomalyIndex(anomalies)
+    for anomaly_type in range(3):
+        counts = anomalies.loc[anomalies["type"] == anomaly_type, "image_name"]
+        counts = counts.value_counts()
+        ranked = index.get_ranked_images(anomaly_type)
+        assert list(ranked) == sorted(ranked, key=lambda name: -counts[name])
+        assert set(ranked) == set(counts.index)
+        assert index.get_top_images(anomaly_type, 3) == list(ranked[:3])
+    assert index.get_top_images(7, 3) == []
+
+
+def test_index_from_label_cache(tmp_path, dataset_dir):
+    """
+    The boxes of every image are read from the label cache
+    """
+    label_file = next(dataset_dir.rglob("*_val.json"))
+    label_cache = LabelCache("val", label_file, tmp_path / "cache")
+    label_cache.build()
+    index = ImageIndex.from_label_cache(label_cache)
+    images, boxes = label_cache.load()
+    names = images.column("name").to_pylist()
+    assert list(index.image_names) == names
+    image_index = boxes.column("image_index").to_numpy()
+    for position in (0, 17, len(names) - 1):
+        assert len(index.get(names[position])) == np.count_nonzero(
+            image_index == position
+        )
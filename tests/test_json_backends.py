@@ -0,0 +1,99 @@
+"""
+File containing the tests of the JSON parser backends of the label files.
+"""
+
+import json
+
+import pytest
+
+from analysis import json_backends
+from analysis.json_backends import (
+    IJSON_BACKENDS,
+    IN_MEMORY_BACKENDS,
+    get_available_backends,
+    iter_label_objects,
+    select_backend,
+)
+from analysis.label_sharding import find_shard_ranges
+from analysis.manifest import MANIFEST_FILENAME
+
+BACKENDS = get_available_backends()
+
+
+@pytest.fixture
+def label_file(dataset_dir):
+    """
+    The label file of the val split
+    """
+    return next(dataset_dir.rglob("*_val.json"))
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backends_parse_the_whole_file(label_file, backend):
+    """
+    Every backend yields the label objects of json.load, with floats for the
+    non-integer numbers
+    """
+    objects = list(iter_label_objects(label_file, backend))
+    assert objects == json.loads(label_file.read_text())
+    box = objects[0]["labels"][0]["box2d"]
+    assert all(type(value) is float for value in box.values())
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_backends_parse_shards(label_file, backend):
+    """
+    Every backend reads the shards of a file, which together hold every object once
+    """
+    objects = [
+        object
+        for start, end in find_shard_ranges(label_file, 5)
+        for object in iter_label_objects(label_file, backend, start, end)
+    ]
+    assert objects == json.loads(label_file.read_text())
+
+
+@pytest.mark.parametrize(
+    "backend", [backend for backend in IN_MEMORY_BACKENDS if backend in BACKENDS]
+)
+def test_in_memory_backends_raise_parse_errors(tmp_path, backend):
+    """
+    A parse error of a memory mapped file is raised as is, not hidden by the map
+    failing to close
+    """
+    label_file = tmp_path / "labels.json"
+    label_file.write_text('[{"name": ')
+    with pytest.raises(ValueError):
+        list(iter_label_objects(label_file, backend))
+
+
+def test_select_backend(label_file, monkeypatch):
+    """
+    A named backend is used as is, and "auto" streams the file with the fastest ijson
+    backend when the parsed file would not fit in memory
+    """
+    assert select_backend(label_file, "python") == "python"
+    with pytest.raises(ValueError, match="Unknown JSON backend"):
+        select_backend(label_file, "yaml")
+    monkeypatch.setattr(json_backends, "get_available_memory", lambda: 0)
+    assert select_backend(label_file) == next(
+        b for b in BACKENDS if b in IJSON_BACKENDS
+    )
+    monkeypatch.setattr(json_backends, "get_available_memory", lambda: 1 << 60)
+    assert select_backend(label_file) == BACKENDS[0]
+
+
+def test_statistics_do_not_depend_on_backend(analyzer, output_dir):
+    """
+    The statistics are byte for byte the same whichever backend parsed the labels
+    """
+    outputs = {}
+    for backend in BACKENDS:
+        assert analyzer.compute_statistics("val", json_backend=backend) == backend
+        outputs[backend] = {
+            path.name: path.read_bytes()
+            for path in output_dir.iterdir()
+            if path.name != MANIFEST_FILENAME
+        }
+    for backend in BACKENDS:
+        assert outputs[backend] == outputs[BACKENDS[0]], backend
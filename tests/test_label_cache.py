@@ -0,0 +1,105 @@
+"""
+File containing the tests of the binary label cache and of the fingerprints it is
+validated with.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from analysis.box_batch import BoxBatchBuilder
+from analysis.fingerprints import fingerprint_file, fingerprint_matches
+from analysis.label_cache import LabelCache
+from analysis.manifest import MANIFEST_FILENAME
+
+
+@pytest.fixture
+def label_file(dataset_dir):
+    """
+    The label file of the val split
+    """
+    return next(dataset_dir.rglob("*_val.json"))
+
+
+def test_fingerprint(tmp_path):
+    """
+    A file matches its fingerprint until its contents change, even if it is touched
+    """
+    path = tmp_path / "labels.json"
+    path.write_text("[1, 2]")
+    fingerprint = fingerprint_file(path)
+    assert fingerprint_matches(path, fingerprint)
+    os.utime(path, ns=(0, 0))
+    assert fingerprint_matches(path, fingerprint)
+    path.write_text("[1, 3]")
+    assert not fingerprint_matches(path, fingerprint)
+    assert not fingerprint_matches(path, None)
+    assert not fingerprint_matches(tmp_path / "missing.json", fingerprint)
+
+
+@pytest.mark.parametrize("num_workers", [1, 3])
+def test_cached_batches_match_labels(tmp_path, label_file, num_workers):
+    """
+    The batches read from the cache hold the labels of the label file
+    """
+    cache = LabelCache("val", label_file, tmp_path / "cache")
+    assert not cache.is_valid()
+    cache.build(num_workers=num_workers)
+    assert cache.is_valid()
+
+    builder = BoxBatchBuilder()
+    for object in json.loads(label_file.read_text()):
+        builder.add_object(object)
+    expected = builder.build()
+    batches = list(cache.iter_batches(images_per_batch=128))
+    assert len(batches) == -(-len(expected.image_names) // 128)
+    for column in ("image_names", "weather", "scene", "timeofday"):
+        values = [value for batch in batches for value in getattr(batch, column)]
+        assert values == getattr(expected, column), column
+    image_index = np.concatenate(
+        [batch.image_index + 128 * i for i, batch in enumerate(batches)]
+    )
+    np.testing.assert_array_equal(image_index, expected.image_index)
+    for column in ("label_id", "category", "boxes", "occluded", "truncated"):
+        values = np.concatenate([getattr(batch, column) for batch in batches])
+        np.testing.assert_array_equal(values, getattr(expected, column), column)
+
+
+def test_cache_is_rebuilt_when_labels_change(tmp_path, label_file):
+    """
+    A cache built from an older label file is not valid anymore
+    """
+    cache = LabelCache("val", label_file, tmp_path / "cache")
+    cache.build()
+    objects = json.loads(label_file.read_text())
+    label_file.write_text(json.dumps(objects[:10]))
+    assert not cache.is_valid()
+    images, _ = cache.load()
+    assert cache.is_valid()
+    assert images.column("name").to_pylist() == [o["name"] for o in objects[:10]]
+
+
+def test_statistics_from_cache_match_labels(analyzer, output_dir):
+    """
+    The statistics computed from the cache, when it is built and once it is built,
+    are byte for byte the ones computed from the label file
+    """
+    outputs = []
+    for use_label_cache in (False, True, True):
+        backend = analyzer.compute_statistics(
+            "val", num_workers=2, use_label_cache=use_label_cache
+        )
+        outputs.append(
+            {
+                path.name: path.read_bytes()
+                for path in output_dir.iterdir()
+                if path.name != MANIFEST_FILENAME
+            }
+        )
+    assert backend == "label cache"
+    assert (Path(analyzer.cache_dir) / "val" / "metadata.json").exists()
+    assert outputs[1] == outputs[0]
+    assert outputs[2] == outputs[0]
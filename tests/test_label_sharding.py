@@ -0,0 +1,126 @@
+"""
+File containing the tests of the label file sharder, on names holding the characters
+its scanner has to skip: quotes, brackets and backslashes.
+"""
+
+import json
+
+import pytest
+
+from analysis import label_sharding
+from analysis.json_backends import get_available_backends, iter_label_objects
+from analysis.label_sharding import (
+    ShardReader,
+    find_element_boundaries,
+    find_shard_ranges,
+)
+
+TRICKY_NAMES = [
+    'quote"inside.jpg',
+    '"quoted".jpg',
+    "[bracket.jpg",
+    "bracket].jpg",
+    "{brace}.jpg",
+    '"]}, {"name": "fake.jpg"',
+    "back\\slash.jpg",
+    "trailing backslash\\",
+    "two trailing backslashes\\\\",
+    '\\"escaped quote\\".jpg',
+    "\\\\\\[\\]",
+    "accentué ünïcode.jpg",
+    "",
+]
+
+
+def get_label_objects() -> list[dict]:
+    """
+    Returns label objects whose names and labels hold the tricky characters
+    """
+    return [
+        {
+            "name": name,
+            "attributes": {"weather": "clear", "scene": "city street"},
+            "labels": [
+                {"category": "car", "box2d": {"x1": 1.5, "y1": 2, "x2": 30, "y2": 40}},
+                {"category": name, "poly2d": [[[0, 0], [1, 1]]]},
+            ],
+        }
+        for name in TRICKY_NAMES
+    ]
+
+
+def write_label_file(path, objects: list[dict], indent: int | None) -> list[tuple]:
+    """
+    Writes a label file and returns the byte range of every element
+    """
+    data = b"[\n"
+    ranges = []
+    for i, object in enumerate(objects):
+        if i:
+            data += b",\n"
+        element = json.dumps(object, indent=indent, ensure_ascii=i % 2 == 0).encode()
+        ranges.append((len(data), len(data) + len(element)))
+        data += element
+    path.write_bytes(data + b"\n]")
+    return ranges
+
+
+@pytest.mark.parametrize("indent", [None, 4])
+@pytest.mark.parametrize("block_size", [1, 3, 7, 64, 16 * 1024 * 1024])
+def test_element_boundaries(tmp_path, monkeypatch, indent, block_size):
+    """
+    The boundaries are exact, wherever the blocks of the scan are cut
+    """
+    monkeypatch.setattr(label_sharding, "SCAN_BLOCK_SIZE", block_size)
+    label_file = tmp_path / "labels.json"
+    ranges = write_label_file(label_file, get_label_objects(), indent)
+    starts, ends = find_element_boundaries(label_file)
+    assert list(zip(starts.tolist(), ends.tolist())) == ranges
+
+
+def test_element_boundaries_of_empty_array(tmp_path):
+    """
+    An empty label file has no elements and no shards
+    """
+    label_file = tmp_path / "labels.json"
+    label_file.write_text("[ ]")
+    starts, ends = find_element_boundaries(label_file)
+    assert len(starts) == len(ends) == 0
+    assert find_shard_ranges(label_file, 4) == []
+
+
+@pytest.mark.parametrize("backend", get_available_backends())
+@pytest.mark.parametrize("num_shards", [1, 2, 5, len(TRICKY_NAMES), 100])
+def test_shards_cover_every_object(tmp_path, backend, num_shards):
+    """
+    Reading every shard in turn yields every label object once, in file order
+    """
+    label_file = tmp_path / "labels.json"
+    objects = get_label_objects()
+    write_label_file(label_file, objects, indent=2)
+    shard_ranges = find_shard_ranges(label_file, num_shards)
+    assert 1 <= len(shard_ranges) <= min(num_shards, len(objects))
+    read = [
+        object
+        for start, end in shard_ranges
+        for object in iter_label_objects(label_file, backend, start, end)
+    ]
+    assert [object["name"] for object in read] == TRICKY_NAMES
+    assert read == json.loads(label_file.read_text())
+
+
+@pytest.mark.parametrize("read_size", [1, 5, -1])
+def test_shard_reader_wraps_range_in_array(tmp_path, read_size):
+    """
+    A shard reads as a standalone JSON array, whatever the size of the reads
+    """
+    label_file = tmp_path / "labels.json"
+    objects = get_label_objects()
+    ranges = write_label_file(label_file, objects, indent=None)
+    start, end = ranges[2][0], ranges[5][1]
+    with open(label_file, "rb") as f:
+        reader = ShardReader(f, start, end)
+        chunks = []
+        while chunk := reader.read(read_size):
+            chunks.append(chunk)
+    assert json.loads(b"".join(chunks)) == objects[2:6]
@@ -0,0 +1,75 @@
+"""
+File containing the tests of the manifest deciding which splits have to be recomputed.
+"""
+
+import json
+import shutil
+
+import config
+from analysis import manifest
+from analysis.manifest import MANIFEST_FILENAME, AnalysisManifest, get_code_version
+
+
+def test_split_is_up_to_date_once_computed(analyzer, output_dir):
+    """
+    Only the computed split is up to date, and only until one of its outputs changes
+    """
+    assert not analyzer.is_up_to_date("val")
+    analyzer.compute_statistics("val")
+    assert analyzer.is_up_to_date("val")
+    assert not analyzer.is_up_to_date("train")
+
+    stats_file = output_dir / "category_stats_val.csv"
+    stats_file.write_bytes(stats_file.read_bytes()[:-10])
+    assert not analyzer.is_up_to_date("val")
+    analyzer.compute_statistics("val")
+    stats_file.unlink()
+    assert not analyzer.is_up_to_date("val")
+
+
+def test_split_is_outdated_when_labels_change(analyzer):
+    """
+    Changing the label file outdates the split, but removing it keeps the outputs
+    """
+    analyzer.compute_statistics("val")
+    label_file = analyzer.get_label_file("val")
+    objects = json.loads(label_file.read_text())
+    label_file.write_text(json.dumps(objects[:-1]))
+    assert not analyzer.is_up_to_date("val")
+    analyzer.compute_statistics("val")
+    label_file.unlink()
+    assert analyzer.is_up_to_date("val")
+
+
+def test_split_is_outdated_when_code_changes(analyzer, monkeypatch):
+    """
+    Outputs computed by another version of the analysis code are outdated
+    """
+    analyzer.compute_statistics("val")
+    monkeypatch.setattr(manifest, "get_code_version", lambda: "another version")
+    assert not analyzer.is_up_to_date("val")
+
+
+def test_code_version_covers_config(tmp_path, monkeypatch):
+    """
+    Editing the config, e.g. its categories, changes the version of the analysis code
+    """
+    version = get_code_version()
+    config_file = tmp_path / "config.py"
+    shutil.copy(config.__file__, config_file)
+    monkeypatch.setattr(config, "__file__", str(config_file))
+    assert get_code_version() == version
+    config_file.write_text(config_file.read_text() + "\n# Edited\n")
+    assert get_code_version() != version
+
+
+def test_interrupted_or_corrupt_manifest(analyzer, output_dir):
+    """
+    A split whose outputs are being rewritten, or a corrupt manifest, is outdated
+    """
+    analyzer.compute_statistics("val")
+    AnalysisManifest(str(output_dir)).invalidate("val")
+    assert not analyzer.is_up_to_date("val")
+    analyzer.compute_statistics("val")
+    (output_dir / MANIFEST_FILENAME).write_text("{")
+    assert not analyzer.is_up_to_date("val")
@@ -0,0 +1,143 @@
+"""
+File containing the tests checking that every way of running the analysis of a split
+writes the same outputs: parsing the labels in one process or in shards, with an
+in-memory or a streaming JSON backend, and reading them from the label cache.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis.coco_export import COCO_FILENAME
+from analysis.dataset_analyzer import DatasetAnalyzer
+from analysis.json_backends import IJSON_BACKENDS, get_available_backends
+from benchmarks.synthetic_labels import generate_image
+
+# The label cache runs share a cache directory, the first one builds the cache and
+# the second one reads it
+RUNS = {
+    "serial": {"num_workers": 1},
+    "parallel": {"num_workers": 4},
+    "parallel streaming": {
+        "num_workers": 3,
+        "json_backend": next(
+            b for b in IJSON_BACKENDS if b in get_available_backends()
+        ),
+    },
+    "building label cache": {"num_workers": 4, "use_label_cache": True},
+    "reading label cache": {"num_workers": 4, "use_label_cache": True},
+}
+
+
+def get_invalid_objects() -> list[dict]:
+    """
+    Returns label objects with boxes of invalid geometry and duplicate boxes
+    """
+    box = {"x1": 100.5, "y1": 200, "x2": 300, "y2": 260.25}
+    labels = [
+        {"category": "car", "box2d": box},
+        {"category": "car", "box2d": box},
+        {"category": "car", "box2d": {**box, "x2": 100.5}},
+        {"category": "bus", "box2d": {**box, "y2": 150}},
+        {"category": "person", "box2d": {**box, "x1": -4, "y2": None}},
+        {"category": "truck"},
+        {"category": "rider", "box2d": {**box, "x2": 1400}},
+    ]
+    return [
+        {
+            "name": f"invalid_{i}.jpg",
+            "attributes": {"weather": "foggy", "scene": "tunnel", "timeofday": "dawn"},
+            "labels": [
+                {**label, "id": label_id, "attributes": {"occluded": bool(i % 2)}}
+                for label_id, label in enumerate(labels)
+            ],
+        }
+        for i in range(3)
+    ]
+
+
+@pytest.fixture(scope="module")
+def outputs(tmp_path_factory) -> dict:
+    """
+    Runs the analysis of a synthetic split in every way and returns the directories
+    its outputs were written to, by run
+    """
+    root = tmp_path_factory.mktemp("pipeline")
+    rng = np.random.default_rng(3)
+    objects = [generate_image(rng, index) for index in range(3000)]
+    # Spread over the first batch, its boundary and a later shard
+    for position in (5, 1023, 2600):
+        objects[position:position] = get_invalid_objects()
+    label_file = DatasetAnalyzer(str(root / "dataset")).get_label_file("train")
+    label_file.parent.mkdir(parents=True)
+    label_file.write_text(json.dumps(objects, indent=4))
+
+    outputs = {}
+    for name, arguments in RUNS.items():
+        run_dir = root / name.replace(" ", "_")
+        analyzer = DatasetAnalyzer(
+            str(root / "dataset"),
+            str(run_dir / "output"),
+            str(root / "cache"),
+            str(run_dir / "thumbnails"),
+        )
+        backend = analyzer.compute_statistics(
+            "train", coco_dir=str(run_dir / "images"), **arguments
+        )
+        outputs[name] = {"backend": backend, "dir": run_dir}
+    return outputs
+
+
+def get_output_files(run_dir) -> dict:
+    """
+    Returns the contents of the outputs of a run, by path, except for the manifest
+    which records when the run took place
+    """
+    return {
+        path.relative_to(run_dir): path.read_bytes()
+        for path in sorted(run_dir.rglob("*"))
+        if path.is_file() and path.name != "manifest.json"
+    }
+
+
+def test_every_run_writes_the_same_outputs(outputs):
+    """
+    Every output, including the area cube and the COCO file, is byte for byte the
+    output of the serial run
+    """
+    expected = get_output_files(outputs["serial"]["dir"])
+    assert any(path.name == COCO_FILENAME for path in expected)
+    assert any(path.name.startswith("area_cube_") for path in expected)
+    for name in RUNS:
+        files = get_output_files(outputs[name]["dir"])
+        assert files.keys() == expected.keys(), name
+        for path, data in files.items():
+            assert data == expected[path], f"{name}: {path}"
+
+
+def test_label_cache_is_read_once_built(outputs):
+    """
+    The second label cache run reads the cache instead of the label file
+    """
+    assert outputs["building label cache"]["backend"] != "label cache"
+    assert outputs["reading label cache"]["backend"] == "label cache"
+
+
+def test_category_statistics_are_consistent(outputs):
+    """
+    The anomalous boxes and the invalid geometry are counted once per box, and the
+    anomalies once per anomaly row
+    """
+    statistics = pd.read_csv(
+        outputs["serial"]["dir"] / "output" / "category_stats_train.csv",
+        index_col="class",
+    )
+    assert (statistics["anomalous_boxes"] <= statistics["total_count"]).all()
+    assert (statistics["anomalous_boxes"] <= statistics["anomalies"]).all()
+    assert statistics["invalid_geometry"].sum() > 0
+    anomalies = pd.read_parquet(
+        outputs["serial"]["dir"] / "output" / "anomalies_train.parquet"
+    )
+    assert len(anomalies) == statistics["anomalies"].sum()
@@ -0,0 +1,90 @@
+"""
+File containing the tests of the background processing job, run within the test
+process with an analyzer of the test dataset.
+"""
+
+import fcntl
+import json
+
+import pytest
+
+from analysis.dataset_analyzer import DatasetAnalyzer
+from analysis.processing_job import ProcessingJob
+from config import DATASET_SPLITS
+
+
+@pytest.fixture
+def job(tmp_path) -> ProcessingJob:
+    """
+    A job whose files are in a temporary directory
+    """
+    job = ProcessingJob(str(tmp_path / "jobs"))
+    job.directory.mkdir()
+    return job
+
+
+def test_state_of_a_new_job(job):
+    """
+    A job that was never submitted is idle and not running
+    """
+    assert job.read_state() == {"status": "idle", "splits": {}}
+    assert not job.is_running()
+
+
+def test_locked_job_is_running(job):
+    """
+    A held lock marks the job as running, and a second submission does not start a
+    worker
+    """
+    with open(job.lock_path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        assert job.is_running()
+        assert not job.submit()
+    assert not job.is_running()
+
+
+def test_dead_worker_is_reported_as_failed(job):
+    """
+    A job left running by a worker that no longer holds the lock has failed
+    """
+    job.write_state({"status": "running", "splits": {}})
+    state = job.read_state()
+    assert state["status"] == "failed"
+    assert str(job.log_path) in state["error"]
+
+
+def test_run_processes_outdated_splits(job, analyzer, output_dir, monkeypatch):
+    """
+    The job processes every split once, and skips them once they are up to date
+    """
+    monkeypatch.setattr("analysis.dataset_analyzer.DatasetAnalyzer", lambda: analyzer)
+    job.write_state({"status": "queued", "splits": {}})
+    job.run(num_workers=2)
+    state = json.loads(job.state_path.read_text())
+    assert state["status"] == "done"
+    assert list(state["splits"]) == list(DATASET_SPLITS)
+    for split_state in state["splits"].values():
+        assert split_state["status"] == "done"
+        assert split_state["progress"] == 1.0
+    assert (output_dir / "category_stats_val.csv").exists()
+
+    job.run(num_workers=2)
+    state = json.loads(job.state_path.read_text())
+    assert state["status"] == "done"
+    assert {s["status"] for s in state["splits"].values()} == {"skipped"}
+
+
+def test_failed_run_records_the_error(job, tmp_path, monkeypatch):
+    """
+    A split that cannot be processed fails the job with its traceback
+    """
+    analyzer = DatasetAnalyzer(
+        str(tmp_path / "missing"), str(tmp_path / "output"), str(tmp_path / "cache")
+    )
+    monkeypatch.setattr("analysis.dataset_analyzer.DatasetAnalyzer", lambda: analyzer)
+    job.write_state({"status": "queued", "splits": {}})
+    with pytest.raises(FileNotFoundError):
+        job.run()
+    state = json.loads(job.state_path.read_text())
+    assert state["status"] == "failed"
+    assert "FileNotFoundError" in state["error"]
@@ -0,0 +1,95 @@
+"""
+File containing the tests of the throttled progress reporters.
+"""
+
+import pytest
+
+from analysis import progress
+from analysis.progress import ProgressReporter, ProgressUpdate, format_duration
+
+
+class RecordingReporter(ProgressReporter):
+    """
+    A reporter keeping every update it emits
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        """
+        Initializes the list of emitted updates
+        """
+        self.updates = []
+        super().__init__(*args, **kwargs)
+
+    def emit(self, update: ProgressUpdate) -> None:
+        """
+        Keeps an update
+        """
+        self.updates.append(update)
+
+
+class Clock:
+    """
+    A clock standing in for time.monotonic, which only moves when told to
+    """
+
+    def __init__(self) -> None:
+        """
+        Starts the clock at 0
+        """
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        """
+        Returns the current time
+        """
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    """
+    The clock read by the reporters
+    """
+    clock = Clock()
+    monkeypatch.setattr(progress.time, "monotonic", clock)
+    return clock
+
+
+def test_updates_are_throttled_by_count(clock):
+    """
+    Without an interval, an update is emitted every given number of items
+    """
+    reporter = RecordingReporter(interval=None, every=10)
+    reporter.start("Training split", 95)
+    for _ in range(95):
+        reporter.advance()
+    assert [update.count for update in reporter.updates] == list(range(10, 91, 10))
+    reporter.finish()
+    assert reporter.updates[-1].fraction == 1.0
+
+
+def test_updates_are_throttled_by_time(clock):
+    """
+    An update is emitted once the interval has passed since the last one
+    """
+    reporter = RecordingReporter(interval=0.25)
+    reporter.start("Training split", 1000)
+    for _ in range(100):
+        clock.now += 0.01
+        reporter.advance(10)
+    assert len(reporter.updates) == 4
+    assert reporter.updates[0].count == 250
+    assert reporter.updates[0].rate == pytest.approx(1000)
+    assert reporter.updates[0].eta == pytest.approx(0.75)
+
+
+def test_update_message():
+    """
+    The status message holds the fraction done, the rate and the remaining time
+    """
+    update = ProgressUpdate("Training split", 420, 1000, 2.0)
+    assert str(update) == "Training split: 42.00% processed, 210 images/s, ETA 0:03"
+    update = ProgressUpdate("Training split", 420, None, 0.0)
+    assert str(update) == "Training split: 420 processed, 0 images/s"
+    assert format_duration(3725) == "1:02:05"
+    assert format_duration(65.4) == "1:05"
@@ -0,0 +1,32 @@
+"""
+File containing the tests of the scene statistics.
+"""
+
+import numpy as np
+import pandas as pd
+
+from analysis.scene_statistics import load_category_tensor
+from config import CATEGORIES
+
+
+def test_tensor_matches_scene_csv(analyzer, output_dir):
+    """
+    The category tensor holds the counts of the categories by scene parameters csv,
+    in the order of its rows
+    """
+    analyzer.compute_statistics("val")
+    tensor = load_category_tensor(output_dir / "scene_tensor_val.npz")
+    counts = pd.read_csv(output_dir / "categories_by_scene_params_val.csv")
+    assert tensor["counts"].shape == (
+        len(tensor["timeofday"]),
+        len(tensor["weather"]),
+        len(CATEGORIES),
+    )
+    np.testing.assert_array_equal(tensor["counts"].reshape(-1), counts["value"])
+    # The columns of the csv are named after the other scene parameter
+    np.testing.assert_array_equal(
+        np.repeat(tensor["timeofday"], len(tensor["weather"]) * len(CATEGORIES)),
+        counts["weather"],
+    )
+    assert list(tensor["categories"]) == list(CATEGORIES)
+    assert tensor["counts"].sum() > 0
@@ -0,0 +1,135 @@
+"""
+File containing the tests of the loading of the training images: the flat COCO
+annotations, the decoded image cache and the image shard store.
+"""
+
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from analysis import image_shards
+from analysis.coco_annotations import CocoAnnotations
+from analysis.image_loading import DecodedImageCache, get_image_bytes, load_image
+from analysis.image_shards import ImageShardStore
+from benchmarks.image_loading import write_synthetic_images
+
+
+@pytest.fixture
+def coco_file(tmp_path):
+    """
+    A COCO file of synthetic images, with non-contiguous image ids, images without
+    annotations and annotations out of image order
+    """
+    image_paths = write_synthetic_images(tmp_path, 7)
+    images = [
+        {"id": 10 * i + 3, "file_name": path.name, "width": 1280, "height": 720}
+        for i, path in enumerate(image_paths)
+    ]
+    rng = np.random.default_rng(0)
+    annotations = [
+        {
+            "id": i,
+            "image_id": images[image]["id"],
+            "category_id": int(rng.integers(10)),
+            "bbox": rng.uniform(1, 400, 4).round(3).tolist(),
+            "area": 0.0,
+            "iscrowd": 0,
+        }
+        for i, image in enumerate(rng.permutation([0, 0, 2, 3, 3, 3, 5, 6, 0]))
+    ]
+    path = tmp_path / "_annotations.coco.json"
+    path.write_text(
+        json.dumps({"images": images, "annotations": annotations, "categories": []})
+    )
+    return path
+
+
+def get_reference_targets(coco_file, size: int) -> list[tuple[list, list]]:
+    """
+    Scales the boxes of every image the way the training notebook did
+    """
+    coco = json.loads(coco_file.read_text())
+    targets = []
+    for image in coco["images"]:
+        sx, sy = size / image["width"], size / image["height"]
+        boxes, labels = [], []
+        for annotation in coco["annotations"]:
+            if annotation["image_id"] == image["id"]:
+                x, y, w, h = annotation["bbox"]
+                boxes.append([x * sx, y * sy, (x + w) * sx, (y + h) * sy])
+                labels.append(annotation["category_id"])
+        targets.append((boxes, labels))
+    return targets
+
+
+def test_coco_annotations(coco_file):
+    """
+    The annotations of every image keep their file order and are scaled as before
+    """
+    annotations = CocoAnnotations(coco_file)
+    assert len(annotations) == 7
+    assert annotations.offsets.tolist() == [0, 3, 3, 4, 7, 7, 8, 9]
+    for idx, (boxes, labels) in enumerate(get_reference_targets(coco_file, 320)):
+        scaled, scaled_labels = annotations.get_target(idx, 320 / 1280, 320 / 720)
+        assert scaled_labels.tolist() == labels
+        np.testing.assert_allclose(scaled, np.reshape(boxes, (-1, 4)), rtol=1e-6)
+    start, stop = annotations.offsets[3:5]
+    np.testing.assert_array_equal(
+        annotations.get_scaled_boxes(320, 320)[start:stop],
+        annotations.get_target(3, 320 / 1280, 320 / 720)[0],
+    )
+
+
+def test_decoded_image_cache(tmp_path):
+    """
+    The cache returns copies and evicts the least recently used images
+    """
+    paths = write_synthetic_images(tmp_path, 3)
+    size = (64, 32)
+    one_image = get_image_bytes(Image.new("RGB", size))
+    cache = DecodedImageCache(max_bytes=2 * one_image)
+    first, original_size = load_image(paths[0], size, cache)
+    assert first.size == size and original_size == (1280, 720)
+    load_image(paths[1], size, cache)
+    cached, _ = load_image(paths[0], size, cache)
+    assert cached.tobytes() == first.tobytes()
+    cached.putpixel((0, 0), (1, 2, 3))
+    assert load_image(paths[0], size, cache)[0].tobytes() == first.tobytes()
+    load_image(paths[2], size, cache)
+    assert cache.total_bytes == 2 * one_image
+    assert (cache.hits, cache.misses) == (2, 3)
+    # The second image was the least recently used one
+    load_image(paths[1], size, cache)
+    assert cache.misses == 4
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_image_shard_store(tmp_path, monkeypatch, coco_file, num_workers):
+    """
+    The store returns the images and the boxes of the COCO file, across shards
+    """
+    monkeypatch.setattr(image_shards, "IMAGES_PER_SHARD", 3)
+    store = ImageShardStore(coco_file, tmp_path, tmp_path / "shards", image_size=64)
+    assert not store.is_valid()
+    assert store.build(num_workers) == 7
+    assert store.is_valid()
+    assert len(list((tmp_path / "shards").glob("images_*.npy"))) == 3
+
+    store = ImageShardStore(coco_file, tmp_path, tmp_path / "shards", image_size=64)
+    annotations = CocoAnnotations(coco_file)
+    assert len(store) == 7
+    for idx in range(len(store)):
+        pixels, boxes, labels = store[idx]
+        image, _ = load_image(tmp_path / annotations.file_names[idx], (64, 64))
+        np.testing.assert_array_equal(pixels, np.asarray(image))
+        expected_boxes, expected_labels = annotations.get_target(idx, 0.05, 64 / 720)
+        np.testing.assert_array_equal(boxes, expected_boxes)
+        np.testing.assert_array_equal(labels, expected_labels)
+    with pytest.raises(IndexError):
+        store[7]
+
+    assert not ImageShardStore(coco_file, tmp_path, tmp_path / "shards", 32).is_valid()
+    coco_file.write_text(coco_file.read_text().replace('"iscrowd"', '"crowd"'))
+    assert not store.is_valid()